@@ -67,6 +67,7 @@ DJANGO_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "django.contrib.humanize",
+    "django.contrib.postgres",
     "django.contrib.admin",
     "django.forms",
 ]
@@ -363,6 +364,20 @@ CELERY_BEAT_SCHEDULE = {
         "task": "squarelet.core.tasks.sync_odoo_daily",
         "schedule": crontab(hour=3, minute=0),
     },
+    # commits schedule their own drain - this catches any that were lost
+    "drain_cache_invalidation_outbox": {
+        "task": "squarelet.oidc.tasks.drain_cache_invalidation_outbox",
+        "schedule": crontab(minute="*"),
+    },
+    "prune_cache_invalidation_outbox": {
+        "task": "squarelet.oidc.tasks.prune_cache_invalidation_outbox",
+        "schedule": crontab(hour=4, minute=0),
+    },
+    # logins schedule their own flush - this catches any that were lost
+    "flush_login_logs": {
+        "task": "squarelet.oidc.tasks.flush_login_logs",
+        "schedule": crontab(minute="*"),
+    },
 }
 
 # django-allauth
@@ -419,6 +434,16 @@ SESSION_COOKIE_SECURE = True
 ENABLE_SEND_CACHE_INVALIDATIONS = env.bool(
     "ENABLE_SEND_CACHE_INVALIDATIONS", default=True
 )
+# Seconds to buffer invalidations for, so repeated saves of one object within the
+# window go out as one broadcast. 0 sends immediately. The buffer lives in the
+# cache, so this needs a cache shared by the web and worker processes
+CACHE_INVALIDATION_COALESCE_WINDOW = env.int(
+    "CACHE_INVALIDATION_COALESCE_WINDOW", default=0
+)
+# Days to keep dispatched invalidations in the outbox, for replay
+CACHE_INVALIDATION_OUTBOX_RETENTION_DAYS = env.int(
+    "CACHE_INVALIDATION_OUTBOX_RETENTION_DAYS", default=7
+)
 
 
 # rest framework
@@ -48,6 +48,10 @@ CACHES = {
 }
 if env("REDIS_URL").startswith("rediss:"):
     CACHES["default"]["OPTIONS"]["CONNECTION_POOL_KWARGS"] = {"ssl_cert_reqs": None}
+# the Redis cache is shared by web and workers, so invalidations can be coalesced
+CACHE_INVALIDATION_COALESCE_WINDOW = env.int(
+    "CACHE_INVALIDATION_COALESCE_WINDOW", default=3
+)
 
 # SECURITY
 # ------------------------------------------------------------------------------
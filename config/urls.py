@@ -29,6 +29,7 @@ from squarelet.users.views import (
     UserOnboardingView,
 )
 from squarelet.users.viewsets import (
+    ChangeViewSet,
     OIDCTokenExchangeView,
     RefreshTokenViewSet,
     UrlAuthTokenViewSet,
@@ -40,6 +41,7 @@ admin.site.login = secure_admin_login(admin.site.login)
 
 router = routers.DefaultRouter()
 router.register("users", UserViewSet)
+router.register("changes", ChangeViewSet, basename="change")
 router.register("url_auth_tokens", UrlAuthTokenViewSet, basename="url_auth_token")
 router.register("refresh_tokens", RefreshTokenViewSet, basename="refresh_token")
 router.register("organizations", OrganizationViewSet)
@@ -8,6 +8,7 @@ export class AutocompleteView {
   results = d("_id-results");
   page = 1;
   morePages = true;
+  cursor: string | null = null;
 
   currentSearch = "";
   currentPage = 1;
@@ -125,13 +126,18 @@ export class AutocompleteView {
     }
     const page = this.page;
     this.currentSearch = term;
-    this.async = fetchUrl(`autocomplete?q=${term}&page=${page}`).then(
+    let url = `autocomplete?q=${encodeURIComponent(term)}`;
+    if (append && this.cursor) {
+      url += `&cursor=${encodeURIComponent(this.cursor)}`;
+    }
+    this.async = fetchUrl(url).then(
       (response) => {
         const json = JSON.parse(response);
         if (this.currentSearch == term && this.page == page) {
           const results = json.data;
           this.currentPage = page;
-          if (results.length == 0) {
+          this.cursor = json.next;
+          if (json.next == null) {
             this.morePages = false;
           }
           this.render(results, append, term);
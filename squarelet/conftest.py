@@ -1,3 +1,6 @@
+# Django
+from django.core.cache import cache
+
 # Third Party
 import pytest
 from pytest_factoryboy import register
@@ -40,6 +43,15 @@ register(CustomerFactory)
 register(UserFactory)
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Coalescing buffers and circuit breakers live in the cache, which would
+    otherwise carry state from one test into the next"""
+    cache.clear()
+    yield
+    cache.clear()
+
+
 @pytest.fixture
 def api_client():
     return APIClient()
@@ -1,6 +1,22 @@
 # Django
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+# Standard Library
+import hashlib
+import math
+import time
+
+# Third Party
+from rest_framework import serializers
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+# Squarelet
+from squarelet.oidc.versions import get_version
 
 
 class AvatarMixin:
@@ -24,3 +40,106 @@ class AdminLinkMixin:
                 args=(self.object.pk,),
             )
         return context
+
+
+class ConditionalRetrieveMixin:
+    """Support conditional GETs on a viewset's retrieve
+
+    The ETag and Last-Modified come from the object's `updated_at` and the
+    version every cache invalidation naming it bumps, so a request which would
+    be answered with a 304 costs one query and no serializing. Payloads differ
+    by OIDC client, so the ETag does too.
+
+    Last-Modified only has whole seconds, so If-Modified-Since is checked
+    against the exact time of the last change, and the date sent is rounded up
+    to the next second once that second is over, or down while it is not. A
+    client which echoes a date from the second of a change then refetches, and
+    one which holds a later date can not have missed a change in that second.
+    The ETag has no such gap, and is preferred when a client sends both.
+
+    Set `version_model` to the model name invalidations use for the object.
+    """
+
+    version_model = None
+
+    def get_validators(self):
+        """Return the (ETag, time of the last change) for the requested object,
+        or None if it does not exist"""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            found = list(
+                self.get_queryset()
+                .prefetch_related(None)
+                .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+                .values_list("updated_at", self.lookup_field)[:1]
+            )
+        except ValidationError:
+            return None
+        if not found:
+            return None
+        updated_at, uuid = found[0]
+
+        version = get_version(self.version_model, uuid)
+        client = getattr(self.request.auth, "client", None)
+        tag = f"{client.pk if client else ''}:{updated_at.isoformat()}:{version}"
+        etag = f'"{hashlib.sha256(tag.encode("utf8")).hexdigest()[:32]}"'
+        return etag, max(updated_at.timestamp(), version)
+
+    def retrieve(self, request, *args, **kwargs):
+        validators = self.get_validators()
+        if validators is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        last_modified = math.ceil(modified)
+        if last_modified > time.time():
+            last_modified = math.floor(modified)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_vary_headers(response, ("Authorization",))
+        return response
+
+
+# matches the default invalidation chunk size, so a client can refetch
+# everything one webhook names in a single request
+BULK_RETRIEVE_MAX = 500
+
+
+class BulkRetrieveSerializer(serializers.Serializer):
+    # pylint: disable=abstract-method
+    uuids = serializers.ListField(
+        child=serializers.UUIDField(), allow_empty=False, max_length=BULK_RETRIEVE_MAX
+    )
+
+
+class BulkRetrieveMixin:
+    """Add a `bulk` action to a viewset, retrieving many objects by UUID
+
+    POST `{"uuids": [...]}` to get `{"results": [...], "missing": [...]}` -
+    the serialized objects in the order requested, and the UUIDs which do not
+    exist or may not be viewed. It only reads, so it requires the read scopes.
+    The viewset's queryset should prefetch what its serializer reads.
+    """
+
+    read_actions = ("bulk",)
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        serializer = BulkRetrieveSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        uuids = list(dict.fromkeys(serializer.validated_data["uuids"]))
+
+        objects = {
+            getattr(obj, self.lookup_field): obj
+            for obj in self.get_queryset().filter(**{f"{self.lookup_field}__in": uuids})
+        }
+        results = [objects[uuid] for uuid in uuids if uuid in objects]
+        return Response(
+            {
+                "results": self.get_serializer(results, many=True).data,
+                "missing": [str(uuid) for uuid in uuids if uuid not in objects],
+            }
+        )
@@ -0,0 +1,32 @@
+# Third Party
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class KeysetPagination(CursorPagination):
+    """Page by page number, or by an opaque cursor for clients which ask
+
+    Lists are paginated by page number, as they always have been, unless the
+    request has a `cursor` parameter - pass it empty to start from the first
+    page.  Each cursor page is read from an index on the view's
+    `keyset_ordering`, starting after the position the cursor encodes, so
+    walking the whole table costs the same per page however deep it is, where
+    a page number costs more the further in it is.
+    """
+
+    ordering = ("created_at", "pk")
+    page_number_paginator = None
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, "keyset_ordering", self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_number_paginator = None
+        if self.cursor_query_param not in request.query_params:
+            self.page_number_paginator = PageNumberPagination()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
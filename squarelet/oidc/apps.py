@@ -5,3 +5,8 @@ from django.apps import AppConfig
 class OidcConfig(AppConfig):
     name = "squarelet.oidc"
     verbose_name = "OpenID Connect"
+
+    def ready(self):
+        # pylint: disable=import-outside-toplevel, unused-import
+        # Local
+        from . import signals
@@ -1,8 +1,10 @@
 # Third Party
 from oidc_provider.lib.utils.oauth2 import extract_access_token
-from oidc_provider.models import Token
 from rest_framework import authentication, exceptions
 
+# Squarelet
+from squarelet.oidc.tokens import resolve_access_token
+
 
 class OidcOauth2Authentication(authentication.BaseAuthentication):
     """Authentcation backend for django rest framework for checking against OIDC
@@ -15,9 +17,8 @@ class OidcOauth2Authentication(authentication.BaseAuthentication):
             # not this kind of auth
             return None
 
-        try:
-            oauth2_token = Token.objects.get(access_token=access_token)
-        except Token.DoesNotExist:
+        oauth2_token = resolve_access_token(access_token)
+        if oauth2_token is None:
             raise exceptions.AuthenticationFailed("The oauth2 token is invalid")
 
         if oauth2_token.has_expired():
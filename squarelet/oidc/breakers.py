@@ -0,0 +1,90 @@
+"""Circuit breakers for webhook delivery, shared through the cache"""
+
+# Django
+from django.core.cache import cache
+
+# consecutive-ish failures, within the window, which open the circuit
+FAILURE_THRESHOLD = 5
+FAILURE_WINDOW = 60
+# how long an open circuit rejects deliveries before letting a probe through
+OPEN_SECONDS = 120
+# a probe which never reports back frees the half-open slot after this long
+PROBE_TIMEOUT = 60
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """A closed / open / half-open circuit breaker
+
+    Closed lets every delivery through and counts failures. Enough failures
+    within `FAILURE_WINDOW` trips it open, which rejects every delivery for
+    `OPEN_SECONDS`. After that it is half-open: one delivery at a time is let
+    through as a probe. A successful probe closes the circuit, a failed one
+    opens it again.
+
+    If the cache is unavailable the breaker stays closed, so deliveries carry
+    on as if there were no breaker.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def key(self, suffix):
+        """The cache key for one part of this breaker's state"""
+        return f"squarelet:breaker:{self.name}:{suffix}"
+
+    @property
+    def state(self):
+        if not cache.get(self.key("tripped")):
+            return CLOSED
+        if cache.get(self.key("open")):
+            return OPEN
+        return HALF_OPEN
+
+    def allow(self):
+        """Whether a delivery may be attempted now"""
+        state = self.state
+        if state == CLOSED:
+            return True
+        if state == OPEN:
+            return False
+        return bool(cache.add(self.key("probe"), True, timeout=PROBE_TIMEOUT))
+
+    def record_success(self):
+        """Record a delivery which succeeded
+
+        Returns True if this closed a tripped circuit.
+        """
+        cache.delete(self.key("failures"))
+        if not cache.get(self.key("tripped")):
+            return False
+        cache.delete_many([self.key("tripped"), self.key("open"), self.key("probe")])
+        return True
+
+    def record_failure(self):
+        """Record a delivery which failed
+
+        Returns True if this tripped the circuit open.
+        """
+        if cache.get(self.key("tripped")):
+            # a failed probe - back to open for another full period
+            self._open()
+            return True
+        cache.add(self.key("failures"), 0, timeout=FAILURE_WINDOW)
+        try:
+            failures = cache.incr(self.key("failures"))
+        except ValueError:
+            # the counter expired between the add and the incr
+            return False
+        if failures is None or failures < FAILURE_THRESHOLD:
+            return False
+        self._open()
+        return True
+
+    def _open(self):
+        cache.set(self.key("tripped"), True, timeout=None)
+        cache.set(self.key("open"), True, timeout=OPEN_SECONDS)
+        cache.delete_many([self.key("failures"), self.key("probe")])
@@ -0,0 +1,89 @@
+"""Buffers shared between web and worker processes through the cache"""
+
+# Django
+from django.core.cache import cache
+
+# items outlive the window they were buffered for, so a late or failed flush
+# still finds them on the next attempt
+QUEUE_TIMEOUT = 60 * 60
+# long enough for any flush to finish, short enough that a killed worker does
+# not wedge the queue
+POP_LOCK_TIMEOUT = 60
+
+
+class CacheQueue:
+    """An append-only queue of items, shared through the cache
+
+    Each `push` claims the next slot number with an atomic increment and stores
+    its batch under that slot. `pop` collects every batch between the last slot
+    it consumed and the current head, so producers never contend with each
+    other or with the consumer over a single key.
+    """
+
+    def __init__(self, name, timeout=QUEUE_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+
+    def key(self, suffix):
+        """The cache key for one part of this queue"""
+        return f"squarelet:queue:{self.name}:{suffix}"
+
+    def push(self, items):
+        """Append a batch of items
+
+        Returns the batch's slot number, or None if the cache is unavailable -
+        the caller must then handle the items itself.
+        """
+        head = self.key("head")
+        cache.add(head, 0, timeout=None)
+        try:
+            slot = cache.incr(head)
+        except ValueError:
+            # the head was evicted between the add and the incr
+            return None
+        if slot is None:
+            return None
+        cache.set(self.key(slot), list(items), timeout=self.timeout)
+        return slot
+
+    def pop(self):
+        """Remove and return every item pushed so far
+
+        Returns `(items, complete)`. `complete` is False when there is more to
+        collect later: another consumer held the queue, or a producer had
+        claimed a slot without having written it yet.
+        """
+        lock = self.key("lock")
+        if not cache.add(lock, True, timeout=POP_LOCK_TIMEOUT):
+            return [], False
+        try:
+            return self._pop()
+        finally:
+            cache.delete(lock)
+
+    def _pop(self):
+        head = cache.get(self.key("head"), 0)
+        tail = cache.get(self.key("tail"), 0)
+        if head <= tail:
+            return [], True
+
+        slots = range(tail + 1, head + 1)
+        batches = cache.get_many([self.key(slot) for slot in slots])
+        # a slot which was already missing on the previous pop was claimed by a
+        # producer that never wrote it - skip it rather than block the queue
+        known_gap = cache.get(self.key("gap"))
+
+        items = []
+        consumed = tail
+        for slot in slots:
+            key = self.key(slot)
+            if key in batches:
+                items.extend(batches[key])
+            elif slot != known_gap:
+                cache.set(self.key("gap"), slot, timeout=self.timeout)
+                break
+            consumed = slot
+
+        cache.set(self.key("tail"), consumed, timeout=None)
+        cache.delete_many([self.key(slot) for slot in range(tail + 1, consumed + 1)])
+        return items, consumed == head
@@ -0,0 +1,55 @@
+# Django
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import get_current_timezone, is_naive, make_aware
+
+# Squarelet
+from squarelet.oidc.models import CacheInvalidation
+from squarelet.oidc.utils import schedule_outbox_drain
+
+
+class Command(BaseCommand):
+    """Resend cache invalidations still held in the outbox
+
+    Marks every dispatched invalidation created since the given time as
+    pending, so the next drain sends them again. Only entries inside the
+    retention window (CACHE_INVALIDATION_OUTBOX_RETENTION_DAYS) can be replayed.
+    """
+
+    help = "Resend cache invalidations recorded since a given time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "since", help="Replay invalidations created at or after this ISO time"
+        )
+        parser.add_argument(
+            "--model",
+            choices=["user", "organization"],
+            help="Only replay invalidations for this model",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report how many invalidations would be replayed",
+        )
+
+    def handle(self, *args, **options):
+        since = parse_datetime(options["since"])
+        if since is None:
+            raise CommandError(f"Invalid time: {options['since']}")
+        if is_naive(since):
+            since = make_aware(since, get_current_timezone())
+
+        entries = CacheInvalidation.objects.filter(
+            created_at__gte=since, dispatched_at__isnull=False
+        )
+        if options["model"]:
+            entries = entries.filter(model=options["model"])
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would replay {entries.count()} invalidations")
+            return
+
+        count = entries.update(dispatched_at=None, claimed_at=None)
+        schedule_outbox_drain()
+        self.stdout.write(f"Replaying {count} invalidations")
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.12 on 2026-10-17 07:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oidc", "0005_clientprofile_checks_verification_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="clientprofile",
+            name="invalidation_chunk_size",
+            field=models.PositiveIntegerField(
+                default=500,
+                help_text="Most UUIDs to send in one cache invalidation webhook. Larger invalidations are split and delivered and retried chunk by chunk.",
+                validators=[django.core.validators.MinValueValidator(1)],
+                verbose_name="invalidation chunk size",
+            ),
+        ),
+    ]
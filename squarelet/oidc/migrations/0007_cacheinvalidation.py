@@ -0,0 +1,72 @@
+# Generated by Django 5.2.12 on 2026-10-17 07:41
+
+import django.utils.timezone
+import squarelet.core.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oidc", "0006_clientprofile_invalidation_chunk_size"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheInvalidation",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "model",
+                    models.CharField(
+                        choices=[("user", "User"), ("organization", "Organization")],
+                        help_text="The type of object which changed",
+                        max_length=20,
+                        verbose_name="model",
+                    ),
+                ),
+                (
+                    "uuid",
+                    models.UUIDField(
+                        help_text="The object which changed", verbose_name="UUID"
+                    ),
+                ),
+                (
+                    "created_at",
+                    squarelet.core.fields.AutoCreatedField(
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="created at",
+                    ),
+                ),
+                (
+                    "dispatched_at",
+                    models.DateTimeField(
+                        blank=True,
+                        help_text="When this invalidation was handed off to be sent to clients",
+                        null=True,
+                        verbose_name="dispatched at",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ("pk",),
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("dispatched_at__isnull", True)),
+                        fields=["id"],
+                        name="oidc_cacheinval_pending_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.12 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oidc", "0007_cacheinvalidation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cacheinvalidation",
+            name="claimed_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When a drain took this invalidation to send - another drain may take it over once the claim expires",
+                null=True,
+                verbose_name="claimed at",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.12 on 2026-10-17 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oidc", "0008_cacheinvalidation_claimed_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cacheinvalidation",
+            name="sequence",
+            field=models.BigIntegerField(
+                blank=True,
+                editable=False,
+                help_text="This invalidation's position in the change feed - assigned in commit order, see squarelet.oidc.utils.assign_feed_sequence",
+                null=True,
+                unique=True,
+                verbose_name="sequence",
+            ),
+        ),
+        migrations.RunSQL(
+            "CREATE SEQUENCE oidc_cacheinvalidation_feed_seq",
+            "DROP SEQUENCE oidc_cacheinvalidation_feed_seq",
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.12 on 2026-10-17 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("oidc", "0009_cacheinvalidation_sequence"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cacheinvalidation",
+            index=models.Index(
+                condition=models.Q(("sequence__isnull", True)),
+                fields=["id"],
+                name="oidc_cacheinval_unsequenced_idx",
+            ),
+        ),
+    ]
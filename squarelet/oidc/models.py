@@ -1,6 +1,7 @@
 """Models for the OIDC app"""
 
 # Django
+from django.core.validators import MinValueValidator
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -13,6 +14,12 @@ import time
 # Third Party
 import requests
 
+# Squarelet
+from squarelet.core.fields import AutoCreatedField
+
+# Local
+from .sessions import webhook_sessions
+
 logger = logging.getLogger(__name__)
 
 # (connect, read) - a stuck TLS handshake should not pin a worker for the full
@@ -83,6 +90,15 @@ class ClientProfile(models.Model):
             "Only used when 'checks verification' is enabled."
         ),
     )
+    invalidation_chunk_size = models.PositiveIntegerField(
+        _("invalidation chunk size"),
+        default=500,
+        validators=[MinValueValidator(1)],
+        help_text=_(
+            "Most UUIDs to send in one cache invalidation webhook. Larger "
+            "invalidations are split and delivered and retried chunk by chunk."
+        ),
+    )
 
     def __str__(self):
         return str(self.client)
@@ -110,9 +126,10 @@ class ClientProfile(models.Model):
             "signature": signature,
         }
 
+        session = webhook_sessions.get(self.pk)
         start = time.monotonic()
         try:
-            response = requests.post(
+            response = session.post(
                 self.webhook_url, data=data, timeout=WEBHOOK_TIMEOUT
             )
         except requests.RequestException as exc:
@@ -149,7 +166,7 @@ class ClientProfile(models.Model):
 
         logger.info(
             "[CACHE-INVALIDATION] Sent id=%s client=%s url=%s model=%s count=%d "
-            "status=%d elapsed_ms=%d uuids=%s",
+            "status=%d elapsed_ms=%d requests=%d reused=%d uuids=%s",
             invalidation_id,
             self.client.name,
             self.webhook_url,
@@ -157,6 +174,76 @@ class ClientProfile(models.Model):
             len(uuids),
             response.status_code,
             elapsed_ms,
+            session.requests,
+            session.reused,
             format_uuids(uuids),
         )
         return response
+
+
+class CacheInvalidation(models.Model):
+    """An outbox entry for a cache invalidation
+
+    Written in the same transaction as the change it invalidates, so a commit
+    always has its invalidation on record. Entries are kept for a while after
+    they are dispatched, so a window of invalidations can be replayed, and so
+    clients can read them as a change feed.
+    """
+
+    model = models.CharField(
+        _("model"),
+        max_length=20,
+        choices=(
+            ("user", _("User")),
+            ("organization", _("Organization")),
+        ),
+        help_text=_("The type of object which changed"),
+    )
+    uuid = models.UUIDField(_("UUID"), help_text=_("The object which changed"))
+    created_at = AutoCreatedField(_("created at"), db_index=True)
+    dispatched_at = models.DateTimeField(
+        _("dispatched at"),
+        null=True,
+        blank=True,
+        help_text=_("When this invalidation was handed off to be sent to clients"),
+    )
+    claimed_at = models.DateTimeField(
+        _("claimed at"),
+        null=True,
+        blank=True,
+        help_text=_(
+            "When a drain took this invalidation to send - another drain may "
+            "take it over once the claim expires"
+        ),
+    )
+    sequence = models.BigIntegerField(
+        _("sequence"),
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        help_text=_(
+            "This invalidation's position in the change feed - assigned in "
+            "commit order, see squarelet.oidc.utils.assign_feed_sequence"
+        ),
+    )
+
+    class Meta:
+        ordering = ("pk",)
+        indexes = [
+            # the dispatcher only ever scans the undispatched entries
+            models.Index(
+                fields=["id"],
+                name="oidc_cacheinval_pending_idx",
+                condition=models.Q(dispatched_at__isnull=True),
+            ),
+            # and a drain places the entries which have no feed position yet
+            models.Index(
+                fields=["id"],
+                name="oidc_cacheinval_unsequenced_idx",
+                condition=models.Q(sequence__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.model} {self.uuid}"
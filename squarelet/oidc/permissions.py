@@ -14,7 +14,12 @@ class ScopePermission(permissions.BasePermission):
 
         auth_scopes = set(request.auth.scope)
 
-        if request.method in permissions.SAFE_METHODS:
+        # some actions only read, whatever their method
+        read_actions = getattr(view, "read_actions", ())
+        if (
+            request.method in permissions.SAFE_METHODS
+            or getattr(view, "action", None) in read_actions
+        ):
             return read_scopes and read_scopes <= auth_scopes
         else:
             return write_scopes and write_scopes <= auth_scopes
@@ -0,0 +1,107 @@
+"""An in-process registry of OIDC clients
+
+There are only a handful of clients and they rarely change, so each process
+loads all of them, with their profiles and response types, in one go and
+serves lookups from memory. Saving or deleting a client or its profile bumps a
+version shared through the cache, and every process reloads when it next sees
+the version change.
+"""
+
+# Django
+from django.core.cache import cache
+
+# Standard Library
+import threading
+from typing import NamedTuple
+from uuid import uuid4
+
+# Third Party
+from oidc_provider.models import Client
+
+# Squarelet
+from squarelet.oidc.models import ClientProfile
+
+VERSION_KEY = "squarelet:client-registry:version"
+
+
+class RegisteredClient(NamedTuple):
+    """A client with its profile"""
+
+    client: Client
+    profile: ClientProfile
+
+    @classmethod
+    def from_client(cls, client):
+        try:
+            profile = client.clientprofile
+        except ClientProfile.DoesNotExist:
+            profile = None
+        return cls(client=client, profile=profile)
+
+
+class ClientRegistry:
+    """Every client, keyed by client id, as of the last version seen"""
+
+    def __init__(self):
+        self._clients = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, client_id):
+        """The RegisteredClient for `client_id`, or None if there is none"""
+        return self.clients().get(client_id)
+
+    def clients(self):
+        """Every RegisteredClient, keyed by client id"""
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # first use, or the cache lost it - start a version every process
+            # will agree on
+            cache.add(VERSION_KEY, uuid4().hex, timeout=None)
+            version = cache.get(VERSION_KEY)
+        with self._lock:
+            # without a shared version there is no telling whether this process
+            # is current, so it reloads every time, as if there were no registry
+            if version is None or version != self._version:
+                self._clients = self._load()
+                self._version = version
+            return self._clients
+
+    @staticmethod
+    def _load():
+        clients = Client.objects.select_related("clientprofile").prefetch_related(
+            "response_types"
+        )
+        return {
+            client.client_id: RegisteredClient.from_client(client) for client in clients
+        }
+
+    def clear(self):
+        with self._lock:
+            self._clients = {}
+            self._version = None
+
+
+def bump_client_registry():
+    """Make every process reload its clients on their next lookup"""
+    cache.set(VERSION_KEY, uuid4().hex, timeout=None)
+
+
+client_registry = ClientRegistry()
+
+
+class RegistryClientManager:
+    """Enough of a manager for django-oidc-provider's client lookups"""
+
+    def get(self, client_id):
+        registered = client_registry.get(client_id)
+        if registered is None:
+            raise Client.DoesNotExist
+        return registered.client
+
+
+class RegistryClients:
+    """A stand-in for the Client model, for endpoint classes whose
+    `client_class` only ever calls `objects.get(client_id=...)`"""
+
+    objects = RegistryClientManager()
@@ -0,0 +1,130 @@
+"""Pooled HTTP sessions for delivering webhooks to OIDC clients
+
+Each worker process keeps one keep-alive session per client, so a burst of
+broadcasts pays the TCP and TLS handshake once per connection instead of once
+per delivery.
+"""
+
+# Standard Library
+import threading
+import time
+
+# Third Party
+import requests
+from requests.adapters import HTTPAdapter
+
+# a broadcast is one request per client, so a handful of connections per client
+# covers concurrent deliveries from one worker without hoarding idle sockets
+WEBHOOK_POOL_MAXSIZE = 4
+# close a client's session after this long without a delivery - clients drop idle
+# keep-alive connections on their own schedule, and a dead socket is only found
+# out by the next request that tries to use it
+WEBHOOK_SESSION_IDLE = 300
+
+
+class WebhookSession:
+    """A keep-alive session to one client, counting how often it reuses a
+    connection instead of opening a new one"""
+
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=WEBHOOK_POOL_MAXSIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.connections = 0
+        self._sent = self._opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def reused(self):
+        """Requests which were sent over an already open connection"""
+        return self.requests - self.connections
+
+    def _pool_counts(self):
+        """Total requests sent and connections opened by urllib3's pools"""
+        sent = opened = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    sent += pool.num_requests
+                    opened += pool.num_connections
+        return sent, opened
+
+    def post(self, url, **kwargs):
+        """POST through the pooled session, updating the reuse counters"""
+        self.last_used = time.monotonic()
+        try:
+            return self.session.post(url, **kwargs)
+        finally:
+            self.last_used = time.monotonic()
+            self._update_counts()
+
+    def _update_counts(self):
+        # count against the totals seen last time rather than a snapshot taken
+        # before the request, so concurrent posts are not counted twice
+        with self._lock:
+            sent, opened = self._pool_counts()
+            # a pool evicted mid-request resets its counters
+            self.requests += sent - self._sent if sent >= self._sent else sent
+            self.connections += (
+                opened - self._opened if opened >= self._opened else opened
+            )
+            self._sent, self._opened = sent, opened
+
+    def close(self):
+        self.session.close()
+
+
+class WebhookSessionRegistry:
+    """The sessions held by this worker process, keyed by client profile
+
+    Sessions are created on first use and closed once they have been idle for
+    `idle_timeout` seconds.
+    """
+
+    def __init__(self, idle_timeout=WEBHOOK_SESSION_IDLE):
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the session for `key`, opening one if needed"""
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = WebhookSession()
+            return session
+
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for key, session in list(self._sessions.items()):
+            if session.last_used < cutoff:
+                session.close()
+                del self._sessions[key]
+
+    def stats(self):
+        """Connection reuse counters for every open session"""
+        with self._lock:
+            return {
+                key: {
+                    "requests": session.requests,
+                    "connections": session.connections,
+                    "reused": session.reused,
+                }
+                for key, session in self._sessions.items()
+            }
+
+    def clear(self):
+        """Close every session"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+webhook_sessions = WebhookSessionRegistry()
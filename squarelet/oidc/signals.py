@@ -0,0 +1,48 @@
+# Django
+from django.db import transaction
+from django.db.models import signals
+from django.dispatch import receiver
+
+# Third Party
+from oidc_provider.models import Client, Token
+
+# Squarelet
+from squarelet.oidc.models import ClientProfile
+from squarelet.oidc.registry import bump_client_registry
+from squarelet.oidc.tokens import evict_access_token
+
+
+@receiver(
+    [signals.post_save, signals.post_delete],
+    sender=Token,
+    dispatch_uid="squarelet.oidc.signals.evict_token",
+)
+def evict_token(sender, instance, **kwargs):
+    """Drop a saved, revoked or deleted token from the token cache"""
+    # pylint: disable=unused-argument
+    evict_access_token(instance.access_token)
+    # again once committed, in case a request cached the old row meanwhile
+    transaction.on_commit(lambda: evict_access_token(instance.access_token))
+
+
+@receiver(
+    [signals.post_save, signals.post_delete],
+    sender=Client,
+    dispatch_uid="squarelet.oidc.signals.reload_clients",
+)
+@receiver(
+    [signals.post_save, signals.post_delete],
+    sender=ClientProfile,
+    dispatch_uid="squarelet.oidc.signals.reload_client_profiles",
+)
+@receiver(
+    signals.m2m_changed,
+    sender=Client.response_types.through,
+    dispatch_uid="squarelet.oidc.signals.reload_client_response_types",
+)
+def reload_clients(sender, **kwargs):
+    """Have every process reload its client registry"""
+    # pylint: disable=unused-argument
+    bump_client_registry()
+    # again once committed, in case a process reloaded the old rows meanwhile
+    transaction.on_commit(bump_client_registry)
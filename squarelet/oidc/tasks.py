@@ -1,17 +1,23 @@
 # Django
 from celery import shared_task
+from django.core.cache import cache
 from django.utils import timezone
 
 # Standard Library
 import logging
-import sys
+import uuid as uuid_lib
+from concurrent.futures import ThreadPoolExecutor
 from random import randint
 
 # Third Party
 import requests
 
 # Local
+from .breakers import CLOSED, OPEN, OPEN_SECONDS, CircuitBreaker
+from .buffers import CacheQueue
 from .models import ClientProfile, format_uuids
+from .sessions import WEBHOOK_POOL_MAXSIZE
+from .versions import bump_dependent_versions as bump_dependents
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +26,13 @@ logger = logging.getLogger(__name__)
 MAX_RETRIES = 3
 RETRY_BACKOFF = 60
 RETRY_JITTER = 30
+# chunks of one client's invalidation in flight at once - no more than its
+# session keeps connections open for
+DELIVERY_CONCURRENCY = WEBHOOK_POOL_MAXSIZE
+# deliveries in flight at once for a broadcast to every client
+BROADCAST_CONCURRENCY = 16
+# the models a client's backlog is kept for while its circuit is open
+BACKLOG_MODELS = ("user", "organization")
 
 
 def retry_countdown(retries):
@@ -27,6 +40,336 @@ def retry_countdown(retries):
     return 2**retries * RETRY_BACKOFF + randint(0, RETRY_JITTER)
 
 
+def chunk_uuids(uuids, size):
+    """Split a uuid list into lists of at most `size`"""
+    return [uuids[i : i + size] for i in range(0, len(uuids), size)]
+
+
+def log_retries_exceeded(
+    client_profile, model, uuids, invalidation_id, *, attempts, exc
+):
+    """The one error per lost delivery, so one Sentry event - the task itself
+    succeeds, as a dropped invalidation only leaves the client's cache stale
+    until its next write"""
+    logger.error(
+        "[CACHE-INVALIDATION] Retries exceeded, giving up! id=%s "
+        "client=%s url=%s model=%s count=%d attempts=%d uuids=%s: %s",
+        invalidation_id,
+        client_profile.client.name,
+        client_profile.webhook_url,
+        model,
+        len(uuids),
+        attempts,
+        format_uuids(uuids),
+        exc,
+        exc_info=(type(exc), exc, exc.__traceback__),
+    )
+
+
+def get_breaker(client_profile):
+    """The circuit breaker for deliveries to this client"""
+    return CircuitBreaker(f"webhook:{client_profile.pk}")
+
+
+def get_backlog(client_profile, model):
+    """The uuids held back from this client while its circuit is open"""
+    return CacheQueue(f"cache-invalidation-backlog:{client_profile.pk}:{model}")
+
+
+def hold_back(client_profile, model, uuids, invalidation_id):
+    """Add uuids to the client's backlog instead of delivering them
+
+    Returns False if the backlog is unavailable, in which case the caller must
+    deliver them itself.
+    """
+    if get_backlog(client_profile, model).push(uuids) is None:
+        return False
+    logger.info(
+        "[CACHE-INVALIDATION] Held back id=%s client=%s model=%s count=%d "
+        "reason=circuit-open",
+        invalidation_id,
+        client_profile.client.name,
+        model,
+        len(uuids),
+    )
+    return True
+
+
+def backlog_flush_key(client_profile_pk):
+    """The cache marker set while a flush of the client's backlog is scheduled"""
+    return f"squarelet:cache-invalidation-backlog:{client_profile_pk}:flush-scheduled"
+
+
+def schedule_backlog_flush(client_profile_pk):
+    """Flush the client's backlog once its open period is over, unless a flush
+    is already scheduled"""
+    key = backlog_flush_key(client_profile_pk)
+    if not cache.add(key, True, timeout=OPEN_SECONDS * 2):
+        return
+    try:
+        flush_cache_invalidation_backlog.apply_async(
+            (client_profile_pk,), countdown=OPEN_SECONDS
+        )
+    except Exception:
+        cache.delete(key)
+        raise
+
+
+def record_delivery_success(client_profile):
+    """Close the client's circuit if it was tripped, and flush its backlog"""
+    if get_breaker(client_profile).record_success():
+        logger.info(
+            "[CACHE-INVALIDATION] Circuit closed client=%s url=%s",
+            client_profile.client.name,
+            client_profile.webhook_url,
+        )
+        flush_cache_invalidation_backlog.delay(client_profile.pk)
+
+
+def record_delivery_failure(client_profile):
+    """Count a failure against the client's circuit
+
+    Returns True if the circuit is not closed, and later deliveries should be
+    held back rather than retried.
+    """
+    breaker = get_breaker(client_profile)
+    if breaker.record_failure():
+        logger.warning(
+            "[CACHE-INVALIDATION] Circuit opened client=%s url=%s seconds=%d",
+            client_profile.client.name,
+            client_profile.webhook_url,
+            OPEN_SECONDS,
+        )
+        # the flush doubles as the probe which closes the circuit again
+        schedule_backlog_flush(client_profile.pk)
+    return breaker.state != CLOSED
+
+
+def send_in_turn(client_profile, model, chunks, invalidation_id):
+    """Send chunks to a client one after another
+
+    Returns a (uuids, exception) pair for each chunk, where the exception is
+    None if it was delivered.
+    """
+    results = []
+    for uuids in chunks:
+        try:
+            client_profile.send_cache_invalidation(model, uuids, invalidation_id)
+        except Exception as exc:  # pylint: disable=broad-except
+            results.append((uuids, exc))
+        else:
+            results.append((uuids, None))
+    return results
+
+
+def deliver(deliveries, model, invalidation_id, retries, max_workers):
+    """Post a batch of deliveries concurrently
+
+    `deliveries` is a list of (client profile, uuids) pairs. No more than
+    DELIVERY_CONCURRENCY of one client's deliveries are in flight at once, as
+    many as its session keeps connections open for, however many workers there
+    are. Each failed delivery is queued for retry as a task of its own, picking
+    up from attempt `retries + 1`, so one slow or rejected delivery does not
+    resend the others. A client whose circuit is open has its deliveries held
+    back in its backlog instead. An unexpected error is raised only once every
+    other delivery has been handled.
+    """
+    by_client = {}
+    for client_profile, uuids in deliveries:
+        if not get_breaker(client_profile).allow() and hold_back(
+            client_profile, model, uuids, invalidation_id
+        ):
+            continue
+        _client_profile, chunks = by_client.setdefault(
+            client_profile.pk, (client_profile, [])
+        )
+        chunks.append(uuids)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # each of a client's lanes sends its share of the chunks in turn
+        futures = [
+            (
+                client_profile,
+                executor.submit(
+                    send_in_turn,
+                    client_profile,
+                    model,
+                    chunks[lane::DELIVERY_CONCURRENCY],
+                    invalidation_id,
+                ),
+            )
+            for client_profile, chunks in by_client.values()
+            for lane in range(min(len(chunks), DELIVERY_CONCURRENCY))
+        ]
+    results = [
+        (client_profile, uuids, exc)
+        for client_profile, future in futures
+        for uuids, exc in future.result()
+    ]
+
+    unexpected = None
+    for client_profile, uuids, exc in results:
+        if exc is None:
+            record_delivery_success(client_profile)
+            continue
+        if not isinstance(exc, requests.RequestException):
+            logger.error(
+                "[CACHE-INVALIDATION] Unexpected error id=%s client=%s model=%s "
+                "count=%d: %s",
+                invalidation_id,
+                client_profile.client.name,
+                model,
+                len(uuids),
+                exc,
+                exc_info=(type(exc), exc, exc.__traceback__),
+            )
+            unexpected = unexpected or exc
+            continue
+        # the model logs each rejected or failed attempt at warning level
+        if record_delivery_failure(client_profile) and hold_back(
+            client_profile, model, uuids, invalidation_id
+        ):
+            continue
+        if retries >= MAX_RETRIES:
+            log_retries_exceeded(
+                client_profile,
+                model,
+                uuids,
+                invalidation_id,
+                attempts=retries + 1,
+                exc=exc,
+            )
+            continue
+        countdown = retry_countdown(retries)
+        logger.info(
+            "[CACHE-INVALIDATION] Retrying id=%s client=%s url=%s model=%s "
+            "count=%d attempt=%d/%d countdown=%d",
+            invalidation_id,
+            client_profile.client.name,
+            client_profile.webhook_url,
+            model,
+            len(uuids),
+            retries + 1,
+            MAX_RETRIES + 1,
+            countdown,
+        )
+        send_cache_invalidation.apply_async(
+            (client_profile.pk, model, uuids),
+            {"invalidation_id": invalidation_id},
+            countdown=countdown,
+            retries=retries + 1,
+        )
+    if unexpected is not None:
+        raise unexpected
+
+
+def filter_consented(client_profiles, model, uuids):
+    """Narrow `uuids` to the ones each client has permission to view
+
+    Returns a dict of client profile pk to uuid list. Every client which
+    requires consent is resolved by one shared query, rather than one query
+    per client.
+    """
+    # pylint: disable=import-outside-toplevel
+    # Third Party
+    from oidc_provider.models import UserConsent
+
+    visible = {
+        client_profile.pk: uuids
+        for client_profile in client_profiles
+        if not client_profile.client.require_consent
+    }
+    consent_profiles = {
+        client_profile.client_id: client_profile
+        for client_profile in client_profiles
+        if client_profile.client.require_consent
+    }
+    if not consent_profiles:
+        return visible
+
+    consents = UserConsent.objects.filter(
+        client__in=list(consent_profiles), expires_at__gt=timezone.now()
+    )
+    if model == "user":
+        # The user model's UUID field is named `individual_organization_id`
+        # because it is a ForeignKey to the individual organization, so that
+        # a user and their individual organization always share a UUID
+        pairs = consents.filter(user__individual_organization_id__in=uuids)
+        pairs = pairs.values_list("client_id", "user__individual_organization_id")
+    elif model == "organization":
+        pairs = consents.filter(user__organizations__uuid__in=uuids)
+        pairs = pairs.values_list("client_id", "user__organizations__uuid")
+    else:
+        visible.update((c.pk, uuids) for c in consent_profiles.values())
+        return visible
+
+    consented = {client_id: set() for client_id in consent_profiles}
+    for client_id, uuid in pairs.distinct():
+        consented[client_id].add(str(uuid))
+    for client_id, client_profile in consent_profiles.items():
+        # keep the caller's order, so chunks and logs line up with the input
+        visible[client_profile.pk] = [
+            str(u) for u in uuids if str(u) in consented[client_id]
+        ]
+    return visible
+
+
+def log_nothing_to_send(client_profile, model, invalidation_id, original_count):
+    # this drop was previously indistinguishable from a successful send
+    logger.info(
+        "[CACHE-INVALIDATION] Nothing to send id=%s client=%s model=%s "
+        "reason=%s original_count=%d",
+        invalidation_id,
+        client_profile.client.name,
+        model,
+        "consent-filtered" if original_count else "empty-input",
+        original_count,
+    )
+
+
+@shared_task(name="squarelet.oidc.tasks.flush_cache_invalidations")
+def flush_cache_invalidations(model):
+    # pylint: disable=import-outside-toplevel
+    # Local
+    from .utils import flush_cache_invalidations as flush
+
+    flush(model)
+
+
+@shared_task(name="squarelet.oidc.tasks.drain_cache_invalidation_outbox")
+def drain_cache_invalidation_outbox():
+    # pylint: disable=import-outside-toplevel
+    # Local
+    from .utils import drain_cache_invalidation_outbox as drain
+
+    drain()
+
+
+@shared_task(name="squarelet.oidc.tasks.bump_dependent_versions")
+def bump_dependent_versions(model, uuids):
+    """Bump the versions of everything embedding these objects, for an
+    invalidation which is not broadcast"""
+    bump_dependents(model, uuids)
+
+
+@shared_task(name="squarelet.oidc.tasks.prune_cache_invalidation_outbox")
+def prune_cache_invalidation_outbox():
+    # pylint: disable=import-outside-toplevel
+    # Local
+    from .utils import prune_cache_invalidation_outbox as prune
+
+    deleted = prune()
+    logger.info("[CACHE-INVALIDATION] Pruned outbox entries=%d", deleted)
+
+
+@shared_task(name="squarelet.oidc.tasks.flush_login_logs")
+def flush_login_logs():
+    # pylint: disable=import-outside-toplevel
+    # Local
+    from .utils import flush_login_logs as flush
+
+    flush()
+
+
 @shared_task(
     bind=True,
     max_retries=MAX_RETRIES,
@@ -35,60 +378,52 @@ def retry_countdown(retries):
 def send_cache_invalidation(
     self, client_profile_pk, model, uuids, invalidation_id=None
 ):
-    # pylint: disable=import-outside-toplevel
-    # Squarelet
-    from squarelet.organizations.models import Organization
-    from squarelet.users.models import User
-
     client_profile = ClientProfile.objects.select_related("client").get(
         pk=client_profile_pk
     )
     original_count = len(uuids)
-    if client_profile.client.require_consent:
-        # If this client requires consent, we must filter out the users or orgs
-        # to just the ones that they have permissions to view
-        if model == "user":
-            # The user model's UUID field is named `individual_organization_id`
-            # because it is a ForeignKey to the individual organization, so that
-            # a user and their individual organization always share a UUID
-            users = User.objects.filter(
-                individual_organization_id__in=uuids,
-                userconsent__client=client_profile.client,
-                userconsent__expires_at__gt=timezone.now(),
-            )
-            uuids = [
-                str(i)
-                for i in users.values_list("individual_organization_id", flat=True)
-            ]
-        elif model == "organization":
-            organizations = Organization.objects.filter(
-                uuid__in=uuids,
-                users__userconsent__client=client_profile.client,
-                users__userconsent__expires_at__gt=timezone.now(),
-            ).distinct()
-            uuids = [str(i) for i in organizations.values_list("uuid", flat=True)]
-
-    if uuids:
+    uuids = filter_consented([client_profile], model, uuids)[client_profile.pk]
+
+    chunks = chunk_uuids(uuids, client_profile.invalidation_chunk_size)
+    if len(chunks) > 1:
+        logger.info(
+            "[CACHE-INVALIDATION] Chunking id=%s client=%s model=%s count=%d "
+            "chunks=%d size=%d",
+            invalidation_id,
+            client_profile.client.name,
+            model,
+            len(uuids),
+            len(chunks),
+            client_profile.invalidation_chunk_size,
+        )
+        deliver(
+            [(client_profile, chunk) for chunk in chunks],
+            model,
+            invalidation_id,
+            self.request.retries,
+            max_workers=DELIVERY_CONCURRENCY,
+        )
+    elif uuids:
+        if not get_breaker(client_profile).allow() and hold_back(
+            client_profile, model, uuids, invalidation_id
+        ):
+            return
         try:
             client_profile.send_cache_invalidation(model, uuids, invalidation_id)
         except requests.RequestException as exc:
             # the model logs each rejected or failed attempt at warning level
+            if record_delivery_failure(client_profile) and hold_back(
+                client_profile, model, uuids, invalidation_id
+            ):
+                return
             if self.request.retries >= self.max_retries:
-                # the one error per lost delivery, so one Sentry event - the task
-                # itself succeeds, as a dropped invalidation only leaves the
-                # client's cache stale until its next write
-                logger.error(
-                    "[CACHE-INVALIDATION] Retries exceeded, giving up! id=%s "
-                    "client=%s url=%s model=%s count=%d attempts=%d uuids=%s: %s",
-                    invalidation_id,
-                    client_profile.client.name,
-                    client_profile.webhook_url,
+                log_retries_exceeded(
+                    client_profile,
                     model,
-                    len(uuids),
-                    self.request.retries + 1,
-                    format_uuids(uuids),
-                    exc,
-                    exc_info=sys.exc_info(),
+                    uuids,
+                    invalidation_id,
+                    attempts=self.request.retries + 1,
+                    exc=exc,
                 )
                 return
             countdown = retry_countdown(self.request.retries)
@@ -105,14 +440,96 @@ def send_cache_invalidation(
                 countdown,
             )
             raise self.retry(countdown=countdown, exc=exc)
+        record_delivery_success(client_profile)
     else:
-        # this drop was previously indistinguishable from a successful send
+        log_nothing_to_send(client_profile, model, invalidation_id, original_count)
+
+
+@shared_task(name="squarelet.oidc.tasks.broadcast_cache_invalidation")
+def broadcast_cache_invalidation(
+    model, uuids, client_profile_pks, invalidation_id=None
+):
+    """Deliver one invalidation to every client concurrently, from one task
+
+    Only the first attempt is made here - a failed delivery is handed to its
+    client's own send_cache_invalidation task, so each client keeps its own
+    retry schedule and a client outage never holds this worker.
+    """
+    # the invalidation named these objects, and they were bumped when it was
+    # sent - this is the one place everything embedding them is bumped
+    bump_dependents(model, uuids)
+    client_profiles = list(
+        ClientProfile.objects.filter(pk__in=client_profile_pks).select_related("client")
+    )
+    visible = filter_consented(client_profiles, model, uuids)
+    deliveries = []
+    for client_profile in client_profiles:
+        consented = visible[client_profile.pk]
+        if not consented:
+            log_nothing_to_send(client_profile, model, invalidation_id, len(uuids))
+        deliveries.extend(
+            (client_profile, chunk)
+            for chunk in chunk_uuids(consented, client_profile.invalidation_chunk_size)
+        )
+    deliver(
+        deliveries,
+        model,
+        invalidation_id,
+        retries=0,
+        max_workers=BROADCAST_CONCURRENCY,
+    )
+
+
+@shared_task(name="squarelet.oidc.tasks.flush_cache_invalidation_backlog")
+def flush_cache_invalidation_backlog(client_profile_pk):
+    """Deliver everything held back from a client, one delivery per model
+
+    This runs when the client's circuit closes, and once the open period is
+    over - where the first chunk delivered is the half-open probe. It keeps
+    rescheduling itself until the circuit is closed, as nothing else would
+    flush a backlog whose probe was never sent.
+    """
+    # clear the marker first, so a failure landing mid-flush schedules another
+    cache.delete(backlog_flush_key(client_profile_pk))
+    client_profile = ClientProfile.objects.select_related("client").get(
+        pk=client_profile_pk
+    )
+    breaker = get_breaker(client_profile)
+    if breaker.state == OPEN:
+        # early, as the circuit was opened again since this was scheduled
+        schedule_backlog_flush(client_profile_pk)
+        return
+    incomplete = False
+    for model in BACKLOG_MODELS:
+        uuids, complete = get_backlog(client_profile, model).pop()
+        incomplete = incomplete or not complete
+        if not uuids:
+            continue
+        distinct = list(dict.fromkeys(uuids))
+        invalidation_id = uuid_lib.uuid4().hex[:8]
         logger.info(
-            "[CACHE-INVALIDATION] Nothing to send id=%s client=%s model=%s "
-            "reason=%s original_count=%d",
+            "[CACHE-INVALIDATION] Flushing backlog id=%s client=%s model=%s "
+            "held=%d distinct=%d",
             invalidation_id,
             client_profile.client.name,
             model,
-            "consent-filtered" if original_count else "empty-input",
-            original_count,
+            len(uuids),
+            len(distinct),
+        )
+        deliver(
+            [
+                (client_profile, chunk)
+                for chunk in chunk_uuids(
+                    distinct, client_profile.invalidation_chunk_size
+                )
+            ],
+            model,
+            invalidation_id,
+            retries=0,
+            max_workers=DELIVERY_CONCURRENCY,
         )
+    if breaker.state != CLOSED:
+        schedule_backlog_flush(client_profile_pk)
+    elif incomplete:
+        # a writer was mid-push - come back for the rest
+        flush_cache_invalidation_backlog.apply_async((client_profile_pk,), countdown=1)
@@ -0,0 +1,87 @@
+"""
+Tests for the cache-backed circuit breakers
+"""
+
+# Django
+from django.core.cache import cache
+
+# Squarelet
+from squarelet.oidc.breakers import (
+    CLOSED,
+    FAILURE_THRESHOLD,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+)
+
+
+def trip(breaker):
+    for _ in range(FAILURE_THRESHOLD):
+        breaker.record_failure()
+
+
+def expire_open_period(breaker):
+    cache.delete(breaker.key("open"))
+
+
+class TestCircuitBreaker:
+    """Test the closed / open / half-open transitions"""
+
+    def test_starts_closed(self):
+        breaker = CircuitBreaker("test")
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_failures_below_threshold_stay_closed(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(FAILURE_THRESHOLD - 1):
+            assert not breaker.record_failure()
+        assert breaker.state == CLOSED
+
+    def test_success_resets_failure_count(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(FAILURE_THRESHOLD - 1):
+            breaker.record_failure()
+        assert not breaker.record_success()
+        assert not breaker.record_failure()
+        assert breaker.state == CLOSED
+
+    def test_threshold_opens_circuit(self):
+        breaker = CircuitBreaker("test")
+        for _ in range(FAILURE_THRESHOLD - 1):
+            breaker.record_failure()
+        assert breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+    def test_half_open_lets_one_probe_through(self):
+        breaker = CircuitBreaker("test")
+        trip(breaker)
+        expire_open_period(breaker)
+
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+
+    def test_successful_probe_closes(self):
+        breaker = CircuitBreaker("test")
+        trip(breaker)
+        expire_open_period(breaker)
+        breaker.allow()
+
+        assert breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker("test")
+        trip(breaker)
+        expire_open_period(breaker)
+        breaker.allow()
+
+        assert breaker.record_failure()
+        assert breaker.state == OPEN
+
+    def test_breakers_are_independent(self):
+        trip(CircuitBreaker("first"))
+        assert CircuitBreaker("second").state == CLOSED
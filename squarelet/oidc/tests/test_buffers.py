@@ -0,0 +1,73 @@
+"""
+Tests for the cache-backed buffers
+"""
+
+# Django
+from django.core.cache import cache
+
+# Squarelet
+from squarelet.oidc.buffers import CacheQueue
+
+
+class TestCacheQueue:
+    """Test the slot-numbered queue"""
+
+    def test_pop_returns_items_in_push_order(self):
+        queue = CacheQueue("test")
+        assert queue.push(["a", "b"]) == 1
+        assert queue.push(["c"]) == 2
+
+        assert queue.pop() == (["a", "b", "c"], True)
+        assert queue.pop() == ([], True)
+
+    def test_pop_only_returns_new_items(self):
+        queue = CacheQueue("test")
+        queue.push(["a"])
+        queue.pop()
+        queue.push(["b"])
+
+        assert queue.pop() == (["b"], True)
+
+    def test_queues_are_independent(self):
+        CacheQueue("first").push(["a"])
+        CacheQueue("second").push(["b"])
+
+        assert CacheQueue("first").pop() == (["a"], True)
+
+    def test_pop_is_exclusive(self):
+        """A second consumer backs off while the first holds the queue"""
+        queue = CacheQueue("test")
+        queue.push(["a"])
+        cache.add(queue.key("lock"), True)
+
+        assert queue.pop() == ([], False)
+
+        cache.delete(queue.key("lock"))
+        assert queue.pop() == (["a"], True)
+
+    def test_unwritten_slot_stops_pop(self):
+        """A slot claimed but not yet written holds back everything after it"""
+        queue = CacheQueue("test")
+        queue.push(["a"])
+        # claim slot 2 without writing it, as a producer mid-push would
+        cache.incr(queue.key("head"))
+        queue.push(["c"])
+
+        assert queue.pop() == (["a"], False)
+
+        cache.set(queue.key(2), ["b"])
+        assert queue.pop() == (["b", "c"], True)
+
+    def test_abandoned_slot_is_skipped(self):
+        """A slot still missing on the next pop is given up on"""
+        queue = CacheQueue("test")
+        cache.add(queue.key("head"), 0)
+        cache.incr(queue.key("head"))
+        queue.push(["b"])
+
+        assert queue.pop() == ([], False)
+        assert queue.pop() == (["b"], True)
+
+    def test_evicted_head_reports_failure(self, mocker):
+        mocker.patch("squarelet.oidc.buffers.cache.incr", side_effect=ValueError)
+        assert CacheQueue("test").push(["a"]) is None
@@ -0,0 +1,277 @@
+"""
+Tests for the cache invalidation outbox
+"""
+
+# Django
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+# Standard Library
+import threading
+from datetime import timedelta
+from io import StringIO
+from uuid import uuid4
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.oidc.models import CacheInvalidation
+from squarelet.oidc.tests.factories import ClientProfileFactory
+from squarelet.oidc.utils import (
+    OUTBOX_CLAIM_TIMEOUT,
+    drain_cache_invalidation_outbox,
+    prune_cache_invalidation_outbox,
+    queue_cache_invalidations,
+    send_cache_invalidations,
+)
+
+
+@pytest.mark.django_db()
+class TestQueueCacheInvalidations:
+    """Test recording invalidations in the outbox"""
+
+    def test_entries_are_written(self):
+        uuids = [uuid4(), uuid4()]
+
+        queue_cache_invalidations("organization", uuids)
+
+        assert set(CacheInvalidation.objects.values_list("model", "uuid")) == {
+            ("organization", uuid) for uuid in uuids
+        }
+
+    def test_single_uuid(self):
+        uuid = uuid4()
+        queue_cache_invalidations("user", uuid)
+        assert CacheInvalidation.objects.get().uuid == uuid
+
+    def test_rolled_back_with_the_transaction(self):
+        with pytest.raises(ValueError), transaction.atomic():
+            queue_cache_invalidations("user", uuid4())
+            raise ValueError
+
+        assert not CacheInvalidation.objects.exists()
+
+    def test_drain_scheduled_once_on_commit(
+        self, mocker, django_capture_on_commit_callbacks
+    ):
+        mock_apply = mocker.patch(
+            "squarelet.oidc.tasks.drain_cache_invalidation_outbox.apply_async"
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            queue_cache_invalidations("user", uuid4())
+            queue_cache_invalidations("user", uuid4())
+
+        mock_apply.assert_called_once()
+
+
+@pytest.mark.django_db()
+class TestDrainCacheInvalidationOutbox:
+    """Test the batched outbox dispatcher"""
+
+    def test_each_object_sent_once_per_drain(self, mocker):
+        mock_send = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+        first, second, org = uuid4(), uuid4(), uuid4()
+        for model, uuid in [
+            ("user", first),
+            ("user", second),
+            ("organization", org),
+            ("user", first),
+        ]:
+            queue_cache_invalidations(model, uuid)
+
+        assert drain_cache_invalidation_outbox() == 4
+
+        sent = {call.args[0]: call.args[1] for call in mock_send.call_args_list}
+        assert sent == {"user": [str(first), str(second)], "organization": [str(org)]}
+        assert not CacheInvalidation.objects.filter(dispatched_at=None).exists()
+
+    def test_dispatched_entries_are_not_resent(self, mocker):
+        mock_send = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+        queue_cache_invalidations("user", uuid4())
+        drain_cache_invalidation_outbox()
+        mock_send.reset_mock()
+
+        assert drain_cache_invalidation_outbox() == 0
+        mock_send.assert_not_called()
+
+    def test_drains_in_batches(self, mocker):
+        mock_send = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+        uuids = [uuid4() for _ in range(5)]
+        queue_cache_invalidations("user", uuids)
+
+        assert drain_cache_invalidation_outbox(batch_size=2) == 5
+
+        assert [len(call.args[1]) for call in mock_send.call_args_list] == [2, 2, 1]
+        assert mock_send.call_args_list[0].args[1] == [str(u) for u in uuids[:2]]
+
+    def test_failed_send_leaves_entries_pending(self, mocker):
+        mocker.patch(
+            "squarelet.oidc.utils.send_cache_invalidations",
+            side_effect=ConnectionError("broker down"),
+        )
+        queue_cache_invalidations("user", uuid4())
+
+        with pytest.raises(ConnectionError):
+            drain_cache_invalidation_outbox()
+
+        entry = CacheInvalidation.objects.get()
+        assert entry.dispatched_at is None
+        assert entry.claimed_at is None
+
+    def test_claimed_entries_are_skipped_until_the_claim_expires(self, mocker):
+        mock_send = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+        claimed, expired = uuid4(), uuid4()
+        queue_cache_invalidations("user", [claimed, expired])
+        CacheInvalidation.objects.filter(uuid=claimed).update(claimed_at=timezone.now())
+        CacheInvalidation.objects.filter(uuid=expired).update(
+            claimed_at=timezone.now() - OUTBOX_CLAIM_TIMEOUT - timedelta(seconds=1)
+        )
+
+        assert drain_cache_invalidation_outbox() == 1
+
+        mock_send.assert_called_once_with("user", [str(expired)], outbox=True)
+
+    def test_drained_entries_are_not_coalesced(self, mocker, settings):
+        settings.CACHE_INVALIDATION_COALESCE_WINDOW = 3
+        ClientProfileFactory()
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mock_flush = mocker.patch(
+            "squarelet.oidc.tasks.flush_cache_invalidations.apply_async"
+        )
+        uuid = uuid4()
+        queue_cache_invalidations("user", uuid)
+
+        drain_cache_invalidation_outbox()
+
+        mock_flush.assert_not_called()
+        mock_delay.assert_called_once()
+        assert mock_delay.call_args.args[:2] == ("user", [str(uuid)])
+
+    def test_sent_entries_wait_for_a_drain_for_a_position(self, mocker):
+        """Sending without the outbox records the entry without taking the feed
+        lock, and leaves the drain to place it in the feed"""
+        mock_dispatch = mocker.patch(
+            "squarelet.oidc.utils.dispatch_cache_invalidations"
+        )
+        uuid = uuid4()
+
+        with CaptureQueriesContext(connection) as queries:
+            send_cache_invalidations("user", [uuid])
+
+        assert not any("pg_advisory" in q["sql"] for q in queries)
+        entry = CacheInvalidation.objects.get()
+        assert entry.dispatched_at is not None
+        assert entry.sequence is None
+
+        drain_cache_invalidation_outbox()
+
+        entry.refresh_from_db()
+        assert entry.sequence is not None
+        # it was already sent, so the drain does not send it again
+        mock_dispatch.assert_called_once()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_drain_sends_after_the_claim_commits(mocker):
+    """Nothing is sent from inside the transaction holding the row locks"""
+    mocker.patch("squarelet.oidc.tasks.drain_cache_invalidation_outbox.apply_async")
+    in_transaction = []
+    mocker.patch(
+        "squarelet.oidc.utils.send_cache_invalidations",
+        side_effect=lambda *args, **kwargs: in_transaction.append(
+            connection.in_atomic_block
+        ),
+    )
+    queue_cache_invalidations("user", uuid4())
+
+    drain_cache_invalidation_outbox()
+
+    assert in_transaction == [False]
+    assert not CacheInvalidation.objects.filter(dispatched_at=None).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_drain_skips_locked_entries(mocker):
+    """A second dispatcher leaves a batch claimed by the first alone"""
+    mock_send = mocker.patch("squarelet.oidc.utils.send_cache_invalidations")
+    locked, free = uuid4(), uuid4()
+    queue_cache_invalidations("user", locked)
+    queue_cache_invalidations("user", free)
+    claimed, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with transaction.atomic():
+            list(CacheInvalidation.objects.filter(uuid=locked).select_for_update())
+            claimed.set()
+            release.wait(5)
+        connection.close()
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    claimed.wait(5)
+    try:
+        assert drain_cache_invalidation_outbox() == 1
+    finally:
+        release.set()
+        thread.join()
+
+    mock_send.assert_called_once_with("user", [str(free)], outbox=True)
+
+
+@pytest.mark.django_db()
+class TestOutboxRetention:
+    """Test pruning and replaying the outbox"""
+
+    @staticmethod
+    def entry(days_ago, dispatched=True):
+        created_at = timezone.now() - timedelta(days=days_ago)
+        return CacheInvalidation.objects.create(
+            model="user",
+            uuid=uuid4(),
+            created_at=created_at,
+            dispatched_at=created_at if dispatched else None,
+        )
+
+    def test_prune_keeps_retention_window(self, settings):
+        settings.CACHE_INVALIDATION_OUTBOX_RETENTION_DAYS = 7
+        old = self.entry(8)
+        recent = self.entry(6)
+        pending = self.entry(8, dispatched=False)
+
+        assert prune_cache_invalidation_outbox() == 1
+
+        remaining = set(CacheInvalidation.objects.values_list("pk", flat=True))
+        assert remaining == {recent.pk, pending.pk}
+        assert old.pk not in remaining
+
+    def test_replay_marks_entries_pending(self, mocker):
+        mocker.patch("squarelet.oidc.tasks.drain_cache_invalidation_outbox.apply_async")
+        old = self.entry(3)
+        recent = self.entry(1)
+        since = (timezone.now() - timedelta(days=2)).isoformat()
+        out = StringIO()
+
+        call_command("replay_cache_invalidations", since, stdout=out)
+
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        assert old.dispatched_at is not None
+        assert recent.dispatched_at is None
+        assert "Replaying 1 invalidations" in out.getvalue()
+
+    def test_replay_dry_run(self):
+        entry = self.entry(1)
+        since = (timezone.now() - timedelta(days=2)).isoformat()
+        out = StringIO()
+
+        call_command("replay_cache_invalidations", since, "--dry-run", stdout=out)
+
+        entry.refresh_from_db()
+        assert entry.dispatched_at is not None
+        assert "Would replay 1 invalidations" in out.getvalue()
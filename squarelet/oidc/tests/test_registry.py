@@ -0,0 +1,119 @@
+"""
+Tests for the in-process client registry
+"""
+
+# Django
+from django.test import RequestFactory
+
+# Third Party
+import pytest
+from oidc_provider.models import Client, ResponseType
+
+# Squarelet
+from squarelet.oidc.registry import ClientRegistry, RegistryClients, client_registry
+from squarelet.oidc.tests.factories import ClientFactory, ClientProfileFactory
+from squarelet.oidc.views import AuthorizeEndpoint
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    client_registry.clear()
+    yield
+    client_registry.clear()
+
+
+@pytest.mark.django_db()
+class TestClientRegistry:
+    """Test loading and reloading the registry"""
+
+    def test_get(self, django_assert_num_queries):
+        profile = ClientProfileFactory()
+        client = profile.client
+        registry = ClientRegistry()
+
+        registered = registry.get(client.client_id)
+
+        assert registered.client == client
+        assert registered.profile == profile
+        assert registry.get("missing") is None
+        with django_assert_num_queries(0):
+            registry.get(client.client_id)
+
+    def test_client_without_profile(self):
+        client = ClientFactory()
+
+        assert ClientRegistry().get(client.client_id).profile is None
+
+    def test_reloads_on_client_save(self):
+        client = ClientFactory(name="Old")
+        registry = ClientRegistry()
+        registry.get(client.client_id)
+
+        client.name = "New"
+        client.save()
+
+        assert registry.get(client.client_id).client.name == "New"
+
+    def test_reloads_on_profile_save(self):
+        profile = ClientProfileFactory(checks_verification=False)
+        registry = ClientRegistry()
+        registry.get(profile.client.client_id)
+
+        profile.checks_verification = True
+        profile.save()
+
+        assert registry.get(profile.client.client_id).profile.checks_verification
+
+    def test_reloads_on_response_types(self):
+        client = ClientFactory()
+        registry = ClientRegistry()
+        registry.get(client.client_id)
+        response_type, _ = ResponseType.objects.get_or_create(
+            value="code", defaults={"description": "Authorization Code Flow"}
+        )
+
+        client.response_types.add(response_type)
+
+        assert "code" in registry.get(client.client_id).client.response_type_values()
+
+    def test_reloads_on_delete(self):
+        client = ClientFactory()
+        registry = ClientRegistry()
+        registry.get(client.client_id)
+
+        client.delete()
+
+        assert registry.get(client.client_id) is None
+
+
+@pytest.mark.django_db()
+class TestAuthorizeEndpoint:
+    """Test that authorization looks clients up in the registry"""
+
+    def test_validate_params_without_client_queries(self, django_assert_num_queries):
+        response_type, _ = ResponseType.objects.get_or_create(
+            value="code", defaults={"description": "Authorization Code Flow"}
+        )
+        client = ClientFactory()
+        client.redirect_uris = ["https://example.com/callback/"]
+        client.save()
+        client.response_types.add(response_type)
+        request = RequestFactory().get(
+            "/openid/authorize",
+            {
+                "client_id": client.client_id,
+                "redirect_uri": "https://example.com/callback/",
+                "scope": "openid profile",
+                "response_type": "code",
+            },
+        )
+        client_registry.get(client.client_id)
+
+        endpoint = AuthorizeEndpoint(request)
+        with django_assert_num_queries(0):
+            endpoint.validate_params()
+        assert endpoint.client == client
+
+    def test_missing_client(self):
+        with pytest.raises(Client.DoesNotExist):
+            RegistryClients.objects.get(client_id="missing")
@@ -0,0 +1,121 @@
+"""
+Tests for the pooled webhook sessions
+"""
+
+# Standard Library
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.oidc.sessions import WebhookSessionRegistry, webhook_sessions
+from squarelet.oidc.tests.factories import ClientProfileFactory
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """Accept any POST and keep the connection open"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+@pytest.fixture(name="webhook_server")
+def webhook_server_fixture():
+    """A local HTTP/1.1 server, so connection reuse is real and countable"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/webhook"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def clear_sessions():
+    webhook_sessions.clear()
+    yield
+    webhook_sessions.clear()
+
+
+class TestWebhookSessionRegistry:
+    """Test the per-process session registry"""
+
+    def test_same_key_reuses_session(self):
+        registry = WebhookSessionRegistry()
+        assert registry.get(1) is registry.get(1)
+        assert registry.get(1) is not registry.get(2)
+
+    def test_connection_is_reused(self, webhook_server):
+        """Sequential posts share one keep-alive connection"""
+        registry = WebhookSessionRegistry()
+        session = registry.get(1)
+
+        for _ in range(3):
+            session.post(webhook_server, data={"a": "b"}, timeout=5)
+
+        assert registry.stats() == {1: {"requests": 3, "connections": 1, "reused": 2}}
+
+    def test_concurrent_posts_are_counted_once(self, webhook_server):
+        registry = WebhookSessionRegistry()
+        session = registry.get(1)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            for _ in range(8):
+                executor.submit(session.post, webhook_server, timeout=5)
+
+        assert registry.stats()[1]["requests"] == 8
+        assert registry.stats()[1]["connections"] <= 4
+
+    def test_idle_session_is_evicted(self):
+        """A session unused past the idle timeout is closed and replaced"""
+        registry = WebhookSessionRegistry(idle_timeout=60)
+        session = registry.get(1)
+        session.last_used -= 61
+
+        assert registry.get(1) is not session
+        assert len(registry.stats()) == 1
+
+    def test_clear_closes_every_session(self):
+        registry = WebhookSessionRegistry()
+        registry.get(1)
+        registry.get(2)
+
+        registry.clear()
+
+        assert registry.stats() == {}
+
+
+@pytest.mark.django_db()
+class TestSendCacheInvalidationSession:
+    """Test that deliveries go through the client's pooled session"""
+
+    def test_deliveries_reuse_connection(self, webhook_server, caplog):
+        caplog.set_level("INFO", logger="squarelet.oidc.models")
+        client_profile = ClientProfileFactory(webhook_url=webhook_server)
+
+        client_profile.send_cache_invalidation("user", ["a"])
+        client_profile.send_cache_invalidation("user", ["b"])
+
+        assert webhook_sessions.stats()[client_profile.pk]["reused"] == 1
+        assert "requests=2 reused=1" in caplog.text
+
+    def test_sessions_are_per_client(self, requests_mock):
+        first, second = ClientProfileFactory.create_batch(2)
+        requests_mock.post(first.webhook_url, status_code=200)
+        requests_mock.post(second.webhook_url, status_code=200)
+
+        first.send_cache_invalidation("user", ["a"])
+        second.send_cache_invalidation("user", ["a"])
+
+        assert set(webhook_sessions.stats()) == {first.pk, second.pk}
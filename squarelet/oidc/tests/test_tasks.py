@@ -4,28 +4,42 @@ Tests for OIDC tasks
 
 # send_cache_invalidation is a bind=True task, so calling it directly passes
 # `self` implicitly - pylint reads every call here as missing its first argument
-# pylint: disable=no-value-for-parameter
+# pylint: disable=no-value-for-parameter,too-many-lines
 
 # Django
 from celery.exceptions import Retry
+from django.core.cache import cache
 from django.utils import timezone
 
 # Standard Library
 import logging
+import threading
+import time
+from collections import defaultdict
 from datetime import timedelta
 from uuid import uuid4
 
 # Third Party
+import factory
 import pytest
 import requests
 from oidc_provider.models import UserConsent
 
 # Squarelet
+from squarelet.oidc.breakers import CLOSED, FAILURE_THRESHOLD, OPEN, OPEN_SECONDS
 from squarelet.oidc.models import ClientProfile
 from squarelet.oidc.tasks import (
+    DELIVERY_CONCURRENCY,
     MAX_RETRIES,
     RETRY_BACKOFF,
     RETRY_JITTER,
+    broadcast_cache_invalidation,
+    chunk_uuids,
+    filter_consented,
+    flush_cache_invalidation_backlog,
+    get_backlog,
+    get_breaker,
+    record_delivery_failure,
     retry_countdown,
     send_cache_invalidation,
 )
@@ -672,6 +686,479 @@ class TestSendCacheInvalidationRetries:
         mock_retry.assert_not_called()
 
 
+@pytest.mark.django_db()
+class TestSendCacheInvalidationChunks:
+    """Test that a bulk invalidation is delivered in independent chunks"""
+
+    @pytest.fixture(name="chunked_profile")
+    def chunked_profile_fixture(self):
+        return ClientProfileFactory(
+            client=ClientFactory(require_consent=False), invalidation_chunk_size=2
+        )
+
+    def test_bulk_invalidation_is_split(self, mocker, chunked_profile):
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation"
+        )
+        uuids = [str(uuid4()) for _ in range(5)]
+
+        send_cache_invalidation(chunked_profile.pk, "user", uuids, "abc12345")
+
+        sent = sorted(call.args[1] for call in mock_send.call_args_list)
+        assert sent == sorted([uuids[0:2], uuids[2:4], uuids[4:5]])
+        assert all(call.args[2] == "abc12345" for call in mock_send.call_args_list)
+
+    def test_small_invalidation_is_not_split(self, mocker, client_profile):
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation"
+        )
+        uuids = [str(uuid4()) for _ in range(5)]
+
+        send_cache_invalidation(client_profile.pk, "user", uuids)
+
+        mock_send.assert_called_once_with("user", uuids, None)
+
+    def test_only_failed_chunk_is_retried(self, mocker, caplog, chunked_profile):
+        """One rejected chunk does not resend the rest of the batch"""
+        caplog.set_level(logging.INFO, logger="squarelet.oidc.tasks")
+        uuids = [str(uuid4()) for _ in range(6)]
+
+        def send(_model, chunk, _invalidation_id):
+            if chunk == uuids[2:4]:
+                raise requests.exceptions.HTTPError("502 Bad Gateway")
+
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            side_effect=send,
+        )
+        mock_apply = mocker.patch.object(send_cache_invalidation, "apply_async")
+
+        send_cache_invalidation(chunked_profile.pk, "user", uuids, "abc12345")
+
+        mock_apply.assert_called_once()
+        args, kwargs = mock_apply.call_args
+        assert args == (
+            (chunked_profile.pk, "user", uuids[2:4]),
+            {"invalidation_id": "abc12345"},
+        )
+        assert kwargs["retries"] == 1
+        assert kwargs["countdown"] >= RETRY_BACKOFF
+        assert "[CACHE-INVALIDATION] Retrying id=abc12345" in caplog.text
+
+    def test_chunk_retries_exhausted_logs_error(self, mocker, caplog, chunked_profile):
+        caplog.set_level(logging.INFO, logger="squarelet.oidc.tasks")
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            side_effect=requests.exceptions.ConnectTimeout("unreachable"),
+        )
+        mock_apply = mocker.patch.object(send_cache_invalidation, "apply_async")
+
+        result = send_cache_invalidation.apply(
+            args=(chunked_profile.pk, "user", [str(uuid4()) for _ in range(3)]),
+            retries=MAX_RETRIES,
+        )
+
+        assert result.successful()
+        mock_apply.assert_not_called()
+        errors = [r for r in caplog.records if r.levelno == logging.ERROR]
+        assert len(errors) == 2
+        assert errors[0].exc_info is not None
+
+    def test_non_request_errors_still_propagate(self, mocker, chunked_profile):
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            side_effect=ValueError("bug"),
+        )
+
+        with pytest.raises(ValueError):
+            send_cache_invalidation(
+                chunked_profile.pk, "user", [str(uuid4()) for _ in range(3)]
+            )
+
+    def test_chunk_uuids(self):
+        assert chunk_uuids(list("abcde"), 2) == [["a", "b"], ["c", "d"], ["e"]]
+        assert chunk_uuids([], 2) == []
+
+
+@pytest.mark.django_db()
+class TestBroadcastCacheInvalidation:
+    """Test delivering one invalidation to every client from one task"""
+
+    def test_every_client_is_sent_to(self, mocker):
+        profiles = ClientProfileFactory.create_batch(
+            3, client=factory.SubFactory(ClientFactory, require_consent=False)
+        )
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+        )
+        uuids = [str(uuid4())]
+
+        broadcast_cache_invalidation(
+            "user", uuids, [p.pk for p in profiles], invalidation_id="abc12345"
+        )
+
+        assert sorted(call.args[0].pk for call in mock_send.call_args_list) == sorted(
+            p.pk for p in profiles
+        )
+        for call in mock_send.call_args_list:
+            assert call.args[1:] == ("user", uuids, "abc12345")
+
+    def test_dependents_are_bumped(self, mocker, client_profile):
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+        )
+        mock_bump = mocker.patch("squarelet.oidc.tasks.bump_dependents")
+        uuids = [str(uuid4())]
+
+        broadcast_cache_invalidation("organization", uuids, [client_profile.pk])
+
+        mock_bump.assert_called_once_with("organization", uuids)
+
+    def test_only_listed_clients_are_sent_to(self, mocker, client_profile):
+        ClientProfileFactory(client=ClientFactory(require_consent=False))
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+        )
+
+        broadcast_cache_invalidation("user", [str(uuid4())], [client_profile.pk])
+
+        mock_send.assert_called_once()
+        assert mock_send.call_args.args[0].pk == client_profile.pk
+
+    def test_consent_is_applied_per_client(self, mocker, caplog, client_profile):
+        caplog.set_level(logging.INFO, logger="squarelet.oidc.tasks")
+        consent_profile = ClientProfileFactory()
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+        )
+        user = UserFactory()
+
+        broadcast_cache_invalidation(
+            "user", [str(user.uuid)], [client_profile.pk, consent_profile.pk]
+        )
+
+        mock_send.assert_called_once()
+        assert mock_send.call_args.args[0].pk == client_profile.pk
+        assert "reason=consent-filtered" in caplog.text
+
+    def test_failed_client_is_retried_on_its_own(self, mocker, client_profile):
+        """A failing client gets its own task, on its own retry schedule"""
+        healthy = ClientProfileFactory(client=ClientFactory(require_consent=False))
+
+        def send(profile, _model, _uuids, _invalidation_id):
+            if profile.pk == client_profile.pk:
+                raise requests.exceptions.ConnectTimeout("unreachable")
+
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+            side_effect=send,
+        )
+        mock_apply = mocker.patch.object(send_cache_invalidation, "apply_async")
+        uuids = [str(uuid4())]
+
+        broadcast_cache_invalidation(
+            "user", uuids, [client_profile.pk, healthy.pk], invalidation_id="abc12345"
+        )
+
+        assert mock_send.call_count == 2
+        mock_apply.assert_called_once()
+        assert mock_apply.call_args.args == (
+            (client_profile.pk, "user", uuids),
+            {"invalidation_id": "abc12345"},
+        )
+        assert mock_apply.call_args.kwargs["retries"] == 1
+
+    def test_unexpected_error_raised_after_every_delivery(self, mocker, client_profile):
+        """A bug in one delivery does not abandon the others"""
+        broken, healthy = ClientProfileFactory.create_batch(
+            2, client=factory.SubFactory(ClientFactory, require_consent=False)
+        )
+
+        def send(profile, _model, _uuids, _invalidation_id):
+            if profile.pk == broken.pk:
+                raise ValueError("bug")
+            if profile.pk == client_profile.pk:
+                raise requests.exceptions.ConnectTimeout("unreachable")
+
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+            side_effect=send,
+        )
+        mock_apply = mocker.patch.object(send_cache_invalidation, "apply_async")
+        mock_success = mocker.patch("squarelet.oidc.tasks.record_delivery_success")
+
+        with pytest.raises(ValueError):
+            broadcast_cache_invalidation(
+                "user",
+                [str(uuid4())],
+                [broken.pk, client_profile.pk, healthy.pk],
+            )
+
+        mock_apply.assert_called_once()
+        assert mock_apply.call_args.args[0][0] == client_profile.pk
+        mock_success.assert_called_once()
+        assert mock_success.call_args.args[0].pk == healthy.pk
+
+    def test_bulk_invalidation_is_chunked_per_client(self, mocker, client_profile):
+        chunked = ClientProfileFactory(
+            client=ClientFactory(require_consent=False), invalidation_chunk_size=2
+        )
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+        )
+
+        broadcast_cache_invalidation(
+            "user", [str(uuid4()) for _ in range(3)], [client_profile.pk, chunked.pk]
+        )
+
+        sizes = sorted(
+            (call.args[0].pk, len(call.args[2])) for call in mock_send.call_args_list
+        )
+        assert sizes == sorted(
+            [(client_profile.pk, 3), (chunked.pk, 2), (chunked.pk, 1)]
+        )
+
+    def test_one_clients_deliveries_are_bounded(self, mocker, client_profile):
+        """A client with more chunks than its session has connections never has
+        more than DELIVERY_CONCURRENCY of them in flight"""
+        chunked = ClientProfileFactory(
+            client=ClientFactory(require_consent=False), invalidation_chunk_size=1
+        )
+        lock = threading.Lock()
+        in_flight = defaultdict(int)
+        most = defaultdict(int)
+
+        def send(profile, _model, _uuids, _invalidation_id):
+            with lock:
+                in_flight[profile.pk] += 1
+                most[profile.pk] = max(most[profile.pk], in_flight[profile.pk])
+            time.sleep(0.01)
+            with lock:
+                in_flight[profile.pk] -= 1
+
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+            side_effect=send,
+        )
+        uuids = [str(uuid4()) for _ in range(DELIVERY_CONCURRENCY * 4)]
+
+        broadcast_cache_invalidation("user", uuids, [client_profile.pk, chunked.pk])
+
+        assert mock_send.call_count == len(uuids) + 1
+        assert most[chunked.pk] <= DELIVERY_CONCURRENCY
+
+
+@pytest.mark.django_db()
+class TestFilterConsented:
+    """Test resolving consent for every client in one query"""
+
+    @staticmethod
+    def consent(user, client, days=30):
+        UserConsent.objects.create(
+            user=user,
+            client=client,
+            expires_at=timezone.now() + timedelta(days=days),
+            date_given=timezone.now(),
+            scope=["openid"],
+        )
+
+    def test_users_resolved_per_client(self, client_profile):
+        first, second = ClientProfileFactory.create_batch(2)
+        users = UserFactory.create_batch(3)
+        self.consent(users[0], first.client)
+        self.consent(users[1], first.client)
+        self.consent(users[1], second.client)
+        self.consent(users[2], second.client, days=-1)
+        uuids = [str(user.uuid) for user in users]
+
+        visible = filter_consented([client_profile, first, second], "user", uuids)
+
+        assert visible == {
+            client_profile.pk: uuids,
+            first.pk: uuids[:2],
+            second.pk: uuids[1:2],
+        }
+
+    def test_organizations_resolved_per_client(self):
+        first, second = ClientProfileFactory.create_batch(2)
+        orgs = OrganizationFactory.create_batch(2)
+        user = UserFactory()
+        for org in orgs:
+            MembershipFactory(user=user, organization=org)
+        # a second consenting member must not duplicate the org
+        other = UserFactory()
+        MembershipFactory(user=other, organization=orgs[0])
+        self.consent(user, first.client)
+        self.consent(other, first.client)
+        uuids = [str(org.uuid) for org in orgs]
+
+        visible = filter_consented([first, second], "organization", uuids)
+
+        assert visible == {first.pk: uuids, second.pk: []}
+
+    def test_one_query_for_all_clients(self, django_assert_num_queries):
+        profiles = list(
+            ClientProfile.objects.filter(
+                pk__in=[p.pk for p in ClientProfileFactory.create_batch(5)]
+            ).select_related("client")
+        )
+        uuids = [str(uuid4()) for _ in range(10)]
+
+        with django_assert_num_queries(1):
+            filter_consented(profiles, "organization", uuids)
+
+    def test_no_query_without_consent_clients(
+        self, client_profile, django_assert_num_queries
+    ):
+        with django_assert_num_queries(0):
+            visible = filter_consented([client_profile], "user", ["a"])
+
+        assert visible == {client_profile.pk: ["a"]}
+
+
+@pytest.mark.django_db()
+class TestCircuitBreaker:
+    """Test holding deliveries back from a client whose endpoint is down"""
+
+    @staticmethod
+    def trip(client_profile):
+        breaker = get_breaker(client_profile)
+        for _ in range(FAILURE_THRESHOLD):
+            breaker.record_failure()
+
+    def test_failures_open_circuit(self, mocker, caplog, client_profile):
+        caplog.set_level(logging.INFO, logger="squarelet.oidc.tasks")
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            side_effect=requests.exceptions.ConnectTimeout("unreachable"),
+        )
+        mocker.patch.object(send_cache_invalidation, "retry", side_effect=Retry)
+        mock_flush = mocker.patch.object(
+            flush_cache_invalidation_backlog, "apply_async"
+        )
+
+        for _ in range(FAILURE_THRESHOLD - 1):
+            with pytest.raises(Retry):
+                send_cache_invalidation(client_profile.pk, "user", [str(uuid4())])
+        # the failure which opens the circuit is held back, not retried
+        uuid = str(uuid4())
+        send_cache_invalidation(client_profile.pk, "user", [uuid])
+
+        assert get_breaker(client_profile).state == OPEN
+        assert "[CACHE-INVALIDATION] Circuit opened" in caplog.text
+        mock_flush.assert_called_once()
+        assert get_backlog(client_profile, "user").pop() == ([uuid], True)
+
+    def test_open_circuit_holds_back_without_sending(self, mocker, client_profile):
+        self.trip(client_profile)
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation"
+        )
+        uuids = [str(uuid4())]
+
+        send_cache_invalidation(client_profile.pk, "organization", uuids)
+        broadcast_cache_invalidation("organization", uuids, [client_profile.pk])
+
+        mock_send.assert_not_called()
+        assert get_backlog(client_profile, "organization").pop() == (
+            uuids + uuids,
+            True,
+        )
+
+    def test_open_circuit_does_not_hold_up_other_clients(self, mocker, client_profile):
+        healthy = ClientProfileFactory(client=ClientFactory(require_consent=False))
+        self.trip(client_profile)
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            autospec=True,
+        )
+
+        broadcast_cache_invalidation(
+            "user", [str(uuid4())], [client_profile.pk, healthy.pk]
+        )
+
+        mock_send.assert_called_once()
+        assert mock_send.call_args.args[0].pk == healthy.pk
+
+    def test_flush_probes_and_delivers_backlog_once(self, mocker, client_profile):
+        """The backlog goes out as one coalesced delivery per model"""
+        self.trip(client_profile)
+        first, second = str(uuid4()), str(uuid4())
+        get_backlog(client_profile, "user").push([first, second])
+        get_backlog(client_profile, "user").push([first])
+        cache.delete(get_breaker(client_profile).key("open"))
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation"
+        )
+        mock_delay = mocker.patch.object(flush_cache_invalidation_backlog, "delay")
+
+        flush_cache_invalidation_backlog(client_profile.pk)
+
+        mock_send.assert_called_once()
+        assert mock_send.call_args.args[:2] == ("user", [first, second])
+        assert get_breaker(client_profile).state == CLOSED
+        # closing the circuit flushes anything held back during the probe
+        mock_delay.assert_called_once_with(client_profile.pk)
+
+    def test_failed_probe_keeps_backlog(self, mocker, client_profile):
+        self.trip(client_profile)
+        uuid = str(uuid4())
+        get_backlog(client_profile, "user").push([uuid])
+        cache.delete(get_breaker(client_profile).key("open"))
+        mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation",
+            side_effect=requests.exceptions.ConnectTimeout("unreachable"),
+        )
+        mock_flush = mocker.patch.object(
+            flush_cache_invalidation_backlog, "apply_async"
+        )
+
+        flush_cache_invalidation_backlog(client_profile.pk)
+
+        assert get_breaker(client_profile).state == OPEN
+        mock_flush.assert_called_once()
+        assert get_backlog(client_profile, "user").pop() == ([uuid], True)
+
+    def test_failures_schedule_one_flush(self, mocker, client_profile):
+        """Every failure while the circuit is open reopens it, but only one
+        flush is scheduled at a time"""
+        mock_flush = mocker.patch.object(
+            flush_cache_invalidation_backlog, "apply_async"
+        )
+
+        for _ in range(FAILURE_THRESHOLD + 3):
+            record_delivery_failure(client_profile)
+
+        mock_flush.assert_called_once_with((client_profile.pk,), countdown=OPEN_SECONDS)
+
+    def test_flush_while_open_reschedules(self, mocker, client_profile):
+        """A flush which runs before the circuit is half-open sends nothing and
+        comes back later, rather than leaving the backlog stranded"""
+        self.trip(client_profile)
+        uuid = str(uuid4())
+        get_backlog(client_profile, "user").push([uuid])
+        mock_send = mocker.patch(
+            "squarelet.oidc.models.ClientProfile.send_cache_invalidation"
+        )
+        mock_flush = mocker.patch.object(
+            flush_cache_invalidation_backlog, "apply_async"
+        )
+
+        flush_cache_invalidation_backlog(client_profile.pk)
+
+        mock_send.assert_not_called()
+        mock_flush.assert_called_once_with((client_profile.pk,), countdown=OPEN_SECONDS)
+        assert get_backlog(client_profile, "user").pop() == ([uuid], True)
+
+
 class TestRetryCountdown:
     """Test the retry backoff schedule"""
 
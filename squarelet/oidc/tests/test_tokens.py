@@ -0,0 +1,104 @@
+"""
+Tests for the cached access token resolution
+"""
+
+# Django
+from django.utils import timezone
+
+# Standard Library
+from datetime import timedelta
+
+# Third Party
+import pytest
+from oidc_provider.lib.utils.token import create_token
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory
+
+# Squarelet
+from squarelet.oidc.authentication import OidcOauth2Authentication
+from squarelet.oidc.tokens import resolve_access_token
+
+
+@pytest.fixture(name="token")
+def token_fixture(user_factory, client):
+    token = create_token(user=user_factory(), client=client, scope=["read_user"])
+    token.save()
+    return token
+
+
+@pytest.mark.django_db()
+class TestResolveAccessToken:
+    """Test resolving and caching access tokens"""
+
+    def test_resolves_token(self, token):
+        resolved = resolve_access_token(token.access_token)
+
+        assert resolved.pk == token.pk
+        assert resolved.user == token.user
+        assert resolved.client == token.client
+        assert resolved.scope == ["read_user"]
+        assert not resolved.has_expired()
+
+    def test_cached(self, token, django_assert_num_queries):
+        resolve_access_token(token.access_token)
+
+        with django_assert_num_queries(0):
+            resolved = resolve_access_token(token.access_token)
+        assert resolved.user_id == token.user_id
+
+    def test_missing_cached(self, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            assert resolve_access_token("missing") is None
+        with django_assert_num_queries(0):
+            assert resolve_access_token("missing") is None
+
+    def test_missing_evicted_on_create(self, user_factory, client):
+        token = create_token(user=user_factory(), client=client, scope=["read_user"])
+        assert resolve_access_token(token.access_token) is None
+
+        token.save()
+
+        assert resolve_access_token(token.access_token).pk == token.pk
+
+    def test_evicted_on_save(self, token):
+        resolve_access_token(token.access_token)
+
+        token.expires_at = timezone.now() - timedelta(seconds=1)
+        token.save()
+
+        assert resolve_access_token(token.access_token).has_expired()
+
+    def test_evicted_on_delete(self, token):
+        resolve_access_token(token.access_token)
+
+        token.delete()
+
+        assert resolve_access_token(token.access_token) is None
+
+
+@pytest.mark.django_db()
+class TestOidcOauth2Authentication:
+    """Test authenticating API requests by bearer token"""
+
+    def _authenticate(self, access_token):
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"Bearer {access_token}"
+        )
+        return OidcOauth2Authentication().authenticate(request)
+
+    def test_authenticate(self, token):
+        user, auth = self._authenticate(token.access_token)
+
+        assert user == token.user
+        assert auth.pk == token.pk
+
+    def test_invalid(self):
+        with pytest.raises(exceptions.AuthenticationFailed):
+            self._authenticate("missing")
+
+    def test_expired(self, token):
+        token.expires_at = timezone.now() - timedelta(seconds=1)
+        token.save()
+
+        with pytest.raises(exceptions.AuthenticationFailed):
+            self._authenticate(token.access_token)
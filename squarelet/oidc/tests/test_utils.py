@@ -14,8 +14,13 @@ import pytest
 
 # Squarelet
 from squarelet.oidc.models import UUID_LOG_SAMPLE, UUID_LOG_THRESHOLD
-from squarelet.oidc.tests.factories import ClientProfileFactory
-from squarelet.oidc.utils import send_cache_invalidations
+from squarelet.oidc.tests.factories import ClientFactory, ClientProfileFactory
+from squarelet.oidc.utils import (
+    flush_cache_invalidations,
+    flush_login_logs,
+    oidc_login_hook,
+    send_cache_invalidations,
+)
 
 
 @pytest.mark.django_db()
@@ -27,65 +32,80 @@ class TestSendCacheInvalidations:
         """The feature flag being off is no longer a silent no-op"""
         caplog.set_level(logging.INFO, logger="squarelet.oidc.utils")
         ClientProfileFactory()
-        mock_delay = mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mock_bump = mocker.patch("squarelet.oidc.tasks.bump_dependent_versions.delay")
+        uuids = [str(uuid4())]
 
-        send_cache_invalidations("user", [str(uuid4())])
+        send_cache_invalidations("user", uuids)
 
         mock_delay.assert_not_called()
+        mock_bump.assert_called_once_with("user", uuids)
         assert "Disabled by ENABLE_SEND_CACHE_INVALIDATIONS" in caplog.text
 
     def test_no_clients_with_webhook_url_is_logged(self, caplog, mocker):
         """A client set with no webhook URLs is a misconfiguration, not silence"""
         caplog.set_level(logging.INFO, logger="squarelet.oidc.utils")
         ClientProfileFactory(webhook_url="")
-        mock_delay = mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mock_bump = mocker.patch("squarelet.oidc.tasks.bump_dependent_versions.delay")
 
         send_cache_invalidations("user", [str(uuid4())])
 
         mock_delay.assert_not_called()
+        mock_bump.assert_called_once()
         assert "No client has a webhook_url configured" in caplog.text
 
     def test_dispatch_logs_client_names_and_count(self, caplog, mocker):
         """The dispatch line names every client it fanned out to"""
         caplog.set_level(logging.INFO, logger="squarelet.oidc.utils")
         profiles = ClientProfileFactory.create_batch(2)
-        mock_delay = mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
 
         send_cache_invalidations("organization", [str(uuid4()), str(uuid4())])
 
-        assert mock_delay.call_count == 2
+        mock_delay.assert_called_once()
         assert "Dispatching id=" in caplog.text
         assert "count=2" in caplog.text
         for profile in profiles:
             assert profile.client.name in caplog.text
 
-    def test_all_clients_share_one_invalidation_id(self, mocker):
-        """One broadcast is greppable across every client's task"""
-        ClientProfileFactory.create_batch(3)
-        mock_delay = mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+    def test_one_task_for_every_client(self, mocker):
+        """One broadcast is one task, whatever the number of clients"""
+        profiles = ClientProfileFactory.create_batch(3)
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
 
         send_cache_invalidations("user", [str(uuid4())])
 
-        ids = {call.kwargs["invalidation_id"] for call in mock_delay.call_args_list}
-        assert len(ids) == 1
-        assert len(ids.pop()) == 8
+        mock_delay.assert_called_once()
+        assert sorted(mock_delay.call_args[0][2]) == sorted(p.pk for p in profiles)
+        assert len(mock_delay.call_args.kwargs["invalidation_id"]) == 8
 
     def test_blank_webhook_url_is_excluded(self, mocker):
         """Clients without a webhook URL are not dispatched to"""
         configured = ClientProfileFactory()
         ClientProfileFactory(webhook_url="")
-        mock_delay = mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
 
         send_cache_invalidations("user", [str(uuid4())])
 
         mock_delay.assert_called_once()
-        assert mock_delay.call_args[0][0] == configured.pk
+        assert mock_delay.call_args[0][2] == [configured.pk]
 
     def test_dispatch_logs_every_uuid(self, caplog, mocker):
         """An interactive-sized broadcast names every uuid it dispatched"""
         caplog.set_level(logging.INFO, logger="squarelet.oidc.utils")
         ClientProfileFactory()
-        mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mocker.patch("squarelet.oidc.tasks.broadcast_cache_invalidation.delay")
         uuids = [str(uuid4()) for _ in range(UUID_LOG_THRESHOLD)]
 
         send_cache_invalidations("organization", uuids)
@@ -98,7 +118,7 @@ class TestSendCacheInvalidations:
         """A bulk broadcast logs a sample and a remainder, not the full list"""
         caplog.set_level(logging.INFO, logger="squarelet.oidc.utils")
         ClientProfileFactory()
-        mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mocker.patch("squarelet.oidc.tasks.broadcast_cache_invalidation.delay")
         uuids = [str(uuid4()) for _ in range(500)]
 
         send_cache_invalidations("organization", uuids)
@@ -110,9 +130,169 @@ class TestSendCacheInvalidations:
     def test_full_uuid_list_still_reaches_the_task(self, mocker):
         """Abbreviating the log must not abbreviate what actually gets sent"""
         ClientProfileFactory()
-        mock_delay = mocker.patch("squarelet.oidc.tasks.send_cache_invalidation.delay")
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
         uuids = [str(uuid4()) for _ in range(500)]
 
         send_cache_invalidations("organization", uuids)
 
-        assert mock_delay.call_args[0][2] == uuids
+        assert mock_delay.call_args[0][1] == uuids
+
+
+@pytest.mark.django_db()
+class TestCoalesceCacheInvalidations:
+    """Test buffering invalidations into one broadcast per window"""
+
+    @pytest.fixture(autouse=True)
+    def coalesce(self, settings):
+        settings.CACHE_INVALIDATION_COALESCE_WINDOW = 3
+
+    def test_writes_in_one_window_schedule_one_flush(self, mocker):
+        ClientProfileFactory()
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mock_flush = mocker.patch(
+            "squarelet.oidc.tasks.flush_cache_invalidations.apply_async"
+        )
+
+        for _ in range(5):
+            send_cache_invalidations("organization", [str(uuid4())])
+
+        mock_delay.assert_not_called()
+        mock_flush.assert_called_once_with(("organization",), countdown=3)
+
+    def test_flush_sends_distinct_uuids_once(self, mocker):
+        ClientProfileFactory.create_batch(2)
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mocker.patch("squarelet.oidc.tasks.flush_cache_invalidations.apply_async")
+        first, second = str(uuid4()), str(uuid4())
+
+        for uuids in ([first], [first, second], [second], [first]):
+            send_cache_invalidations("organization", uuids)
+        flush_cache_invalidations("organization")
+
+        mock_delay.assert_called_once()
+        assert mock_delay.call_args[0][:2] == ("organization", [first, second])
+
+    def test_models_are_buffered_separately(self, mocker):
+        ClientProfileFactory()
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mock_flush = mocker.patch(
+            "squarelet.oidc.tasks.flush_cache_invalidations.apply_async"
+        )
+        uuid = str(uuid4())
+
+        send_cache_invalidations("user", [uuid])
+        send_cache_invalidations("organization", [uuid])
+        flush_cache_invalidations("user")
+
+        assert mock_flush.call_count == 2
+        mock_delay.assert_called_once()
+        assert mock_delay.call_args[0][:2] == ("user", [uuid])
+
+    def test_write_after_flush_schedules_next_flush(self, mocker):
+        ClientProfileFactory()
+        mocker.patch("squarelet.oidc.tasks.broadcast_cache_invalidation.delay")
+        mock_flush = mocker.patch(
+            "squarelet.oidc.tasks.flush_cache_invalidations.apply_async"
+        )
+
+        send_cache_invalidations("user", [str(uuid4())])
+        flush_cache_invalidations("user")
+        send_cache_invalidations("user", [str(uuid4())])
+
+        assert mock_flush.call_count == 2
+
+    def test_incomplete_flush_is_rescheduled(self, mocker):
+        ClientProfileFactory()
+        mocker.patch("squarelet.oidc.tasks.broadcast_cache_invalidation.delay")
+        mock_flush = mocker.patch(
+            "squarelet.oidc.tasks.flush_cache_invalidations.apply_async"
+        )
+        mocker.patch(
+            "squarelet.oidc.utils.CacheQueue.pop", return_value=([str(uuid4())], False)
+        )
+
+        flush_cache_invalidations("user")
+
+        mock_flush.assert_called_once_with(("user",), countdown=3)
+
+    def test_unavailable_cache_sends_immediately(self, mocker):
+        """Losing the cache must not lose the invalidation"""
+        ClientProfileFactory()
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+        mocker.patch("squarelet.oidc.utils.CacheQueue.push", return_value=None)
+
+        send_cache_invalidations("user", [str(uuid4())])
+
+        mock_delay.assert_called_once()
+
+    def test_no_window_sends_immediately(self, mocker, settings):
+        settings.CACHE_INVALIDATION_COALESCE_WINDOW = 0
+        ClientProfileFactory()
+        mock_delay = mocker.patch(
+            "squarelet.oidc.tasks.broadcast_cache_invalidation.delay"
+        )
+
+        send_cache_invalidations("user", [str(uuid4())])
+
+        mock_delay.assert_called_once()
+
+
+@pytest.mark.django_db()
+class TestLoginLogs:
+    """Test buffering logins and writing them in bulk"""
+
+    def test_hook_buffers_login(
+        self, user_factory, client, mocker, django_assert_num_queries
+    ):
+        mock_apply = mocker.patch("squarelet.oidc.tasks.flush_login_logs.apply_async")
+        user = user_factory()
+
+        with django_assert_num_queries(0):
+            oidc_login_hook(None, user, client)
+            oidc_login_hook(None, user, client)
+
+        # one flush for the burst
+        mock_apply.assert_called_once()
+        assert not user.logins.exists()
+
+    def test_flush_writes_logins(
+        self, user_factory, organization_factory, plan_factory, mocker
+    ):
+        mocker.patch("squarelet.oidc.tasks.flush_login_logs.apply_async")
+        client = ClientFactory()
+        user, other = user_factory.create_batch(2)
+        plan = plan_factory()
+        organization = organization_factory(users=[user], plans=[plan])
+        oidc_login_hook(None, user, client)
+        oidc_login_hook(None, other, client)
+
+        assert flush_login_logs() == 2
+
+        organizations = user.logins.get().metadata["organizations"]
+        assert {
+            "id": organization.pk,
+            "name": organization.name,
+            "plan": plan.name,
+        } in organizations
+        assert other.logins.count() == 1
+        assert flush_login_logs() == 0
+
+    def test_hook_writes_without_buffer(self, user_factory, client, mocker):
+        mocker.patch(
+            "squarelet.oidc.utils.CacheQueue.push", autospec=True, return_value=None
+        )
+        user = user_factory()
+
+        oidc_login_hook(None, user, client)
+
+        assert user.logins.get().client == client
@@ -0,0 +1,73 @@
+"""
+Tests for the payload versions behind conditional requests
+"""
+
+# Standard Library
+from uuid import uuid4
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.oidc.versions import (
+    bump_dependent_versions,
+    bump_versions,
+    get_dependents,
+    get_version,
+)
+
+
+@pytest.mark.django_db()
+class TestVersions:
+    """Test version tracking and dependent expansion"""
+
+    def test_version_is_stable(self):
+        assert get_version("user", "a") == get_version("user", "a")
+
+    def test_bump_moves_forward(self, mocker):
+        uuid = str(uuid4())
+        mocker.patch("squarelet.oidc.versions.time.time", return_value=100.0)
+        version = get_version("user", uuid)
+        mocker.patch("squarelet.oidc.versions.time.time", return_value=200.0)
+
+        bump_versions("user", [uuid])
+
+        assert get_version("user", uuid) == 200.0 > version
+
+    def test_bump_only_named(self, user_factory, organization_factory, mocker):
+        user = user_factory()
+        organization = organization_factory(users=[user])
+        mocker.patch("squarelet.oidc.versions.time.time", return_value=100.0)
+        get_version("user", user.uuid)
+        mocker.patch("squarelet.oidc.versions.time.time", return_value=200.0)
+
+        bump_versions("organization", [organization.uuid])
+        assert get_version("user", user.uuid) == 100.0
+
+        bump_dependent_versions("organization", [organization.uuid])
+        assert get_version("user", user.uuid) == 200.0
+
+    def test_bump_makes_no_queries(self, django_assert_num_queries):
+        with django_assert_num_queries(0):
+            bump_versions("user", [str(uuid4()) for _ in range(100)])
+
+    def test_user_dependents(self, user_factory, organization_factory):
+        user = user_factory()
+        admin_of = organization_factory(admins=[user])
+        member_of = organization_factory(users=[user])
+
+        users, organizations = get_dependents("user", [user.uuid])
+
+        assert str(user.uuid) in users
+        assert str(admin_of.uuid) in organizations
+        assert str(member_of.uuid) not in organizations
+
+    def test_organization_dependents(self, user_factory, organization_factory):
+        user = user_factory()
+        parent = organization_factory(users=[user])
+        child = organization_factory(parent=parent)
+
+        users, organizations = get_dependents("organization", [parent.uuid])
+
+        assert organizations == {str(parent.uuid), str(child.uuid)}
+        assert users == {str(user.uuid)}
@@ -0,0 +1,68 @@
+"""Cached resolution of OAuth2 access tokens for API authentication
+
+Client services send the same bearer token with request after request, so the
+fields authentication needs are cached by token, and unknown tokens are
+remembered for a short while too. Saving or deleting a token evicts it.
+"""
+
+# Django
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+# Standard Library
+import hashlib
+
+# Third Party
+from oidc_provider.models import Token
+
+# an entry never outlives its token, and is re-read at least this often in case
+# it changed without a signal (e.g. through a queryset update)
+TOKEN_CACHE_TIMEOUT = 60
+# long enough to absorb a client retrying a bad token, short enough that a
+# token created just after it was looked up is not locked out for long
+MISSING_TOKEN_CACHE_TIMEOUT = 10
+MISSING = "missing"
+
+TOKEN_FIELDS = ("id", "user_id", "client_id", "_scope", "expires_at")
+
+
+def token_key(access_token):
+    # keep the bearer secrets themselves out of the cache's keyspace
+    digest = hashlib.sha256(access_token.encode("utf8")).hexdigest()
+    return f"squarelet:token:{digest}"
+
+
+def resolve_access_token(access_token):
+    """Return the Token for `access_token`, or None if there is none
+
+    A cached token is rebuilt without a query, with only the fields
+    authentication reads loaded - its user and client load on first access.
+    """
+    key = token_key(access_token)
+    fields = cache.get(key)
+    if fields == MISSING:
+        return None
+    if fields is None:
+        fields = (
+            Token.objects.filter(access_token=access_token)
+            .values(*TOKEN_FIELDS)
+            .first()
+        )
+        if fields is None:
+            cache.set(key, MISSING, timeout=MISSING_TOKEN_CACHE_TIMEOUT)
+            return None
+        timeout = min(
+            TOKEN_CACHE_TIMEOUT,
+            (fields["expires_at"] - timezone.now()).total_seconds(),
+        )
+        if timeout > 0:
+            cache.set(key, fields, timeout=timeout)
+
+    fields = {**fields, "access_token": access_token}
+    names = [f.attname for f in Token._meta.concrete_fields if f.attname in fields]
+    return Token.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+
+def evict_access_token(access_token):
+    cache.delete(token_key(access_token))
@@ -2,23 +2,68 @@
 
 # Django
 from django.conf import settings
-from django.db.models.expressions import F
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
 
 # Standard Library
 import logging
 import uuid as uuid_lib
+from collections import defaultdict
+from datetime import timedelta
 
 # Local
 from . import tasks
-from .models import ClientProfile, format_uuids
+from .buffers import CacheQueue
+from .models import CacheInvalidation, ClientProfile, format_uuids
+from .versions import bump_versions
 
 logger = logging.getLogger(__name__)
 
+# outbox entries claimed at a time by a drain
+OUTBOX_BATCH_SIZE = 1000
+# how long a drain's claim on entries lasts - a drain which dies holding a claim
+# leaves its entries to be sent by one after this
+OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=5)
+# seconds after a commit before the outbox is drained, so a burst of commits
+# shares one drain
+OUTBOX_DRAIN_DELAY = 2
+OUTBOX_DRAIN_KEY = "squarelet:cache-invalidation:outbox:drain-scheduled"
+# the advisory lock held while change feed positions are assigned, until the
+# transaction assigning them commits
+CHANGE_FEED_LOCK = 0x5C1F
+# seconds logins are buffered before being written, so a burst of logins
+# shares one bulk insert
+LOGIN_LOG_FLUSH_DELAY = 10
+LOGIN_LOG_FLUSH_KEY = "squarelet:login-log:flush-scheduled"
+LOGIN_LOG_BATCH_SIZE = 500
 
-def send_cache_invalidations(model, uuids):
-    """Send a cache invalidation signal to all clients"""
+
+def _coalesce_queue(model):
+    return CacheQueue(f"cache-invalidation:{model}")
+
+
+def _coalesce_flush_key(model):
+    return f"squarelet:cache-invalidation:{model}:flush-scheduled"
+
+
+def send_cache_invalidations(model, uuids, outbox=False):
+    """Send a cache invalidation signal to all clients
+
+    `outbox` is set for entries drained from the outbox, whose versions were
+    already bumped when they committed. They are never coalesced - the drain
+    marks them dispatched once this returns, and the coalescing buffer lives in
+    the cache, which may lose them.
+    """
     uuids = list(uuids)
     formatted_uuids = format_uuids(uuids)
+    if not outbox:
+        # our own API's conditional GETs must not answer 304 for these from now
+        # on, whether or not clients are told
+        bump_versions(model, uuids)
+        record_cache_invalidations(model, uuids)
 
     if not settings.ENABLE_SEND_CACHE_INVALIDATIONS:
         # the standing alarm for this being off in production is a single
@@ -30,8 +75,59 @@ def send_cache_invalidations(model, uuids):
             len(uuids),
             formatted_uuids,
         )
+        # nothing is broadcast, so nothing else bumps what embeds them
+        tasks.bump_dependent_versions.delay(model, uuids)
         return
 
+    window = settings.CACHE_INVALIDATION_COALESCE_WINDOW
+    if window and not outbox and _coalesce_queue(model).push(uuids) is not None:
+        # the first write in a window schedules its flush - every later write
+        # before the flush only adds its uuids to the buffer
+        if cache.add(_coalesce_flush_key(model), True, timeout=window * 10):
+            tasks.flush_cache_invalidations.apply_async((model,), countdown=window)
+        logger.debug(
+            "[CACHE-INVALIDATION] Buffered model=%s count=%d uuids=%s",
+            model,
+            len(uuids),
+            formatted_uuids,
+        )
+        return
+
+    dispatch_cache_invalidations(model, uuids)
+
+
+def flush_cache_invalidations(model):
+    """Send one broadcast for everything buffered for `model` since the last
+    flush"""
+    # clear the marker before reading the buffer, so a write landing after the
+    # read schedules the next flush instead of waiting for this one
+    cache.delete(_coalesce_flush_key(model))
+    uuids, complete = _coalesce_queue(model).pop()
+    if not complete:
+        # a writer was mid-push or another flush held the buffer - come back for
+        # the rest rather than leave it until the next write
+        window = settings.CACHE_INVALIDATION_COALESCE_WINDOW or 1
+        if cache.add(_coalesce_flush_key(model), True, timeout=window * 10):
+            tasks.flush_cache_invalidations.apply_async((model,), countdown=window)
+    if not uuids:
+        return
+
+    # keep first-seen order, so the sampled uuids in the logs stay meaningful
+    distinct = list(dict.fromkeys(uuids))
+    logger.info(
+        "[CACHE-INVALIDATION] Coalesced model=%s buffered=%d distinct=%d",
+        model,
+        len(uuids),
+        len(distinct),
+    )
+    dispatch_cache_invalidations(model, distinct)
+
+
+def dispatch_cache_invalidations(model, uuids):
+    """Fan a cache invalidation out to every client with a webhook"""
+    uuids = list(uuids)
+    formatted_uuids = format_uuids(uuids)
+
     client_profiles = list(
         ClientProfile.objects.exclude(webhook_url="").select_related("client")
     )
@@ -42,6 +138,7 @@ def send_cache_invalidations(model, uuids):
             model,
             len(uuids),
         )
+        tasks.bump_dependent_versions.delay(model, uuids)
         return
 
     # short correlation id so one logical broadcast is greppable across the fan-out
@@ -55,21 +152,235 @@ def send_cache_invalidations(model, uuids):
         [cp.client.name for cp in client_profiles],
         formatted_uuids,
     )
-    for client_profile in client_profiles:
-        # keyword argument with a default so messages already queued in Redis at
-        # deploy time still deserialize
-        tasks.send_cache_invalidation.delay(
-            client_profile.pk, model, uuids, invalidation_id=invalidation_id
+    # one task delivers to every client, rather than one task per client
+    tasks.broadcast_cache_invalidation.delay(
+        model,
+        uuids,
+        [client_profile.pk for client_profile in client_profiles],
+        invalidation_id=invalidation_id,
+    )
+
+
+def queue_cache_invalidations(model, uuids):
+    """Record cache invalidations in the outbox, as part of the current
+    transaction
+
+    Call this from inside the transaction that makes the change, not from an
+    on_commit callback - the outbox entry then commits or rolls back along with
+    the change itself.
+    """
+    if not isinstance(uuids, list):
+        uuids = [uuids]
+    CacheInvalidation.objects.bulk_create(
+        [CacheInvalidation(model=model, uuid=uuid) for uuid in uuids]
+    )
+    # bump versions straight away rather than when the outbox is drained - the
+    # broadcast bumps everything embedding them
+    transaction.on_commit(lambda: bump_versions(model, uuids))
+    transaction.on_commit(schedule_outbox_drain)
+
+
+def schedule_outbox_drain():
+    """Drain the outbox shortly, unless a drain is already scheduled
+
+    The periodic drain picks up anything a lost message leaves behind.
+    """
+    if not cache.add(OUTBOX_DRAIN_KEY, True, timeout=OUTBOX_DRAIN_DELAY * 10):
+        return
+    try:
+        tasks.drain_cache_invalidation_outbox.apply_async(countdown=OUTBOX_DRAIN_DELAY)
+    except Exception:  # pylint: disable=broad-except
+        # this runs after the commit, so failing here would fail a request whose
+        # change already landed - the invalidation is safe in the outbox
+        cache.delete(OUTBOX_DRAIN_KEY)
+        logger.warning(
+            "[CACHE-INVALIDATION] Could not schedule an outbox drain, leaving it "
+            "to the periodic drain",
+            exc_info=True,
+        )
+
+
+def assign_feed_sequence(pks):
+    """Give these outbox entries, and every entry recorded as already sent,
+    their positions in the change feed
+
+    Only drains assign positions, from inside their claim's transaction, under a
+    lock held until it commits - so positions become visible in order, and a
+    client which has read up to a position never has an entry appear before it
+    later. Writers never take the lock, so they never wait on one another.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CHANGE_FEED_LOCK])
+    CacheInvalidation.objects.filter(
+        Q(pk__in=pks) | Q(dispatched_at__isnull=False), sequence=None
+    ).update(sequence=RawSQL("nextval('oidc_cacheinvalidation_feed_seq')", []))
+
+
+def record_cache_invalidations(model, uuids):
+    """Record an invalidation sent without going through the outbox, already
+    dispatched - the next drain places it in the change feed"""
+    now = timezone.now()
+    CacheInvalidation.objects.bulk_create(
+        [
+            CacheInvalidation(model=model, uuid=uuid, claimed_at=now, dispatched_at=now)
+            for uuid in uuids
+        ],
+        batch_size=OUTBOX_BATCH_SIZE,
+    )
+    transaction.on_commit(schedule_outbox_drain)
+
+
+def claim_outbox_entries(batch_size=OUTBOX_BATCH_SIZE):
+    """Claim the next batch of pending outbox entries for this drain
+
+    Entries are locked with SELECT ... FOR UPDATE SKIP LOCKED only while they
+    are claimed, so concurrent drains split the outbox between them instead of
+    sending it twice. Claiming places the entries, and any recorded as already
+    sent, in the change feed. Returns (pk, model, uuid) tuples.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        entries = list(
+            CacheInvalidation.objects.filter(dispatched_at=None)
+            .filter(Q(claimed_at=None) | Q(claimed_at__lt=now - OUTBOX_CLAIM_TIMEOUT))
+            .order_by("pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", "model", "uuid")[:batch_size]
+        )
+        pks = [pk for pk, _model, _uuid in entries]
+        if pks:
+            CacheInvalidation.objects.filter(pk__in=pks).update(claimed_at=now)
+        assign_feed_sequence(pks)
+    return entries
+
+
+def drain_cache_invalidation_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """Send every pending outbox entry, one broadcast per model per batch
+
+    Each batch is claimed and committed before it is sent, so nothing is sent
+    for a claim which rolls back. An entry is only marked dispatched once its
+    broadcast is queued - a drain which fails or dies leaves it for the next
+    one, which may send some of the batch a second time. Returns the number of
+    entries dispatched.
+    """
+    # clear the marker first, so a commit landing mid-drain schedules another
+    cache.delete(OUTBOX_DRAIN_KEY)
+    total = 0
+    while True:
+        entries = claim_outbox_entries(batch_size)
+        if not entries:
+            return total
+        pks = [pk for pk, _model, _uuid in entries]
+        # once per object per batch, in the order they were written
+        batches = defaultdict(dict)
+        for _pk, model, uuid in entries:
+            batches[model][str(uuid)] = None
+        try:
+            for model, uuids in batches.items():
+                send_cache_invalidations(model, list(uuids), outbox=True)
+        except Exception:
+            # release the claim, so the next drain retries the batch straight away
+            CacheInvalidation.objects.filter(pk__in=pks).update(claimed_at=None)
+            raise
+        CacheInvalidation.objects.filter(pk__in=pks).update(
+            dispatched_at=timezone.now()
+        )
+        total += len(entries)
+        logger.info(
+            "[CACHE-INVALIDATION] Drained outbox entries=%d %s",
+            len(entries),
+            " ".join(f"{model}={len(uuids)}" for model, uuids in batches.items()),
         )
+        if len(entries) < batch_size:
+            return total
+
+
+def prune_cache_invalidation_outbox():
+    """Delete dispatched outbox entries older than the retention window"""
+    cutoff = timezone.now() - timedelta(
+        days=settings.CACHE_INVALIDATION_OUTBOX_RETENTION_DAYS
+    )
+    deleted, _ = CacheInvalidation.objects.filter(
+        dispatched_at__isnull=False, created_at__lt=cutoff
+    ).delete()
+    return deleted
+
+
+def _login_queue():
+    return CacheQueue("login-log")
 
 
 def oidc_login_hook(request, user, client):
-    """Log which client users login to"""
-    # take an arbitrary non-individual organization, since most users will have one org
-    organizations = list(user.organizations.values("id", "name", plan=F("plans__name")))
-    user.logins.create(
-        client=client,
-        metadata={
-            "organizations": organizations,
-        },
+    """Log which client users login to
+
+    The login is buffered and written by the next flush, keeping the database
+    out of the authorization request.
+    """
+    login = (user.pk, client.pk, timezone.now())
+    if _login_queue().push([login]) is None:
+        # no buffer to hold it - write it now, as before buffering
+        write_login_logs([login])
+        return
+    if not cache.add(LOGIN_LOG_FLUSH_KEY, True, timeout=LOGIN_LOG_FLUSH_DELAY * 10):
+        return
+    try:
+        tasks.flush_login_logs.apply_async(countdown=LOGIN_LOG_FLUSH_DELAY)
+    except Exception:  # pylint: disable=broad-except
+        # never fail a login over its log - the periodic flush will write it
+        cache.delete(LOGIN_LOG_FLUSH_KEY)
+        logger.warning(
+            "[LOGIN-LOG] Could not schedule a flush, leaving it to the periodic "
+            "flush",
+            exc_info=True,
+        )
+
+
+def flush_login_logs():
+    """Write every buffered login. Returns the number written."""
+    # clear the marker first, so a login landing mid-flush schedules another
+    cache.delete(LOGIN_LOG_FLUSH_KEY)
+    logins, complete = _login_queue().pop()
+    if not complete and cache.add(
+        LOGIN_LOG_FLUSH_KEY, True, timeout=LOGIN_LOG_FLUSH_DELAY * 10
+    ):
+        tasks.flush_login_logs.apply_async(countdown=LOGIN_LOG_FLUSH_DELAY)
+    if logins:
+        write_login_logs(logins)
+        logger.info("[LOGIN-LOG] Flushed logins=%d", len(logins))
+    return len(logins)
+
+
+def write_login_logs(logins):
+    """Create a LoginLog for each (user pk, client pk, time) login, with a
+    snapshot of the user's organizations and their plans"""
+    # pylint: disable=import-outside-toplevel
+    # Squarelet
+    from squarelet.organizations.models import Membership
+    from squarelet.users.models import LoginLog
+
+    organizations = defaultdict(list)
+    memberships = (
+        Membership.objects.filter(user_id__in={user_pk for user_pk, _, _ in logins})
+        .order_by("organization__slug")
+        .values_list(
+            "user_id",
+            "organization_id",
+            "organization__name",
+            "organization__plans__name",
+        )
+    )
+    for user_pk, org_id, name, plan in memberships:
+        organizations[user_pk].append({"id": org_id, "name": name, "plan": plan})
+
+    LoginLog.objects.bulk_create(
+        [
+            LoginLog(
+                user_id=user_pk,
+                client_id=client_pk,
+                created_at=created_at,
+                metadata={"organizations": organizations[user_pk]},
+            )
+            for user_pk, client_pk, created_at in logins
+        ],
+        batch_size=LOGIN_LOG_BATCH_SIZE,
     )
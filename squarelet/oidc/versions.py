@@ -0,0 +1,97 @@
+"""Versions of the payloads clients cache, for conditional requests
+
+Every cache invalidation bumps the version of the objects it names, and of the
+objects whose API payload embeds them, to the time of the bump. An object's
+version only ever moves forward, so together with its `updated_at` it tells
+whether anything in its payload may have changed.
+
+The named objects are bumped inline, which is only a cache write. Finding
+their dependents takes several queries and can name thousands of objects, so
+that is done once per invalidation, by the task which broadcasts it.
+"""
+
+# Django
+from django.core.cache import cache
+from django.db.models import Q
+
+# Standard Library
+import time
+
+# long enough that a version outlives any client's cached copy - an evicted
+# version restarts at the current time, which only costs one full response
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def version_key(model, uuid):
+    return f"squarelet:version:{model}:{uuid}"
+
+
+def get_version(model, uuid):
+    """The time the object's payload last changed, other than by a save"""
+    key = version_key(model, uuid)
+    version = cache.get(key)
+    if version is None:
+        # nothing is known about changes before now, so assume there was one
+        cache.add(key, time.time(), timeout=VERSION_TIMEOUT)
+        version = cache.get(key) or time.time()
+    return version
+
+
+def get_dependents(model, uuids):
+    """Every user and organization whose payload embeds one of these objects
+
+    Returns (user uuids, organization uuids), including the objects themselves.
+    """
+    # pylint: disable=import-outside-toplevel
+    # Squarelet
+    from squarelet.organizations.models import Membership, Organization
+
+    uuids = {str(uuid) for uuid in uuids}
+    users, organizations = set(), set()
+    if model == "user":
+        users |= uuids
+        # organization payloads list their admins
+        organizations |= {
+            str(uuid)
+            for uuid in Membership.objects.filter(
+                user__individual_organization_id__in=uuids, admin=True
+            ).values_list("organization__uuid", flat=True)
+        }
+    else:
+        organizations |= uuids
+    if not organizations:
+        return users, organizations
+
+    # organization payloads embed their parent and their groups
+    organizations |= {
+        str(uuid)
+        for uuid in Organization.objects.filter(
+            Q(parent__uuid__in=organizations) | Q(groups__uuid__in=organizations)
+        ).values_list("uuid", flat=True)
+    }
+    # user payloads embed every organization they are a member of
+    users |= {
+        str(uuid)
+        for uuid in Membership.objects.filter(
+            organization__uuid__in=organizations
+        ).values_list("user__individual_organization_id", flat=True)
+    }
+    return users, organizations
+
+
+def bump_versions(model, uuids):
+    """Mark the payloads of these objects as changed"""
+    now = time.time()
+    cache.set_many(
+        {version_key(model, uuid): now for uuid in uuids}, timeout=VERSION_TIMEOUT
+    )
+
+
+def bump_dependent_versions(model, uuids):
+    """Mark the payloads of these objects, and everything embedding them, as
+    changed"""
+    users, organizations = get_dependents(model, uuids)
+    now = time.time()
+    versions = {version_key("user", uuid): now for uuid in users}
+    versions.update({version_key("organization", uuid): now for uuid in organizations})
+    cache.set_many(versions, timeout=VERSION_TIMEOUT)
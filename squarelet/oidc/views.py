@@ -4,6 +4,9 @@ from django.db import transaction
 from django.shortcuts import render
 
 # Third Party
+from oidc_provider.lib.endpoints.authorize import (
+    AuthorizeEndpoint as BaseAuthorizeEndpoint,
+)
 from oidc_provider.models import Client
 from oidc_provider.views import AuthorizeView as BaseAuthorizeView
 from rest_framework import status
@@ -12,8 +15,14 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 # Squarelet
-from squarelet.oidc.models import ClientProfile
 from squarelet.oidc.permissions import ScopePermission
+from squarelet.oidc.registry import RegistryClients, client_registry
+
+
+class AuthorizeEndpoint(BaseAuthorizeEndpoint):
+    """Look clients up in the in-process registry instead of the database"""
+
+    client_class = RegistryClients
 
 
 class AuthorizeView(BaseAuthorizeView):
@@ -22,6 +31,7 @@ class AuthorizeView(BaseAuthorizeView):
     to users during the authorization flow.
     """
 
+    authorize_endpoint_class = AuthorizeEndpoint
     DISMISS_SESSION_KEY = "verification_notice_dismissed"
 
     def get(self, request, *args, **kwargs):
@@ -85,21 +95,15 @@ class AuthorizeView(BaseAuthorizeView):
         client_id = request.GET.get("client_id")
         if not client_id:
             return None
-        try:
-            return Client.objects.select_related("clientprofile").get(
-                client_id=client_id
-            )
-        except Client.DoesNotExist:
-            return None
+        registered = client_registry.get(client_id)
+        return registered.client if registered is not None else None
 
     @staticmethod
     def _get_client_profile(client):
         if client is None:
             return None
-        try:
-            return client.clientprofile
-        except ClientProfile.DoesNotExist:
-            return None
+        registered = client_registry.get(client.client_id)
+        return registered.profile if registered is not None else None
 
 
 class OIDCRedirectURIUpdater(APIView):
@@ -120,3 +120,8 @@ class ChangeStatus(models.TextChoices):
 
 
 CHANGE_STATUS_CHOICES = ChangeStatus.choices
+
+
+class EntitlementSource(models.TextChoices):
+    plan = "plan", _("Plan")
+    grant = "grant", _("Grant")
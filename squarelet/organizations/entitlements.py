@@ -0,0 +1,291 @@
+"""Resolving the entitlements of many organizations at once
+
+An organization's entitlements come from the plans it subscribes to and from
+the entitlement grants that match it.  Evaluating grant rules on every read is
+expensive, so the result is materialized in OrganizationEntitlement and kept
+up to date by the signals on subscriptions, organizations, plans and grants,
+which call `refresh_entitlements` for the organizations a change affects.
+
+Reads go through an EntitlementResolver, which collects the organizations
+about to be serialized and loads their materialized entitlements together, in
+a single query, the first time any of them is resolved.
+"""
+
+# Django
+from django.db import transaction
+from django.db.models import F
+
+# Standard Library
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import NamedTuple
+
+# Squarelet
+from squarelet.organizations.choices import EntitlementSource
+from squarelet.organizations.models.organization import Organization
+from squarelet.organizations.models.payment import (
+    Entitlement,
+    EntitlementGrant,
+    OrganizationEntitlement,
+    Subscription,
+)
+
+REFRESH_BATCH_SIZE = 500
+
+# the organizations waiting for the end of a `refreshing_once` block
+PENDING_REFRESHES = threading.local()
+
+
+class ResolvedEntitlement(NamedTuple):
+    """One entitlement available to an organization, and where it comes from"""
+
+    entitlement: Entitlement
+    source: EntitlementSource
+    quantity: int
+
+
+class EntitlementResolver:
+    """Resolves (organization, client) pairs to the entitlements available
+
+    Organizations passed in, or added later, are loaded together on the first
+    `resolve` that needs any of them. Resolving an organization that was never
+    added loads it on its own.
+    """
+
+    def __init__(self, organizations=()):
+        self._pending = set()
+        self._resolved = {}
+        self.add(organizations)
+
+    def __contains__(self, organization):
+        return organization.pk in self._resolved or organization.pk in self._pending
+
+    def add(self, organizations):
+        for organization in organizations:
+            if organization.pk not in self._resolved:
+                self._pending.add(organization.pk)
+
+    def resolve(self, organization, client=None):
+        """The entitlements available to `organization`, as ResolvedEntitlements
+
+        Plan entitlements come first, one per subscription, followed by grant
+        entitlements, each at most once.  Only entitlements for `client` are
+        returned, unless it is None.
+        """
+        if organization.pk not in self._resolved:
+            self._pending.add(organization.pk)
+            self._load()
+        return [
+            resolved
+            for resolved in self._resolved[organization.pk]
+            if client is None or resolved.entitlement.client_id == client.pk
+        ]
+
+    def _load(self):
+        pks = self._pending
+        self._pending = set()
+        for pk in pks:
+            self._resolved[pk] = []
+        rows = OrganizationEntitlement.objects.filter(organization__in=pks)
+        # plan entitlements before grant entitlements
+        rows = rows.select_related("entitlement").order_by(
+            "-source", "entitlement__slug", "pk"
+        )
+        for row in rows:
+            self._resolved[row.organization_id].append(
+                ResolvedEntitlement(row.entitlement, row.source, row.quantity)
+            )
+
+
+def compute_entitlements(organizations):
+    """Evaluate the plans and grants of `organizations` from scratch
+
+    Returns a dict from organization pk to its ResolvedEntitlements, computed
+    in a fixed number of queries however many organizations there are.
+    """
+    organizations = {organization.pk: organization for organization in organizations}
+
+    subscriptions = defaultdict(list)
+    for subscription in Subscription.objects.filter(
+        organization__in=list(organizations)
+    ):
+        subscriptions[subscription.organization_id].append(subscription)
+
+    plan_entitlements = defaultdict(list)
+    plan_pks = {s.plan_id for subs in subscriptions.values() for s in subs}
+    if plan_pks:
+        for entitlement in Entitlement.objects.filter(plans__in=plan_pks).annotate(
+            plan_pk=F("plans")
+        ):
+            plan_entitlements[entitlement.plan_pk].append(entitlement)
+
+    grants = list(EntitlementGrant.objects.active().prefetch_related("entitlements"))
+    explicit = set()
+    if grants:
+        explicit.update(
+            EntitlementGrant.organizations.through.objects.filter(
+                entitlementgrant__in=grants, organization__in=list(organizations)
+            ).values_list("entitlementgrant_id", "organization_id")
+        )
+
+    computed = {}
+    for pk, organization in organizations.items():
+        resolved = [
+            ResolvedEntitlement(entitlement, EntitlementSource.plan, sub.quantity)
+            for sub in subscriptions[pk]
+            for entitlement in plan_entitlements[sub.plan_id]
+        ]
+        seen = set()
+        for grant in grants:
+            if not _matches(grant, organization, bool(subscriptions[pk]), explicit):
+                continue
+            for entitlement in grant.entitlements.all():
+                if entitlement.pk not in seen:
+                    seen.add(entitlement.pk)
+                    resolved.append(
+                        ResolvedEntitlement(entitlement, EntitlementSource.grant, 1)
+                    )
+        computed[pk] = resolved
+    return computed
+
+
+def _matches(grant, organization, has_subscription, explicit):
+    """EntitlementGrant.matches, from what has already been loaded"""
+    if organization.individual and not grant.for_individuals:
+        return False
+    if not organization.individual and not grant.for_groups:
+        return False
+    if (grant.pk, organization.pk) in explicit:
+        return True
+    checks = []
+    if grant.require_verified:
+        checks.append(bool(organization.verified_journalist))
+    if grant.require_active_subscription:
+        checks.append(has_subscription)
+    if not checks:
+        return False
+    return all(checks)
+
+
+def refresh_entitlements(organizations, dry_run=False):
+    """Bring the materialized entitlements of the `organizations` queryset up
+    to date
+
+    Only rows that changed are written.  Returns the pks of the organizations
+    whose rows were out of date - with `dry_run`, they are reported but left
+    as they are.
+    """
+    stale = []
+    batch = []
+    for organization in organizations.iterator(chunk_size=REFRESH_BATCH_SIZE):
+        batch.append(organization)
+        if len(batch) >= REFRESH_BATCH_SIZE:
+            stale.extend(_refresh_batch(batch, dry_run))
+            batch = []
+    if batch:
+        stale.extend(_refresh_batch(batch, dry_run))
+    return stale
+
+
+def refresh_organizations(pks):
+    """Refresh the organizations with these pks - when the enclosing
+    `refreshing_once` block exits, if there is one"""
+    pks = set(pks)
+    if hasattr(PENDING_REFRESHES, "pks"):
+        PENDING_REFRESHES.pks |= pks
+    elif pks:
+        refresh_entitlements(Organization.objects.filter(pk__in=pks))
+
+
+@contextmanager
+def refreshing_once():
+    """Refresh each organization once, when the block exits, however many
+    changes inside it ask for a refresh - such as each subscription a queryset
+    delete removes"""
+    if hasattr(PENDING_REFRESHES, "pks"):
+        # the outer block refreshes everything
+        yield
+        return
+    PENDING_REFRESHES.pks = set()
+    try:
+        yield
+    finally:
+        pks = PENDING_REFRESHES.pks
+        del PENDING_REFRESHES.pks
+    refresh_organizations(pks)
+
+
+def _refresh_batch(organizations, dry_run):
+    if dry_run:
+        return _diff_batch(organizations)[0]
+    with transaction.atomic():
+        # lock the organizations before reading their rows, so a concurrent
+        # refresh of any of them waits for this one instead of recreating the
+        # same rows - in pk order, so overlapping batches cannot deadlock
+        list(
+            Organization.objects.select_for_update()
+            .filter(pk__in=[organization.pk for organization in organizations])
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        stale, delete, create = _diff_batch(organizations)
+        if stale:
+            OrganizationEntitlement.objects.filter(pk__in=delete).delete()
+            OrganizationEntitlement.objects.bulk_create(create)
+    return stale
+
+
+def _diff_batch(organizations):
+    """The pks of the stale organizations, the pks of their rows to delete and
+    the rows to create"""
+    stored = defaultdict(list)
+    for row in OrganizationEntitlement.objects.filter(organization__in=organizations):
+        stored[row.organization_id].append(row)
+
+    stale = []
+    delete = []
+    create = []
+    for pk, resolved in compute_entitlements(organizations).items():
+        wanted = Counter((r.entitlement.pk, r.source, r.quantity) for r in resolved)
+        extra = []
+        for row in stored[pk]:
+            key = (row.entitlement_id, row.source, row.quantity)
+            if wanted[key] > 0:
+                wanted[key] -= 1
+            else:
+                extra.append(row.pk)
+        missing = list(wanted.elements())
+        if not extra and not missing:
+            continue
+        stale.append(pk)
+        delete.extend(extra)
+        create.extend(
+            OrganizationEntitlement(
+                organization_id=pk,
+                entitlement_id=entitlement_pk,
+                source=source,
+                quantity=quantity,
+            )
+            for entitlement_pk, source, quantity in missing
+        )
+    return stale, delete, create
+
+
+def organizations_to_resolve(organizations):
+    """The organizations, with the parents and groups already loaded alongside
+    them, which serializing them in detail will resolve entitlements for"""
+    seen = set()
+    stack = list(organizations)
+    while stack:
+        organization = stack.pop()
+        if organization.pk in seen:
+            continue
+        seen.add(organization.pk)
+        yield organization
+        # only follow relations that are loaded, so collecting costs no queries
+        if type(organization).parent.is_cached(organization):
+            if organization.parent is not None:
+                stack.append(organization.parent)
+        if "groups" in getattr(organization, "_prefetched_objects_cache", {}):
+            stack.extend(organization.groups.all())
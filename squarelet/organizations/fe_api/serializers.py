@@ -47,13 +47,7 @@ class OrganizationSerializer(serializers.ModelSerializer):
         )
 
     def get_admins(self, obj):
-        return [
-            user.pk
-            for user in obj.users.all()
-            if any(
-                m.admin and m.organization_id == obj.pk for m in user.memberships.all()
-            )
-        ]
+        return [user.pk for user in obj.get_admin_users()]
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
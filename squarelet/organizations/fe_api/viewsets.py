@@ -37,7 +37,8 @@ class OrganizationViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return (
             Organization.objects.get_viewable(self.request.user)
-            .prefetch_related("users__memberships")
+            .prefetch_related("users")
+            .prefetch_admins()
             .annotate(member_count=Count("users"))
         )
 
@@ -0,0 +1,197 @@
+"""Answering questions about the organization hierarchy in bulk
+
+Organizations inherit verification, hub eligibility and, where resources are
+shared, plans from their parents and their membership groups.  Rather than
+walking up the hierarchy a query or more per level, every organization's
+ancestors are kept in the OrganizationAncestor closure table, so each question
+below is a single query for any number of organizations.
+
+The signals on parent, share_resources and group membership changes call
+`refresh_hierarchy` to keep the table up to date.
+"""
+
+# Django
+from django.db import transaction
+from django.db.models import F
+
+# Standard Library
+from collections import defaultdict
+
+# Squarelet
+from squarelet.organizations.models import (
+    Organization,
+    OrganizationAncestor,
+    Subscription,
+)
+
+
+def refresh_hierarchy(organization):
+    """Recompute the ancestors of `organization`, and of every organization
+    below it on a chain of parents, after its parent, its groups or whether it
+    shares resources changed"""
+    below = list(
+        OrganizationAncestor.objects.filter(ancestor=organization, via_group=False)
+        .order_by("depth")
+        .values_list("descendant_id", flat=True)
+    )
+    pks = [organization.pk, *below]
+
+    parents = {}
+    sharing = {}
+    for pk, parent_id, share_resources in Organization.objects.filter(
+        pk__in=[*pks, organization.parent_id]
+    ).values_list("pk", "parent_id", "share_resources"):
+        parents[pk] = parent_id
+        sharing[pk] = share_resources
+    groups = defaultdict(list)
+    for member_id, group_id in Organization.members.through.objects.filter(
+        to_organization__in=pks
+    ).values_list("to_organization_id", "from_organization_id"):
+        groups[member_id].append(group_id)
+
+    # the rows of the organization's parent are unaffected - start from them
+    ancestors = {}
+    if parents.get(organization.pk):
+        ancestors[parents[organization.pk]] = list(
+            OrganizationAncestor.objects.filter(
+                descendant=parents[organization.pk]
+            ).values_list("ancestor_id", "depth", "via_group", "shared")
+        )
+    # nearest first, so each parent is computed before its children
+    for pk in pks:
+        rows = [(group_id, 0, True, True) for group_id in groups[pk]]
+        parent_id = parents.get(pk)
+        if parent_id is not None:
+            parent_shares = sharing.get(parent_id, False)
+            rows.append((parent_id, 1, False, parent_shares))
+            rows.extend(
+                (ancestor_id, depth + 1, via_group, parent_shares and shared)
+                for ancestor_id, depth, via_group, shared in ancestors.get(
+                    parent_id, []
+                )
+            )
+        ancestors[pk] = rows
+
+    with transaction.atomic():
+        OrganizationAncestor.objects.filter(descendant__in=pks).delete()
+        OrganizationAncestor.objects.bulk_create(
+            OrganizationAncestor(
+                descendant_id=pk,
+                ancestor_id=ancestor_id,
+                depth=depth,
+                via_group=via_group,
+                shared=shared,
+            )
+            for pk in pks
+            for ancestor_id, depth, via_group, shared in ancestors[pk]
+        )
+
+
+def get_ancestors(organizations):
+    """Every organization above each of `organizations`, nearest first
+
+    Returns a dict from organization pk to a list of organizations.
+    """
+    ancestors = {organization.pk: [] for organization in organizations}
+    seen = defaultdict(set)
+    for row in (
+        OrganizationAncestor.objects.filter(descendant__in=list(ancestors))
+        .select_related("ancestor")
+        .order_by("depth", "via_group", "ancestor__slug")
+    ):
+        if row.ancestor_id not in seen[row.descendant_id]:
+            seen[row.descendant_id].add(row.ancestor_id)
+            ancestors[row.descendant_id].append(row.ancestor)
+    return ancestors
+
+
+def _inherits(organizations, field):
+    """Which of `organizations` have `field` set, themselves or on an ancestor"""
+    inheriting = set(
+        OrganizationAncestor.objects.filter(
+            descendant__in=organizations, **{f"ancestor__{field}": True}
+        ).values_list("descendant_id", flat=True)
+    )
+    return {
+        organization.pk: bool(getattr(organization, field))
+        or organization.pk in inheriting
+        for organization in organizations
+    }
+
+
+def get_effective_verifications(organizations):
+    """Whether each of `organizations` is verified, directly or through a
+    parent or membership group
+
+    Returns a dict from organization pk to a boolean.
+    """
+    return _inherits(organizations, "verified_journalist")
+
+
+def get_hub_eligibilities(organizations):
+    """Whether each of `organizations` is hub eligible, directly or through a
+    parent or membership group
+
+    Returns a dict from organization pk to a boolean.
+    """
+    return _inherits(organizations, "hub_eligible")
+
+
+def _shared_subscriptions(organizations, **filters):
+    """The subscriptions of the ancestors sharing resources with each of
+    `organizations`, nearest first
+
+    An ancestor shares its resources if it has share_resources set, and so do
+    all of the parents between it and the organization.
+    """
+    return (
+        Subscription.objects.filter(
+            organization__descendant_links__descendant__in=organizations,
+            organization__descendant_links__shared=True,
+            organization__share_resources=True,
+            **filters,
+        )
+        .select_related("organization", "plan")
+        .annotate(
+            descendant_id=F("organization__descendant_links__descendant"),
+            depth=F("organization__descendant_links__depth"),
+            via_group=F("organization__descendant_links__via_group"),
+        )
+        .order_by("depth", "via_group", "organization__slug", "plan__slug")
+    )
+
+
+def get_inherited_plans(organizations):
+    """The paid plans each of `organizations` inherits from ancestors sharing
+    resources with it
+
+    Returns a dict from organization pk to a list of (source, plan) tuples.
+    Each source is listed where it is nearest, if it is reachable more than
+    one way.
+    """
+    inherited = {organization.pk: [] for organization in organizations}
+    nearest = defaultdict(dict)
+    for subscription in _shared_subscriptions(list(inherited)):
+        source = subscription.organization
+        position = (subscription.depth, subscription.via_group)
+        if nearest[subscription.descendant_id].setdefault(source.pk, position) != (
+            position
+        ):
+            continue
+        if not subscription.plan.free:
+            inherited[subscription.descendant_id].append((source, subscription.plan))
+    return inherited
+
+
+def get_wix_plans(organizations):
+    """The Wix plans each of `organizations` inherits from ancestors sharing
+    resources with it
+
+    Returns a dict from organization pk to a list of (source, plan) tuples.
+    """
+    wix_plans = {organization.pk: [] for organization in organizations}
+    for subscription in _shared_subscriptions(list(wix_plans), plan__wix=True):
+        wix_plans[subscription.descendant_id].append(
+            (subscription.organization, subscription.plan)
+        )
+    return wix_plans
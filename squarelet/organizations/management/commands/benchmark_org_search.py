@@ -0,0 +1,189 @@
+# Django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+# Standard Library
+import random
+import time
+
+# Third Party
+from fuzzywuzzy import fuzz, process
+
+# Squarelet
+from squarelet.organizations import search
+from squarelet.organizations.models import Organization
+
+WORDS = [
+    "Daily",
+    "Weekly",
+    "Tribune",
+    "Gazette",
+    "Herald",
+    "Times",
+    "Post",
+    "Journal",
+    "Observer",
+    "Chronicle",
+    "Courier",
+    "Press",
+    "News",
+    "Radio",
+    "Public",
+    "Media",
+    "Center",
+    "Investigative",
+    "Reporting",
+    "Foundation",
+    "Institute",
+    "Project",
+    "Collective",
+    "Network",
+    "Review",
+    "Sentinel",
+    "Ledger",
+    "Record",
+    "Examiner",
+    "Register",
+]
+PLACES = [
+    "Boston",
+    "Chicago",
+    "Denver",
+    "Atlanta",
+    "Portland",
+    "Austin",
+    "Phoenix",
+    "Seattle",
+    "Detroit",
+    "Memphis",
+    "Tucson",
+    "Fresno",
+    "Omaha",
+    "Raleigh",
+    "Tampa",
+]
+QUERIES = ["Tribune", "Boston Globe", "Investigativ Reportng", "Muckrock", "Omaha Her"]
+CHUNK_SIZE = 10000
+
+
+def full_scan_search(queryset, name, limit=10, score_cutoff=83):
+    """The previous implementation, which scores every name"""
+    group_orgs = dict(
+        queryset.filter(individual=False)
+        .values_list("pk", "name")
+        .iterator(chunk_size=200)
+    )
+    matches = process.extractBests(
+        name,
+        group_orgs,
+        limit=limit,
+        scorer=fuzz.partial_ratio,
+        score_cutoff=score_cutoff,
+    )
+    return [pk for _, _, pk in matches]
+
+
+class Command(BaseCommand):
+    """Compare the trigram organization search against a full scan
+
+    Generated organizations are inserted, in a transaction which is rolled
+    back at the end, until each of the given sizes is reached, and the
+    searches are timed at each size.  Unless the full scan is skipped, the
+    trigram search's results are also checked against it, and its recall -
+    the share of the full scan's results it found - is reported for each
+    query and overall.  Run against a scratch database - the inserts take
+    locks and a lot of space while running.
+    """
+
+    help = "Benchmark fuzzy organization search at increasing numbers of orgs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "sizes",
+            nargs="*",
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+            help="The numbers of organizations to benchmark at",
+        )
+        parser.add_argument(
+            "--skip-full-scan",
+            action="store_true",
+            help="Only time the trigram search",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            template = Organization.objects.create(name="Benchmark Template")
+            total = 0
+            for size in sorted(options["sizes"]):
+                while total < size:
+                    count = min(CHUNK_SIZE, size - total)
+                    self.insert_organizations(template, total, count, rng)
+                    total += count
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE organizations_organization")
+                self.stdout.write(f"{size} organizations")
+                found = expected = 0
+                for query in QUERIES:
+                    query_found, query_expected = self.time_search(
+                        query, options["skip_full_scan"]
+                    )
+                    found += query_found
+                    expected += query_expected
+                if not options["skip_full_scan"]:
+                    self.stdout.write(f"  recall {self.recall(found, expected)}")
+            transaction.set_rollback(True)
+
+    def insert_organizations(self, template, offset, count, rng):
+        """Insert `count` copies of `template` with generated names, using
+        SQL to avoid the per row uniqueness checks of the slug field"""
+        names = [
+            " ".join([rng.choice(PLACES)] + rng.sample(WORDS, rng.randint(1, 3)))
+            for _ in range(count)
+        ]
+        columns = [
+            f.column
+            for f in Organization._meta.concrete_fields
+            if f.column not in ("id", "uuid", "name", "slug")
+        ]
+        column_list = ", ".join(connection.ops.quote_name(c) for c in columns)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO organizations_organization "
+                f"(uuid, name, slug, {column_list}) "
+                f"SELECT gen_random_uuid(), n.name, "
+                f"'benchmark-' || (%s + n.i), {column_list} "
+                f"FROM organizations_organization, "
+                f"unnest(%s::text[]) WITH ORDINALITY AS n(name, i) "
+                f"WHERE id = %s",
+                [offset, names, template.pk],
+            )
+
+    def time_search(self, query, skip_full_scan):
+        """Time one query, returning how many of the full scan's results the
+        trigram search found, and how many there were"""
+        organizations = Organization.objects.filter(individual=False)
+        start = time.perf_counter()
+        results = search.fuzzy_search(organizations, query)
+        line = f"  {query!r}: trigram {self.elapsed(start)} ({len(results)})"
+        found = expected = 0
+        if not skip_full_scan:
+            start = time.perf_counter()
+            full_scan = full_scan_search(organizations, query)
+            line += f", full scan {self.elapsed(start)} ({len(full_scan)})"
+            found = len(set(results) & set(full_scan))
+            expected = len(full_scan)
+            line += f", recall {self.recall(found, expected)}"
+        self.stdout.write(line)
+        return found, expected
+
+    @staticmethod
+    def recall(found, expected):
+        if not expected:
+            return "n/a"
+        return f"{found / expected:.0%}"
+
+    @staticmethod
+    def elapsed(start):
+        return f"{(time.perf_counter() - start) * 1000:.0f}ms"
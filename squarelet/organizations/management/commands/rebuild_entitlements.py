@@ -0,0 +1,51 @@
+# Django
+from django.core.management.base import BaseCommand, CommandError
+
+# Squarelet
+from squarelet.organizations.entitlements import refresh_entitlements
+from squarelet.organizations.models import Organization
+
+
+class Command(BaseCommand):
+    """Recompute the materialized entitlements of every organization
+
+    Signals keep the OrganizationEntitlement table up to date, but changes
+    which bypass them (queryset updates, raw SQL, restoring a backup) can
+    leave it stale.  This recomputes every organization's entitlements from
+    its subscriptions and the matching grants, and rewrites the rows which
+    differ.  With --verify, nothing is written, and the command fails if any
+    organization is out of date.
+    """
+
+    help = "Rebuild or verify the materialized organization entitlements"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Report out of date organizations without rewriting them",
+        )
+        parser.add_argument(
+            "--organization",
+            action="append",
+            dest="uuids",
+            metavar="UUID",
+            help="Only rebuild this organization (may be given more than once)",
+        )
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by("pk")
+        if options["uuids"]:
+            organizations = organizations.filter(uuid__in=options["uuids"])
+
+        stale = refresh_entitlements(organizations, dry_run=options["verify"])
+
+        if options["verify"]:
+            if stale:
+                raise CommandError(
+                    f"{len(stale)} organizations have out of date entitlements: "
+                    + ", ".join(str(pk) for pk in stale[:20])
+                )
+            self.stdout.write("All organization entitlements are up to date")
+            return
+        self.stdout.write(f"Rebuilt entitlements for {len(stale)} organizations")
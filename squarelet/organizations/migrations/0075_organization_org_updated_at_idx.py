@@ -0,0 +1,21 @@
+# Generated by Django 5.2.12 on 2026-10-17 07:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0074_merge_20260724_1500"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="organization",
+            index=models.Index(
+                fields=["updated_at", "uuid"], name="org_updated_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,140 @@
+# Generated by Django 5.2.12 on 2026-10-17 08:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_organization_entitlements(apps, schema_editor):
+    """Materialize every organization's plan and grant entitlements"""
+    Subscription = apps.get_model("organizations", "Subscription")
+    EntitlementGrant = apps.get_model("organizations", "EntitlementGrant")
+    Organization = apps.get_model("organizations", "Organization")
+    OrganizationEntitlement = apps.get_model("organizations", "OrganizationEntitlement")
+    PlanEntitlement = apps.get_model("organizations", "Plan").entitlements.through
+
+    plan_entitlements = {}
+    for plan_id, entitlement_id in PlanEntitlement.objects.values_list(
+        "plan_id", "entitlement_id"
+    ):
+        plan_entitlements.setdefault(plan_id, []).append(entitlement_id)
+    OrganizationEntitlement.objects.bulk_create(
+        (
+            OrganizationEntitlement(
+                organization_id=organization_id,
+                entitlement_id=entitlement_id,
+                source="plan",
+                quantity=quantity,
+            )
+            for organization_id, plan_id, quantity in Subscription.objects.values_list(
+                "organization_id", "plan_id", "quantity"
+            ).iterator()
+            for entitlement_id in plan_entitlements.get(plan_id, [])
+        ),
+        batch_size=1000,
+    )
+
+    granted = set()
+    for grant in EntitlementGrant.objects.filter(active=True):
+        eligible = Organization.objects.all()
+        if not grant.for_individuals:
+            eligible = eligible.filter(individual=False)
+        if not grant.for_groups:
+            eligible = eligible.filter(individual=True)
+        matching = models.Q(entitlement_grants=grant)
+        if grant.require_verified or grant.require_active_subscription:
+            rule = models.Q()
+            if grant.require_verified:
+                rule &= models.Q(verified_journalist=True)
+            if grant.require_active_subscription:
+                rule &= models.Q(subscriptions__isnull=False)
+            matching |= rule
+        entitlement_ids = list(grant.entitlements.values_list("pk", flat=True))
+        for organization_id in (
+            eligible.filter(matching).values_list("pk", flat=True).distinct()
+        ):
+            granted.update((organization_id, e) for e in entitlement_ids)
+    OrganizationEntitlement.objects.bulk_create(
+        (
+            OrganizationEntitlement(
+                organization_id=organization_id,
+                entitlement_id=entitlement_id,
+                source="grant",
+            )
+            for organization_id, entitlement_id in granted
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0075_organization_org_updated_at_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrganizationEntitlement",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("plan", "Plan"), ("grant", "Grant")],
+                        help_text="Whether the entitlement comes from a plan or a grant",
+                        max_length=5,
+                        verbose_name="source",
+                    ),
+                ),
+                (
+                    "quantity",
+                    models.PositiveIntegerField(
+                        default=1,
+                        help_text="Number of units of the entitlement's resources",
+                        verbose_name="quantity",
+                    ),
+                ),
+                (
+                    "entitlement",
+                    models.ForeignKey(
+                        help_text="The entitlement the organization has access to",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="organization_entitlements",
+                        to="organizations.entitlement",
+                        verbose_name="entitlement",
+                    ),
+                ),
+                (
+                    "organization",
+                    models.ForeignKey(
+                        help_text="The organization with access to the entitlement",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="resolved_entitlements",
+                        to="organizations.organization",
+                        verbose_name="organization",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        condition=models.Q(("source", "grant")),
+                        fields=("organization", "entitlement"),
+                        name="unique_grant_entitlement",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            populate_organization_entitlements,
+            migrations.RunPython.noop,
+        ),
+    ]
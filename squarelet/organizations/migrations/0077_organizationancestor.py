@@ -0,0 +1,141 @@
+# Generated by Django 5.2.12 on 2026-10-17 08:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_organization_ancestors(apps, schema_editor):
+    """Compute every organization's ancestors, from the top of each chain of
+    parents down"""
+    Organization = apps.get_model("organizations", "Organization")
+    OrganizationAncestor = apps.get_model("organizations", "OrganizationAncestor")
+    Members = Organization.members.through
+
+    parents = {}
+    sharing = {}
+    for pk, parent_id, share_resources in Organization.objects.values_list(
+        "pk", "parent_id", "share_resources"
+    ).iterator():
+        parents[pk] = parent_id
+        sharing[pk] = share_resources
+    groups = {}
+    for member_id, group_id in Members.objects.values_list(
+        "to_organization_id", "from_organization_id"
+    ).iterator():
+        groups.setdefault(member_id, []).append(group_id)
+
+    ancestors = {}
+
+    def compute(pk):
+        # walk up to the nearest computed parent, guarding against cycles
+        chain = []
+        while pk is not None and pk not in ancestors and pk not in chain:
+            chain.append(pk)
+            pk = parents.get(pk)
+        for pk in reversed(chain):
+            rows = [(group_id, 0, True, True) for group_id in groups.get(pk, [])]
+            parent_id = parents[pk]
+            if parent_id is not None:
+                parent_shares = sharing.get(parent_id, False)
+                rows.append((parent_id, 1, False, parent_shares))
+                rows.extend(
+                    (ancestor_id, depth + 1, via_group, parent_shares and shared)
+                    for ancestor_id, depth, via_group, shared in ancestors.get(
+                        parent_id, []
+                    )
+                )
+            ancestors[pk] = rows
+
+    for pk in parents:
+        compute(pk)
+
+    OrganizationAncestor.objects.bulk_create(
+        (
+            OrganizationAncestor(
+                descendant_id=pk,
+                ancestor_id=ancestor_id,
+                depth=depth,
+                via_group=via_group,
+                shared=shared,
+            )
+            for pk, rows in ancestors.items()
+            for ancestor_id, depth, via_group, shared in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0076_organizationentitlement"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OrganizationAncestor",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "depth",
+                    models.PositiveSmallIntegerField(
+                        help_text="How many parents up the chain the ancestor is, or the parent whose group it is - 0 for the descendant's own groups",
+                        verbose_name="depth",
+                    ),
+                ),
+                (
+                    "via_group",
+                    models.BooleanField(
+                        help_text="The ancestor is a membership group, rather than a parent",
+                        verbose_name="via group",
+                    ),
+                ),
+                (
+                    "shared",
+                    models.BooleanField(
+                        help_text="Every parent up the chain to the ancestor shares resources with its children",
+                        verbose_name="shared",
+                    ),
+                ),
+                (
+                    "ancestor",
+                    models.ForeignKey(
+                        help_text="The organization higher in the hierarchy",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="descendant_links",
+                        to="organizations.organization",
+                        verbose_name="ancestor",
+                    ),
+                ),
+                (
+                    "descendant",
+                    models.ForeignKey(
+                        help_text="The organization lower in the hierarchy",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ancestor_links",
+                        to="organizations.organization",
+                        verbose_name="descendant",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["ancestor", "via_group"],
+                        name="org_ancestor_descendants_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(
+            populate_organization_ancestors, migrations.RunPython.noop
+        ),
+    ]
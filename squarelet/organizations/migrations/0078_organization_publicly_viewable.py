@@ -0,0 +1,56 @@
+# Generated by Django 5.2.12 on 2026-10-17 08:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_publicly_viewable(apps, schema_editor):
+    """Flag public organizations which are verified or have made a payment"""
+    Organization = apps.get_model("organizations", "Organization")
+    Charge = apps.get_model("organizations", "Charge")
+    Invoice = apps.get_model("organizations", "Invoice")
+    Organization.objects.update(
+        publicly_viewable=models.ExpressionWrapper(
+            models.Q(private=False)
+            & (
+                models.Q(verified_journalist=True)
+                | models.Exists(
+                    Charge.objects.filter(organization=models.OuterRef("pk"))
+                )
+                | models.Exists(
+                    Invoice.objects.filter(
+                        organization=models.OuterRef("pk"), status="paid"
+                    )
+                )
+            ),
+            output_field=models.BooleanField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0077_organizationancestor"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="organization",
+            name="publicly_viewable",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                help_text="This organization is public, and is verified or has made a payment - kept up to date by signals, see OrganizationQuerySet.get_viewable",
+                verbose_name="publicly viewable",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="organization",
+            index=models.Index(
+                fields=["publicly_viewable", "slug"], name="org_publicly_viewable_idx"
+            ),
+        ),
+        migrations.RunPython(populate_publicly_viewable, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.12 on 2026-10-17 08:58
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.operations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0078_organization_publicly_viewable"),
+    ]
+
+    operations = [
+        django.contrib.postgres.operations.TrigramExtension(),
+        migrations.AddIndex(
+            model_name="organization",
+            index=django.contrib.postgres.indexes.GinIndex(
+                condition=models.Q(("individual", False)),
+                fields=["name"],
+                name="org_name_trgm_idx",
+                opclasses=["gin_trgm_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.12 on 2026-10-17 09:40
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0079_organization_name_trgm_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="organization",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Lower("name"),
+                    name="gin_trgm_ops",
+                ),
+                condition=models.Q(("individual", False)),
+                name="org_lower_name_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.12 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0080_organization_lower_name_trgm_idx"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="organization",
+            index=models.Index(
+                fields=["updated_at", "id"], name="org_updated_at_id_idx"
+            ),
+        ),
+    ]
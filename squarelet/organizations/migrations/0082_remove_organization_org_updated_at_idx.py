@@ -0,0 +1,17 @@
+# Generated by Django 5.2.12 on 2026-10-17 14:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("organizations", "0081_organization_org_updated_at_id_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="organization",
+            name="org_updated_at_idx",
+        ),
+    ]
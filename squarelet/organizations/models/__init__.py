@@ -1,5 +1,6 @@
 # Squarelet
 from squarelet.organizations.models.changelog import *
+from squarelet.organizations.models.hierarchy import *
 from squarelet.organizations.models.invitation import *
 from squarelet.organizations.models.invoice import *
 from squarelet.organizations.models.membership import *
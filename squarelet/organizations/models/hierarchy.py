@@ -0,0 +1,57 @@
+# Django
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class OrganizationAncestor(models.Model):
+    """A closure table of the organization hierarchy
+
+    Each organization has a row for every organization above it: each parent
+    up its parent chain, and the membership groups of itself and of each of
+    those parents.  Groups' own parents and groups are not inherited from.
+    Rows are kept up to date by signals on parent, share_resources and group
+    membership changes - see `squarelet.organizations.hierarchy`.
+    """
+
+    descendant = models.ForeignKey(
+        verbose_name=_("descendant"),
+        to="organizations.Organization",
+        on_delete=models.CASCADE,
+        related_name="ancestor_links",
+        help_text=_("The organization lower in the hierarchy"),
+    )
+    ancestor = models.ForeignKey(
+        verbose_name=_("ancestor"),
+        to="organizations.Organization",
+        on_delete=models.CASCADE,
+        related_name="descendant_links",
+        help_text=_("The organization higher in the hierarchy"),
+    )
+    depth = models.PositiveSmallIntegerField(
+        _("depth"),
+        help_text=_(
+            "How many parents up the chain the ancestor is, or the parent whose "
+            "group it is - 0 for the descendant's own groups"
+        ),
+    )
+    via_group = models.BooleanField(
+        _("via group"),
+        help_text=_("The ancestor is a membership group, rather than a parent"),
+    )
+    shared = models.BooleanField(
+        _("shared"),
+        help_text=_(
+            "Every parent up the chain to the ancestor shares resources with its "
+            "children"
+        ),
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["ancestor", "via_group"], name="org_ancestor_descendants_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor} > {self.descendant}"
@@ -1,5 +1,7 @@
 # Django
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models, transaction
+from django.db.models.functions import Lower
 from django.templatetags.static import static
 from django.urls import reverse
 from django.utils import timezone
@@ -22,6 +24,7 @@ from squarelet.core.fields import AutoCreatedField, AutoLastModifiedField
 from squarelet.core.mixins import AvatarMixin
 from squarelet.core.utils import file_path, mailchimp_journey
 from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.oidc.utils import queue_cache_invalidations
 from squarelet.organizations.choices import (
     COUNTRY_CHOICES,
     STATE_CHOICES,
@@ -199,6 +202,15 @@ class Organization(AvatarMixin, models.Model):
         default=False,
         help_text=_("This organization is a verified journalistic organization"),
     )
+    publicly_viewable = models.BooleanField(
+        _("publicly viewable"),
+        default=False,
+        editable=False,
+        help_text=_(
+            "This organization is public, and is verified or has made a payment - "
+            "kept up to date by signals, see OrganizationQuerySet.get_viewable"
+        ),
+    )
 
     # Book keeping
     max_users = models.IntegerField(
@@ -290,6 +302,27 @@ class Organization(AvatarMixin, models.Model):
 
     class Meta:
         ordering = ("slug",)
+        indexes = [
+            # the API lists organizations in (updated_at, pk) order
+            models.Index(fields=["updated_at", "id"], name="org_updated_at_id_idx"),
+            # visibility filtering, in the default ordering
+            models.Index(
+                fields=["publicly_viewable", "slug"], name="org_publicly_viewable_idx"
+            ),
+            # fuzzy name search, see squarelet.organizations.search
+            GinIndex(
+                fields=["name"],
+                opclasses=["gin_trgm_ops"],
+                condition=models.Q(individual=False),
+                name="org_name_trgm_idx",
+            ),
+            # autocomplete, see squarelet.organizations.views.autocomplete
+            GinIndex(
+                OpClass(Lower("name"), name="gin_trgm_ops"),
+                condition=models.Q(individual=False),
+                name="org_lower_name_trgm_idx",
+            ),
+        ]
         permissions = (
             ("merge_organization", "Can merge organizations"),
             ("can_manage_members", "Can manage organization members"),
@@ -327,9 +360,7 @@ class Organization(AvatarMixin, models.Model):
 
         with transaction.atomic():
             super().save(*args, **kwargs)
-            transaction.on_commit(
-                lambda: send_cache_invalidations("organization", self.uuid)
-            )
+            queue_cache_invalidations("organization", self.uuid)
 
             # If share_resources was toggled ON, sync all wix-enabled plans to members
             if share_resources_toggled_on and self.collective_enabled:
@@ -398,6 +429,12 @@ class Organization(AvatarMixin, models.Model):
         """Is the given user an admin of this organization"""
         return self.users.filter(pk=user.pk, memberships__admin=True).exists()
 
+    def get_admin_users(self):
+        """The organization's admins, from `prefetch_admins` if it was used"""
+        if hasattr(self, "admin_memberships"):
+            return [m.user for m in self.admin_memberships]
+        return self.users.filter(memberships__admin=True)
+
     def has_member(self, user):
         """Is the user a member?"""
         return self.users.filter(pk=user.pk).exists()
@@ -785,11 +822,12 @@ class Organization(AvatarMixin, models.Model):
             mailchimp_journey(email, "verified")
 
     def is_hub_eligible(self):
-        return bool(
-            self.hub_eligible
-            or self.groups.filter(hub_eligible=True).exists()
-            or (self.parent and self.parent.is_hub_eligible)
-        )
+        """Is this org, one of its parents or one of their groups hub eligible"""
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.hierarchy import get_hub_eligibilities
+
+        return get_hub_eligibilities([self])[self.pk]
 
     # Organization Collective Methods
 
@@ -802,19 +840,11 @@ class Organization(AvatarMixin, models.Model):
         - Any group the org belongs to is verified (automatic inheritance), OR
         - Org's parent is verified (recursive)
         """
-        # Direct verification
-        if self.verified_journalist:
-            return True
-
-        # Check membership groups (automatic inheritance)
-        if self.groups.filter(verified_journalist=True).exists():
-            return True
-
-        # Check parent (recursive)
-        if self.parent:
-            return self.parent.get_effective_verification()
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.hierarchy import get_effective_verifications
 
-        return False
+        return get_effective_verifications([self])[self.pk]
 
     def can_invite_org_members(self, user):
         """
@@ -832,23 +862,13 @@ class Organization(AvatarMixin, models.Model):
         - Have share_resources=True
         - Have a plan with plan.wix=True
         """
-        wix_plans = []
-
-        # Check membership groups
-        for group in self.groups.filter(share_resources=True):
-            for plan in group.plans.filter(wix=True):
-                wix_plans.append((group, plan))
-
-        # Check parent hierarchy (recursive)
-        if self.parent and self.parent.share_resources:
-            for plan in self.parent.plans.filter(wix=True):
-                wix_plans.append((self.parent, plan))
-            # Also get parent's groups recursively
-            wix_plans.extend(self.parent.get_wix_plans_from_groups())
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.hierarchy import get_wix_plans
 
-        return wix_plans
+        return get_wix_plans([self])[self.pk]
 
-    def get_inherited_plans(self, _seen=None):
+    def get_inherited_plans(self):
         """
         Return [(source_org, plan), ...] for plans inherited from membership groups
         or parent orgs that have share_resources=True.
@@ -856,29 +876,11 @@ class Organization(AvatarMixin, models.Model):
         Unlike get_wix_plans_from_groups, this is not filtered to Wix plans -- any
         paid plan from a sharing source is included.
         """
-        # Set up variables for recursive traversal
-        if _seen is None:
-            _seen = set()
-        inherited = []
-
-        def _add(source):
-            if source.pk in _seen:
-                return
-            _seen.add(source.pk)
-            for plan in source.plans.all():
-                if not plan.free:
-                    inherited.append((source, plan))
-
-        # Membership groups that share resources
-        for group in self.groups.filter(share_resources=True).prefetch_related("plans"):
-            _add(group)
-
-        # Parent hierarchy (recursive)
-        if self.parent and self.parent.share_resources:
-            _add(self.parent)
-            inherited.extend(self.parent.get_inherited_plans(_seen))
-
-        return inherited
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.hierarchy import get_inherited_plans
+
+        return get_inherited_plans([self])[self.pk]
 
     def has_member_by_email(self, email):
         """Check if a user with an email is already a member of the organization."""
@@ -904,6 +906,9 @@ class Organization(AvatarMixin, models.Model):
     @transaction.atomic
     def merge(self, org, user):
         """Merge another organization into this one"""
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.hierarchy import refresh_hierarchy
 
         if org.subscriptions.exists():
             raise ValueError(f"{org} has active subscriptions and may not be merged")
@@ -962,6 +967,7 @@ class Organization(AvatarMixin, models.Model):
             "subtypes",
             "entitlement_grants",
         ]
+        children = list(org.children.all())
         for m2m in m2m_relations:
             getattr(self, m2m).add(*getattr(org, m2m).all())
             getattr(org, m2m).clear()
@@ -973,3 +979,9 @@ class Organization(AvatarMixin, models.Model):
 
         org.save()
         self.save()
+
+        # children and charges are moved with queryset updates, which send no
+        # signals
+        for child in children:
+            refresh_hierarchy(child)
+        Organization.objects.filter(pk=self.pk).refresh_publicly_viewable()
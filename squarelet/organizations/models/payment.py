@@ -19,6 +19,7 @@ from autoslug import AutoSlugField
 # Squarelet
 from squarelet.core.mail import ORG_TO_RECEIPTS, send_mail
 from squarelet.core.utils import is_production_env, mailchimp_journey
+from squarelet.organizations.choices import EntitlementSource
 from squarelet.organizations.payments.base import PaymentActionRequired
 from squarelet.organizations.payments.factory import get_payment_provider
 from squarelet.organizations.querysets import (
@@ -1069,6 +1070,55 @@ class EntitlementGrant(models.Model):
         return eligible.filter(explicit_q)
 
 
+class OrganizationEntitlement(models.Model):
+    """An entitlement currently available to an organization
+
+    A materialization of plan subscriptions and matching grants, kept up to
+    date by signals on the models they are derived from, so reads need not
+    re-evaluate grant rules.  There is one row per subscription for each plan
+    entitlement, and at most one row per organization for each grant
+    entitlement.  `manage.py rebuild_entitlements` recomputes the table.
+    """
+
+    organization = models.ForeignKey(
+        verbose_name=_("organization"),
+        to="organizations.Organization",
+        on_delete=models.CASCADE,
+        related_name="resolved_entitlements",
+        help_text=_("The organization with access to the entitlement"),
+    )
+    entitlement = models.ForeignKey(
+        verbose_name=_("entitlement"),
+        to="organizations.Entitlement",
+        on_delete=models.CASCADE,
+        related_name="organization_entitlements",
+        help_text=_("The entitlement the organization has access to"),
+    )
+    source = models.CharField(
+        _("source"),
+        max_length=5,
+        choices=EntitlementSource.choices,
+        help_text=_("Whether the entitlement comes from a plan or a grant"),
+    )
+    quantity = models.PositiveIntegerField(
+        _("quantity"),
+        default=1,
+        help_text=_("Number of units of the entitlement's resources"),
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["organization", "entitlement"],
+                condition=Q(source=EntitlementSource.grant),
+                name="unique_grant_entitlement",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.organization} - {self.entitlement} ({self.source})"
+
+
 class ReceiptEmail(models.Model):
     """An email address to send receipts to"""
 
@@ -1,7 +1,8 @@
 # Django
 from django.contrib.auth.models import AnonymousUser
 from django.db import models
-from django.db.models import Q
+from django.db.models import Exists, ExpressionWrapper, F, OuterRef, Prefetch, Q, Value
+from django.db.models.functions import Lower, StrIndex, Substr
 from django.utils import timezone
 from django.utils.timezone import get_current_timezone
 
@@ -9,64 +10,133 @@ from django.utils.timezone import get_current_timezone
 from datetime import datetime, timedelta
 from uuid import uuid4
 
-# Third Party
-from fuzzywuzzy import fuzz, process
-
 # Squarelet
+from squarelet.organizations import search
 from squarelet.organizations.choices import ChangeLogReason
 from squarelet.organizations.payments.factory import get_payment_provider
 
 # pylint:disable=too-many-positional-arguments
 
 
+def _verified_email_domains(user):
+    """A subquery of the lower cased domains of the user's verified emails"""
+    email = F("email")
+    return (
+        user.emailaddress_set.filter(verified=True)
+        .annotate(domain=Lower(Substr(email, StrIndex(email, Value("@")) + 1)))
+        .values("domain")
+    )
+
+
 class OrganizationQuerySet(models.QuerySet):
     def get_viewable(self, user):
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.models.membership import Membership
+        from squarelet.organizations.models.organization_metadata import (
+            OrganizationEmailDomain,
+        )
+
         if user.is_staff:
             # staff can always view all organizations
             return self
 
-        qs = self
         if user.is_authenticated:
             # other users may not see private organizations unless they are a member
             # or they can auto join that org
             # and they can only see public organizations that are visible
-            # (verified or have charges or paid invoices)
-            viewable_filter = (
-                Q(private=False, verified_journalist=True)
-                | Q(private=False, charges__isnull=False)
-                | Q(private=False, invoices__status="paid")
-                | Q(users=user)
+            # (verified or have charges or paid invoices - see
+            # refresh_publicly_viewable)
+            viewable_filter = Q(publicly_viewable=True) | Exists(
+                Membership.objects.filter(organization=OuterRef("pk"), user=user)
             )
 
-            # Include auto-join orgs (pre-approved) in the same filter
+            # Include auto-join orgs (pre-approved) in the same filter, matching
+            # their domains against the user's verified emails in the database
             if hasattr(user, "can_auto_join"):
-                auto_join_pks = [org.pk for org in qs if user.can_auto_join(org)]
-                if auto_join_pks:
-                    viewable_filter |= Q(pk__in=auto_join_pks)
-
-            return qs.filter(viewable_filter).distinct()
+                viewable_filter |= Q(allow_auto_join=True) & Exists(
+                    OrganizationEmailDomain.objects.filter(
+                        organization=OuterRef("pk"),
+                        domain__in=_verified_email_domains(user),
+                    )
+                )
+
+            return self.filter(viewable_filter)
         else:
-            return qs.filter(
-                Q(private=False, verified_journalist=True)
-                | Q(private=False, charges__isnull=False)
-                | Q(private=False, invoices__status="paid")
-            ).distinct()
+            return self.filter(publicly_viewable=True)
+
+    def refresh_publicly_viewable(self):
+        """Recompute the publicly viewable flag of these organizations: public,
+        and verified or with a charge or a paid invoice"""
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.models.invoice import Invoice
+        from squarelet.organizations.models.payment import Charge
+
+        return self.update(
+            publicly_viewable=ExpressionWrapper(
+                Q(private=False)
+                & (
+                    Q(verified_journalist=True)
+                    | Exists(Charge.objects.filter(organization=OuterRef("pk")))
+                    | Exists(
+                        Invoice.objects.filter(
+                            organization=OuterRef("pk"), status="paid"
+                        )
+                    )
+                ),
+                output_field=models.BooleanField(),
+            )
+        )
+
+    def prefetch_api(self, depth=2):
+        """Prefetch everything the API's organization serializers read, so
+        serializing many organizations costs a fixed number of queries
+
+        Parents and groups are serialized in full themselves, and are
+        prefetched the same way `depth` levels deep.
+        """
+        lookups = ["subtypes__type", "urls", "customers"]
+        if depth > 0:
+            nested = self.model.objects.prefetch_api(depth - 1)
+            lookups += [
+                Prefetch("parent", queryset=nested),
+                Prefetch("groups", queryset=nested),
+            ]
+        return (
+            self.select_related("merged").prefetch_related(*lookups).prefetch_admins()
+        )
+
+    def prefetch_admins(self):
+        """Prefetch each organization's admin memberships, with their users,
+        into `admin_memberships`, ordered as `users` is
+
+        Only admins are loaded, so listing them costs one small query
+        however many members, and memberships elsewhere, the organizations have.
+        """
+        # Lazy import to avoid a circular import (membership.py imports this module)
+        # pylint: disable=import-outside-toplevel
+        # Squarelet
+        from squarelet.organizations.models.membership import Membership
+
+        return self.prefetch_related(
+            Prefetch(
+                "memberships",
+                queryset=Membership.objects.filter(admin=True)
+                .select_related("user")
+                .order_by("user__username"),
+                to_attr="admin_memberships",
+            )
+        )
 
     def fuzzy_search(self, name, limit=10, score_cutoff=83):
         """Fuzzy search for non-individual organizations by name"""
-        group_orgs = dict(
-            self.filter(individual=False)
-            .values_list("pk", "name")
-            .iterator(chunk_size=200)
-        )
-        matching_orgs = process.extractBests(
+        matched_pks = search.fuzzy_search(
+            self.filter(individual=False),
             name,
-            group_orgs,
             limit=limit,
-            scorer=fuzz.partial_ratio,
             score_cutoff=score_cutoff,
         )
-        matched_pks = [pk for _, _, pk in matching_orgs]
         if not matched_pks:
             return self.none()
         # Preserve match order using CASE/WHEN
@@ -170,13 +240,7 @@ class EntitlementQuerySet(models.QuerySet):
     def for_organization(self, org, client=None):
         """Return the deduped union of plan-derived and grant-derived entitlements
         currently available to `org`. Optionally scoped to a single OIDC client."""
-        # Lazy import to avoid a circular import (payment.py imports this module)
-        # pylint: disable=import-outside-toplevel
-        # Squarelet
-        from squarelet.organizations.models.payment import EntitlementGrant
-
-        matching_grants = EntitlementGrant.objects.for_org(org)
-        qs = self.filter(Q(plans__organizations=org) | Q(grants__in=matching_grants))
+        qs = self.filter(organization_entitlements__organization=org)
         if client is not None:
             qs = qs.filter(client=client)
         return qs.distinct()
@@ -0,0 +1,80 @@
+"""Fuzzy searching organizations by name
+
+Scoring every organization's name with fuzzywuzzy on each search costs time
+and memory in proportion to the number of organizations.  Instead, the
+database picks a bounded set of candidates by trigram word similarity, and
+only those are scored with `fuzz.partial_ratio`.
+
+`partial_ratio` scores the shorter string against the best matching part of
+the longer, so the prefilter matches both ways: names containing something
+close to the query, which the trigram index on the name can find (see
+Organization.Meta.indexes), and names close to a part of the query - "ACLU"
+for "ACLU of Northern California".  The index cannot find the second kind,
+so the database checks each name, which is still far cheaper than scoring
+each name in Python.  A name is ranked by the closer of the two.
+
+This is a prefilter, not an exact one: a name which `partial_ratio` scores
+above the cutoff may still fall under the candidate threshold, or below the
+CANDIDATE_LIMIT most similar names.  benchmark_org_search reports how often
+the results differ from scoring every name.
+"""
+
+# Django
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Greatest
+
+# Third Party
+from fuzzywuzzy import fuzz, process
+
+# the word similarity a name must have to the query, or the query to the
+# name, to be scored
+CANDIDATE_THRESHOLD = 0.3
+# the most candidates scored per search, most similar first
+CANDIDATE_LIMIT = 250
+
+
+def get_candidates(queryset, name, limit=CANDIDATE_LIMIT):
+    """The (pk, name) pairs from `queryset` whose names are most similar to
+    `name`, in either direction"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        # the threshold the index lookup below uses - set locally in a
+        # savepoint which is rolled back, so it does not outlast this query
+        cursor.execute(
+            "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+            [str(CANDIDATE_THRESHOLD)],
+        )
+        candidates = list(
+            queryset.annotate(
+                # the query within the name, and the name within the query
+                query_similarity=TrigramWordSimilarity(name, "name"),
+                name_similarity=TrigramWordSimilarity(F("name"), Value(name)),
+            )
+            .filter(
+                Q(name__trigram_word_similar=name)
+                | Q(name_similarity__gte=CANDIDATE_THRESHOLD)
+            )
+            .annotate(similarity=Greatest("query_similarity", "name_similarity"))
+            .order_by("-similarity", "pk")
+            .values_list("pk", "name")[:limit]
+        )
+        transaction.set_rollback(True)
+    return candidates
+
+
+def fuzzy_search(queryset, name, limit=10, score_cutoff=83):
+    """The pks of the organizations in `queryset` whose names best match
+    `name`, best first
+
+    Names are scored with `fuzz.partial_ratio`, and only those scoring at
+    least `score_cutoff` are returned.
+    """
+    matches = process.extractBests(
+        name,
+        dict(get_candidates(queryset, name)),
+        limit=limit,
+        scorer=fuzz.partial_ratio,
+        score_cutoff=score_cutoff,
+    )
+    return [pk for _, _, pk in matches]
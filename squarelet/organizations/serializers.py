@@ -1,3 +1,6 @@
+# Django
+from django.db.models import Manager
+
 # Standard Library
 from datetime import date
 
@@ -8,8 +11,11 @@ from rest_framework.exceptions import APIException
 
 # Squarelet
 from squarelet.core.utils import format_stripe_error
+from squarelet.organizations.entitlements import (
+    EntitlementResolver,
+    organizations_to_resolve,
+)
 from squarelet.organizations.models import Charge, Membership, Organization
-from squarelet.organizations.models.payment import EntitlementGrant
 from squarelet.organizations.payments.base import PaymentActionRequired
 
 
@@ -21,6 +27,11 @@ def _default_update_on():
     return date(today.year, today.month + 1, 1)
 
 
+def get_entitlement_resolver(context):
+    """The resolver shared by every serializer rendering with `context`"""
+    return context.setdefault("entitlement_resolver", EntitlementResolver())
+
+
 class OrganizationSerializer(serializers.ModelSerializer):
     uuid = serializers.UUIDField(required=False)
     merged = serializers.SlugRelatedField(read_only=True, slug_field="uuid")
@@ -65,10 +76,7 @@ class OrganizationSerializer(serializers.ModelSerializer):
                 "name": user.get_full_name() or user.username,
                 "email": user.email,
             }
-            for user in obj.users.all()
-            if any(
-                m.admin and m.organization_id == obj.pk for m in user.memberships.all()
-            )
+            for user in obj.get_admin_users()
         ]
 
     def get_parent(self, obj):
@@ -83,6 +91,17 @@ class OrganizationSerializer(serializers.ModelSerializer):
         ).data
 
 
+class OrganizationDetailListSerializer(serializers.ListSerializer):
+    # pylint: disable=abstract-method
+    def to_representation(self, data):
+        organizations = list(data.all() if isinstance(data, Manager) else data)
+        # resolve the entitlements of every organization in the list together
+        get_entitlement_resolver(self.context).add(
+            organizations_to_resolve(organizations)
+        )
+        return super().to_representation(organizations)
+
+
 class OrganizationDetailSerializer(OrganizationSerializer):
     update_on = serializers.SerializerMethodField()
     entitlements = serializers.SerializerMethodField()
@@ -99,6 +118,13 @@ class OrganizationDetailSerializer(OrganizationSerializer):
             "urls",
             "location",
         )
+        list_serializer_class = OrganizationDetailListSerializer
+
+    def to_representation(self, instance):
+        resolver = get_entitlement_resolver(self.context)
+        if instance not in resolver:
+            resolver.add(organizations_to_resolve([instance]))
+        return super().to_representation(instance)
 
     def get_update_on(self, obj):
         return obj.update_on or _default_update_on()
@@ -124,54 +150,43 @@ class OrganizationDetailSerializer(OrganizationSerializer):
             return []
 
         update_on = obj.update_on or _default_update_on()
-        result = []
-
-        # Plan-based: one entry per subscription's entitlements (no dedup)
-        for sub in obj.subscriptions.prefetch_related("plan__entitlements").all():
-            for ent in sub.plan.entitlements.filter(client=client):
-                result.append(
-                    {
-                        "name": ent.name,
-                        "slug": ent.slug,
-                        "description": ent.description,
-                        "resources": ent.resources,
-                        "update_on": update_on,
-                        "quantity": sub.quantity,
-                    }
-                )
-
-        # Grant-based: deduplicated by entitlement pk
-        matching_grants = EntitlementGrant.objects.for_org(obj).prefetch_related(
-            "entitlements"
-        )
-        grant_ent_pks_seen = set()
-        for grant in matching_grants:
-            for ent in grant.entitlements.filter(client=client):
-                if ent.pk not in grant_ent_pks_seen:
-                    grant_ent_pks_seen.add(ent.pk)
-                    result.append(
-                        {
-                            "name": ent.name,
-                            "slug": ent.slug,
-                            "description": ent.description,
-                            "resources": ent.resources,
-                            "update_on": update_on,
-                            "quantity": 1,
-                        }
-                    )
-        return result
+        return [
+            {
+                "name": resolved.entitlement.name,
+                "slug": resolved.entitlement.slug,
+                "description": resolved.entitlement.description,
+                "resources": resolved.entitlement.resources,
+                "update_on": update_on,
+                "quantity": resolved.quantity,
+            }
+            for resolved in get_entitlement_resolver(self.context).resolve(obj, client)
+        ]
 
     def get_card(self, obj):
-        # this can be slow - goes to stripe for customer/card info - cache this
+        if "customers" in getattr(obj, "_prefetched_objects_cache", {}):
+            # an organization without a customer has no card on file
+            customers = obj.customers.all()
+            return customers[0].payment_method_display if customers else ""
         return obj.customer().payment_method_display
 
 
+class MembershipListSerializer(serializers.ListSerializer):
+    # pylint: disable=abstract-method
+    def to_representation(self, data):
+        memberships = list(data.all() if isinstance(data, Manager) else data)
+        get_entitlement_resolver(self.context).add(
+            organizations_to_resolve(m.organization for m in memberships)
+        )
+        return super().to_representation(memberships)
+
+
 class MembershipSerializer(serializers.ModelSerializer):
     organization = OrganizationDetailSerializer()
 
     class Meta:
         model = Membership
         fields = ("organization", "admin")
+        list_serializer_class = MembershipListSerializer
 
     def to_representation(self, instance):
         """Move fields from organization to membership representation."""
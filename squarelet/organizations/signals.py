@@ -7,15 +7,32 @@ from django.dispatch import receiver
 from actstream import registry
 
 # Squarelet
-from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.oidc.utils import queue_cache_invalidations
+from squarelet.organizations.choices import EntitlementSource
+from squarelet.organizations.entitlements import (
+    REFRESH_BATCH_SIZE,
+    refresh_entitlements,
+    refresh_organizations,
+)
+from squarelet.organizations.hierarchy import refresh_hierarchy
 from squarelet.organizations.models import (
     Invitation,
+    Invoice,
     Organization,
     Plan,
     ProfileChangeRequest,
 )
-from squarelet.organizations.models.payment import Charge, Entitlement, EntitlementGrant
-from squarelet.organizations.tasks import sync_wix_for_group_member
+from squarelet.organizations.models.payment import (
+    Charge,
+    Entitlement,
+    EntitlementGrant,
+    OrganizationEntitlement,
+    Subscription,
+)
+from squarelet.organizations.tasks import (
+    refresh_grant_organizations,
+    sync_wix_for_group_member,
+)
 
 # Register models with django-activity-stream
 registry.register(Organization)
@@ -65,19 +82,82 @@ def delete_stripe_plan(sender, instance, using, **kwargs):
     dispatch_uid="squarelet.organizations.signals.track_parent_change",
 )
 def track_parent_change(sender, instance, **kwargs):
-    """Stash the previous parent_id so post_save can detect changes."""
+    """Stash the previous parent_id and share_resources, and the fields grant
+    rules and visibility read, so post_save can detect changes."""
     # pylint: disable=unused-argument,protected-access
+    instance._previous_parent_id = None
+    instance._previous_share_resources = None
+    instance._previous_entitlement_fields = None
+    instance._previous_visibility_fields = None
     if instance.pk:
         try:
-            instance._previous_parent_id = (
+            parent_id, share_resources, *fields = (
                 Organization.objects.filter(pk=instance.pk)
-                .values_list("parent_id", flat=True)
+                .values_list(
+                    "parent_id",
+                    "share_resources",
+                    *ENTITLEMENT_FIELDS,
+                    *VISIBILITY_FIELDS,
+                )
                 .get()
             )
         except Organization.DoesNotExist:
-            instance._previous_parent_id = None
-    else:
-        instance._previous_parent_id = None
+            pass
+        else:
+            instance._previous_parent_id = parent_id
+            instance._previous_share_resources = share_resources
+            instance._previous_entitlement_fields = tuple(
+                fields[: len(ENTITLEMENT_FIELDS)]
+            )
+            instance._previous_visibility_fields = tuple(
+                fields[len(ENTITLEMENT_FIELDS) :]
+            )
+
+
+@receiver(
+    signals.post_save,
+    sender=Organization,
+    dispatch_uid="squarelet.organizations.signals.refresh_hierarchy_on_org_save",
+)
+def refresh_hierarchy_on_org_save(sender, instance, created, **kwargs):
+    """Keep the hierarchy closure table up to date with parent and resource
+    sharing changes"""
+    # pylint: disable=unused-argument
+    if (
+        created
+        or instance.parent_id != getattr(instance, "_previous_parent_id", None)
+        or instance.share_resources
+        != getattr(instance, "_previous_share_resources", None)
+    ):
+        refresh_hierarchy(instance)
+
+
+@receiver(
+    signals.m2m_changed,
+    sender=Organization.members.through,
+    dispatch_uid="squarelet.organizations.signals.refresh_hierarchy_on_members",
+)
+def refresh_hierarchy_on_members(sender, instance, action, pk_set, reverse, **kwargs):
+    """Keep the hierarchy closure table up to date with group membership changes
+
+    For forward relationships, the instance is the group and pk_set holds its
+    members; for reverse relationships, the instance is the member.
+    """
+    # pylint: disable=unused-argument,protected-access
+    if action == "pre_clear" and not reverse:
+        instance._pre_clear_member_pks = list(
+            instance.members.values_list("pk", flat=True)
+        )
+        return
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    if reverse:
+        refresh_hierarchy(instance)
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_pre_clear_member_pks", [])
+    for member in Organization.objects.filter(pk__in=pk_set or []):
+        refresh_hierarchy(member)
 
 
 @receiver(
@@ -174,21 +254,209 @@ def charge_created(sender, instance, created, **kwargs):
         instance.organization.save(update_fields=["hidden"])
 
 
+# --- Publicly viewable flag ------------------------------------------------
+#
+# Organization.publicly_viewable is derived from the organization's private and
+# verified_journalist fields, its charges and its paid invoices.  Each change
+# recomputes the flag of the organization it belongs to, and of the one it
+# belonged to if an invoice is moved.
+
+# organization fields the publicly viewable flag depends on
+VISIBILITY_FIELDS = ("private", "verified_journalist")
+# the names an invoice's organization may be saved under in update_fields
+INVOICE_ORGANIZATION_FIELDS = {"organization", "organization_id"}
+
+
+def _refresh_publicly_viewable(*organization_ids):
+    Organization.objects.filter(pk__in=organization_ids).refresh_publicly_viewable()
+
+
+@receiver(
+    signals.post_save,
+    sender=Organization,
+    dispatch_uid="squarelet.organizations.signals.refresh_viewable_on_org_save",
+)
+def refresh_viewable_on_org_save(sender, instance, created, **kwargs):
+    """Recompute the publicly viewable flag when the organization is created, or
+    its privacy or verification changes"""
+    # pylint: disable=unused-argument
+    previous = getattr(instance, "_previous_visibility_fields", None)
+    current = tuple(getattr(instance, field) for field in VISIBILITY_FIELDS)
+    if created or previous != current:
+        _refresh_publicly_viewable(instance.pk)
+        instance.refresh_from_db(fields=["publicly_viewable"])
+
+
+@receiver(
+    signals.post_save,
+    sender=Charge,
+    dispatch_uid="squarelet.organizations.signals.refresh_viewable_on_charge",
+)
+@receiver(
+    signals.post_delete,
+    sender=Charge,
+    dispatch_uid="squarelet.organizations.signals.refresh_viewable_on_charge_delete",
+)
+def refresh_viewable_on_charge(sender, instance, **kwargs):
+    """A charge makes a public organization viewable"""
+    # pylint: disable=unused-argument
+    # charges are not edited once saved, only created or deleted
+    if kwargs.get("created", True):
+        _refresh_publicly_viewable(instance.organization_id)
+
+
+@receiver(
+    signals.pre_save,
+    sender=Invoice,
+    dispatch_uid="squarelet.organizations.signals.track_invoice_organization",
+)
+def track_invoice_organization(sender, instance, update_fields=None, **kwargs):
+    """Stash the organization an invoice belonged to, so post_save can refresh
+    it too if the invoice is moved"""
+    # pylint: disable=unused-argument,protected-access
+    instance._previous_organization_id = None
+    if instance.pk and (
+        update_fields is None or INVOICE_ORGANIZATION_FIELDS & set(update_fields)
+    ):
+        instance._previous_organization_id = (
+            Invoice.objects.filter(pk=instance.pk)
+            .values_list("organization_id", flat=True)
+            .first()
+        )
+
+
+@receiver(
+    signals.post_save,
+    sender=Invoice,
+    dispatch_uid="squarelet.organizations.signals.refresh_viewable_on_invoice",
+)
+@receiver(
+    signals.post_delete,
+    sender=Invoice,
+    dispatch_uid="squarelet.organizations.signals.refresh_viewable_on_invoice_delete",
+)
+def refresh_viewable_on_invoice(sender, instance, update_fields=None, **kwargs):
+    """A paid invoice makes a public organization viewable, and moving one may
+    leave the organization it belonged to not viewable"""
+    # pylint: disable=unused-argument
+    if update_fields is None or {"status", *INVOICE_ORGANIZATION_FIELDS} & set(
+        update_fields
+    ):
+        organization_ids = {instance.organization_id}
+        previous = getattr(instance, "_previous_organization_id", None)
+        if previous is not None:
+            organization_ids.add(previous)
+        _refresh_publicly_viewable(*organization_ids)
+
+
+# --- Materialized entitlements ----------------------------------------------
+#
+# OrganizationEntitlement is derived from subscriptions, the organization
+# fields grant rules read, plan entitlements and grants.  Each change refreshes
+# the rows of the organizations it can affect, in the same transaction.  Grant
+# changes are refreshed by the grant receivers below, alongside their cache
+# invalidations.
+
+# organization fields grant rules depend on
+ENTITLEMENT_FIELDS = ("verified_journalist", "individual")
+# subscription fields plan entitlements depend on
+SUBSCRIPTION_ENTITLEMENT_FIELDS = {"organization", "plan", "quantity"}
+
+
+@receiver(
+    signals.post_save,
+    sender=Organization,
+    dispatch_uid="squarelet.organizations.signals.refresh_entitlements_on_org_save",
+)
+def refresh_entitlements_on_org_save(sender, instance, created, **kwargs):
+    """Refresh an organization whose grant rule fields changed"""
+    # pylint: disable=unused-argument
+    fields = tuple(getattr(instance, f) for f in ENTITLEMENT_FIELDS)
+    if created or fields != getattr(instance, "_previous_entitlement_fields", None):
+        refresh_organizations([instance.pk])
+
+
+@receiver(
+    [signals.post_save, signals.post_delete],
+    sender=Subscription,
+    dispatch_uid="squarelet.organizations.signals.refresh_entitlements_on_subscription",
+)
+def refresh_entitlements_on_subscription(sender, instance, **kwargs):
+    """Refresh the organization whose subscription changed"""
+    # pylint: disable=unused-argument
+    update_fields = kwargs.get("update_fields")
+    if update_fields and not SUBSCRIPTION_ENTITLEMENT_FIELDS & set(update_fields):
+        return
+    if isinstance(kwargs.get("origin"), Organization):
+        # the organization is being deleted, along with its entitlements
+        return
+    refresh_organizations([instance.organization_id])
+
+
+@receiver(
+    signals.m2m_changed,
+    sender=Plan.entitlements.through,
+    dispatch_uid="squarelet.organizations.signals.refresh_entitlements_on_plan",
+)
+def refresh_entitlements_on_plan(sender, instance, action, pk_set, reverse, **kwargs):
+    """Refresh the subscribers of plans whose entitlements changed"""
+    # pylint: disable=unused-argument
+    if action not in {"post_add", "post_remove", "post_clear"}:
+        return
+    if not reverse:
+        refresh_organizations(
+            instance.subscriptions.values_list("organization_id", flat=True)
+        )
+        return
+    # instance is an Entitlement - after a clear, pk_set is empty, and its
+    # former plans are only known through the rows materialized from them
+    pks = set(
+        OrganizationEntitlement.objects.filter(
+            entitlement=instance, source=EntitlementSource.plan
+        ).values_list("organization_id", flat=True)
+    )
+    if pk_set:
+        pks.update(
+            Subscription.objects.filter(plan__in=pk_set).values_list(
+                "organization_id", flat=True
+            )
+        )
+    refresh_organizations(pks)
+
+
 # --- EntitlementGrant cache invalidation -------------------------------------
 #
 # Admin actions on grants (create, edit, toggle active, delete, M2M edits)
-# change the set of orgs that match a grant. Each change broadcasts cache
-# invalidations for the affected orgs so OIDC clients re-fetch entitlements
-# immediately. The monthly `restore_organization` task handles the scheduled
-# refresh cycle; these signals handle the interactive path.
+# change the set of orgs that match a grant. Each change refreshes the
+# materialized entitlements of the affected orgs and broadcasts cache
+# invalidations for them so OIDC clients re-fetch entitlements immediately.
+# The monthly `restore_organization` task handles the scheduled refresh cycle;
+# these signals handle the interactive path.
 
 
 def _invalidate_orgs(uuids):
-    """Defer a cache-invalidation broadcast for the given org UUIDs."""
+    """Record a cache-invalidation broadcast for the given org UUIDs in the
+    outbox, as part of the grant change's transaction."""
     uuid_list = list({str(u) for u in uuids})
     if not uuid_list:
         return
-    transaction.on_commit(lambda: send_cache_invalidations("organization", uuid_list))
+    queue_cache_invalidations("organization", uuid_list)
+
+
+def _grant_changed(uuids):
+    """Refresh and invalidate the orgs a grant change affected
+
+    A change affecting more orgs than one refresh batch holds is handed to a
+    task once it commits, rather than holding up the admin's request.
+    """
+    uuids = {str(u) for u in uuids}
+    if len(uuids) > REFRESH_BATCH_SIZE:
+        uuid_list = list(uuids)
+        transaction.on_commit(lambda: refresh_grant_organizations.delay(uuid_list))
+        return
+    if uuids:
+        refresh_entitlements(Organization.objects.filter(uuid__in=uuids))
+    _invalidate_orgs(uuids)
 
 
 @receiver(
@@ -226,7 +494,7 @@ def entitlementgrant_invalidate_on_save(sender, instance, **kwargs):
     # pylint: disable=unused-argument
     pre = getattr(instance, "_pre_save_match_uuids", []) or []
     post = list(instance.matching_organizations().values_list("uuid", flat=True))
-    _invalidate_orgs(set(pre) | set(post))
+    _grant_changed(set(pre) | set(post))
 
 
 @receiver(
@@ -252,7 +520,7 @@ def entitlementgrant_stash_pre_delete(sender, instance, **kwargs):
 def entitlementgrant_invalidate_on_delete(sender, instance, **kwargs):
     """Broadcast for orgs that matched immediately before the delete."""
     # pylint: disable=unused-argument
-    _invalidate_orgs(getattr(instance, "_pre_delete_match_uuids", []) or [])
+    _grant_changed(getattr(instance, "_pre_delete_match_uuids", []) or [])
 
 
 @receiver(
@@ -266,20 +534,27 @@ def entitlementgrant_organizations_m2m_changed(
     sender, instance, action, pk_set, reverse, **kwargs
 ):
     """Broadcast when orgs are added to or removed from a grant's M2M."""
-    # pylint: disable=unused-argument
+    # pylint: disable=unused-argument,protected-access
+    if action == "pre_clear" and not reverse:
+        # Stash the orgs a bare `clear()` is about to remove
+        instance._pre_clear_org_pks = list(
+            instance.organizations.values_list("pk", flat=True)
+        )
+        return
     if action not in {"post_add", "post_remove", "post_clear"}:
         return
     if reverse:
         # Reverse: instance is an Organization that just gained/lost a grant.
-        _invalidate_orgs([instance.uuid])
+        _grant_changed([instance.uuid])
         return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_pre_clear_org_pks", [])
     if not pk_set:
-        # v1: bare `clear()` is not handled — the admin UI uses add/remove.
         return
     uuids = list(
         Organization.objects.filter(pk__in=pk_set).values_list("uuid", flat=True)
     )
-    _invalidate_orgs(uuids)
+    _grant_changed(uuids)
 
 
 @receiver(
@@ -290,13 +565,24 @@ def entitlementgrant_organizations_m2m_changed(
     ),
 )
 def entitlementgrant_entitlements_m2m_changed(
-    sender, instance, action, reverse, **kwargs
+    sender, instance, action, pk_set, reverse, **kwargs
 ):
     """Broadcast for currently-matching orgs when a grant's entitlements change."""
     # pylint: disable=unused-argument
     if action not in {"post_add", "post_remove", "post_clear"}:
         return
-    if reverse:
-        return  # v1: skip reverse path
-    uuids = list(instance.matching_organizations().values_list("uuid", flat=True))
-    _invalidate_orgs(uuids)
+    if not reverse:
+        uuids = list(instance.matching_organizations().values_list("uuid", flat=True))
+        _grant_changed(uuids)
+        return
+    # Reverse: instance is an Entitlement - after a clear, pk_set is empty, and
+    # the orgs its former grants matched are only known through their rows.
+    # These are refreshed only; v1 does not broadcast for the reverse path.
+    pks = set(
+        OrganizationEntitlement.objects.filter(
+            entitlement=instance, source=EntitlementSource.grant
+        ).values_list("organization_id", flat=True)
+    )
+    for grant in EntitlementGrant.objects.filter(pk__in=pk_set or []):
+        pks.update(grant.matching_organizations().values_list("pk", flat=True))
+    refresh_organizations(pks)
@@ -20,13 +20,15 @@ from squarelet.core.mail import ORG_TO_ADMINS, send_mail
 from squarelet.core.models import Interval
 from squarelet.core.utils import get_stripe_dashboard_url, is_production_env
 from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.oidc.utils import queue_cache_invalidations
 from squarelet.organizations import wix
+from squarelet.organizations.choices import EntitlementSource
+from squarelet.organizations.entitlements import refresh_entitlements, refreshing_once
 from squarelet.organizations.models.invoice import Invoice
 from squarelet.organizations.models.organization import Organization
 from squarelet.organizations.models.payment import (
     Charge,
     Customer,
-    EntitlementGrant,
     Plan,
     Subscription,
     get_payment_brand,
@@ -52,10 +54,12 @@ def restore_organization():
 
     # Delete cancelled subscriptions for due orgs where the Stripe cancellation
     # date has passed (or is null, which covers free plans and legacy records).
-    Subscription.objects.filter(
-        organization_id__in=due_org_ids,
-        cancelled=True,
-    ).filter(Q(cancel_at__lte=today) | Q(cancel_at__isnull=True)).delete()
+    # Each org's entitlements are refreshed once, after the delete.
+    with refreshing_once():
+        Subscription.objects.filter(
+            organization_id__in=due_org_ids,
+            cancelled=True,
+        ).filter(Q(cancel_at__lte=today) | Q(cancel_at__isnull=True)).delete()
 
     # Determine which orgs still have active subscriptions
     orgs_with_subs = set(
@@ -77,19 +81,27 @@ def restore_organization():
     # update_on.  Their resources refresh on the 1st of each month.
     grant_uuids = set()
     if today.day == 1:
-        active_grants = list(EntitlementGrant.objects.filter(active=True))
-        if active_grants:
-            qs_list = [
-                g.matching_organizations().filter(update_on__isnull=True).values("uuid")
-                for g in active_grants
-            ]
-            union_qs = qs_list[0].union(*qs_list[1:])
-            grant_uuids = {row["uuid"] for row in union_qs}
+        # read from the materialized entitlements, which the grant signals keep
+        # up to date, rather than evaluating every grant's rules
+        grant_uuids = set(
+            Organization.objects.filter(
+                update_on__isnull=True,
+                resolved_entitlements__source=EntitlementSource.grant,
+            ).values_list("uuid", flat=True)
+        )
 
     all_uuids = list({*due_org_uuids, *grant_uuids})
     send_cache_invalidations("organization", all_uuids)
 
 
+@shared_task(name="squarelet.organizations.tasks.refresh_grant_organizations")
+def refresh_grant_organizations(uuids):
+    """Refresh the entitlements of the organizations an entitlement grant change
+    affected, then invalidate them, for changes too large to refresh inline"""
+    refresh_entitlements(Organization.objects.filter(uuid__in=uuids))
+    queue_cache_invalidations("organization", list(uuids))
+
+
 @shared_task(
     name="squarelet.organizations.tasks.handle_charge_succeeded",
     autoretry_for=(Organization.DoesNotExist, stripe.RateLimitError),
@@ -442,7 +454,8 @@ def _reconcile_cancelled_subscription(subscription, reason):
     invalidate the organization's entitlement cache."""
     organization_uuid = subscription.organization.uuid
     subscription_id = subscription.subscription_id
-    subscription.delete()
+    with refreshing_once():
+        subscription.delete()
     send_cache_invalidations("organization", [organization_uuid])
     logger.info(
         "[STRIPE-WEBHOOK-SUBSCRIPTION] Reconciled cancelled subscription %s (%s); "
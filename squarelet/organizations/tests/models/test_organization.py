@@ -27,7 +27,7 @@ class TestOrganization:
     @pytest.mark.django_db(transaction=True)
     def test_save(self, organization_factory, mocker):
         mocked = mocker.patch(
-            "squarelet.organizations.models.organization.send_cache_invalidations"
+            "squarelet.organizations.models.organization.queue_cache_invalidations"
         )
         organization = organization_factory()
         mocked.assert_called_with("organization", organization.uuid)
@@ -673,7 +673,7 @@ class TestOrganization:
                     if f.is_relation and f.auto_created
                 ]
             )
-            == 18
+            == 21
         )
         # Many to many relations defined on the Organization model
         assert (
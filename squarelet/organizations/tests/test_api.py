@@ -1,4 +1,6 @@
 # Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 # Standard Library
@@ -15,8 +17,9 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 # Squarelet
+from squarelet.core.pagination import KeysetPagination
 from squarelet.oidc.tests.factories import ClientFactory
-from squarelet.organizations.models import Charge
+from squarelet.organizations.models import Charge, Organization
 from squarelet.organizations.tests.factories import OrganizationFactory
 
 
@@ -155,3 +158,121 @@ class TestOrganizationAPI:
         )
         response = api_client.get(f"/api/organizations/{organization.uuid}/")
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db()
+class TestConditionalRetrieve:
+    """Test ETag and Last-Modified on the organization retrieve"""
+
+    def _get(self, client, organization, **headers):
+        token = create_token(user=None, client=client, scope=["read_organization"])
+        api_client = APIClient()
+        api_client.force_authenticate(token=token)
+        return api_client.get(
+            f"/api/organizations/{organization.uuid}/", headers=headers
+        )
+
+    def test_not_modified(self, mocker):
+        mocker.patch(
+            "squarelet.organizations.models.Customer.stripe_customer",
+            default_source=None,
+            invoice_settings=Mock(default_payment_method=None),
+        )
+        client = ClientFactory(require_consent=False)
+        organization = OrganizationFactory()
+
+        etag = self._get(client, organization)["ETag"]
+        response = self._get(client, organization, If_None_Match=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+        organization.name = "Changed"
+        organization.save()
+
+        response = self._get(client, organization, If_None_Match=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["name"] == "Changed"
+
+
+@pytest.mark.django_db()
+class TestBulkRetrieve:
+    """Test retrieving many organizations by UUID in one request"""
+
+    def _post(self, data, token=None, user=None):
+        api_client = APIClient()
+        api_client.force_authenticate(token=token, user=user)
+        return api_client.post("/api/organizations/bulk/", data, format="json")
+
+    def test_consent_filtered(self, user_factory, client):
+        user = user_factory()
+        consented = OrganizationFactory(admins=[user])
+        other = OrganizationFactory()
+        UserConsent.objects.create(
+            user=user,
+            client=client,
+            expires_at=timezone.now() + timedelta(days=1),
+            date_given=timezone.now(),
+        )
+        token = create_token(user=None, client=client, scope=["read_organization"])
+
+        response = self._post({"uuids": [str(consented.uuid), str(other.uuid)]}, token)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [r["uuid"] for r in response.json()["results"]] == [str(consented.uuid)]
+        assert response.json()["missing"] == [str(other.uuid)]
+
+    def test_query_count_is_constant(self, user_factory, django_assert_num_queries):
+        staff = user_factory(is_staff=True)
+        parent = OrganizationFactory()
+
+        def create_organizations(count):
+            return [
+                str(OrganizationFactory(users=[user_factory()], parent=parent).uuid)
+                for _ in range(count)
+            ]
+
+        few, many = create_organizations(2), create_organizations(6)
+        with CaptureQueriesContext(connection) as context:
+            self._post({"uuids": few}, user=staff)
+
+        with django_assert_num_queries(len(context)):
+            response = self._post({"uuids": many}, user=staff)
+        assert [r["uuid"] for r in response.json()["results"]] == many
+
+
+@pytest.mark.django_db()
+class TestOrganizationKeysetPagination:
+    """Test paging through the organization list by cursor"""
+
+    def _get(self, user, url="/api/organizations/", **params):
+        api_client = APIClient()
+        api_client.force_authenticate(user=user)
+        return api_client.get(url, params)
+
+    def test_walks_every_organization_in_order(self, user_factory, mocker):
+        mocker.patch.object(KeysetPagination, "page_size", 2)
+        staff = user_factory(is_staff=True)
+        OrganizationFactory.create_batch(4)
+        # touching an organization moves it to the end
+        first = Organization.objects.order_by("updated_at", "pk").first()
+        first.save()
+
+        uuids = []
+        response = self._get(staff, cursor="").json()
+        uuids += [r["uuid"] for r in response["results"]]
+        while response["next"]:
+            response = self._get(staff, response["next"]).json()
+            uuids += [r["uuid"] for r in response["results"]]
+
+        expected = Organization.objects.order_by("updated_at", "pk")
+        assert uuids == [str(uuid) for uuid in expected.values_list("uuid", flat=True)]
+        assert uuids[-1] == str(first.uuid)
+        assert "count" not in response
+
+    def test_page_number_by_default(self, user_factory):
+        staff = user_factory(is_staff=True)
+        OrganizationFactory.create_batch(2)
+
+        response = self._get(staff).json()
+
+        assert response["count"] == Organization.objects.count()
+        assert "next" in response
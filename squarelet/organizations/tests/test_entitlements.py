@@ -0,0 +1,324 @@
+# Django
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Standard Library
+from io import StringIO
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.oidc.tests.factories import ClientFactory
+from squarelet.organizations.entitlements import (
+    EntitlementResolver,
+    compute_entitlements,
+    organizations_to_resolve,
+    refresh_entitlements,
+    refresh_organizations,
+    refreshing_once,
+)
+from squarelet.organizations.models import Organization, OrganizationEntitlement
+from squarelet.organizations.tests.factories import (
+    EntitlementFactory,
+    EntitlementGrantFactory,
+    OrganizationFactory,
+    PlanFactory,
+    SubscriptionFactory,
+)
+
+
+@pytest.mark.django_db()
+class TestEntitlementResolver:
+    """Test resolving the entitlements of many organizations together"""
+
+    def test_plan_entitlements(self):
+        client = ClientFactory()
+        entitlement = EntitlementFactory(client=client)
+        other = EntitlementFactory()
+        plan = PlanFactory()
+        entitlement.plans.set([plan])
+        other.plans.set([plan])
+        subscription = SubscriptionFactory(plan=plan, quantity=5)
+        org = subscription.organization
+
+        resolved = EntitlementResolver([org]).resolve(org, client)
+
+        assert [(r.entitlement, r.source, r.quantity) for r in resolved] == [
+            (entitlement, "plan", 5)
+        ]
+        assert len(EntitlementResolver([org]).resolve(org)) == 2
+
+    def test_grant_entitlements_deduplicated(self):
+        client = ClientFactory()
+        entitlement = EntitlementFactory(client=client)
+        org = OrganizationFactory()
+        EntitlementGrantFactory(organizations=[org], entitlements=[entitlement])
+        EntitlementGrantFactory(organizations=[org], entitlements=[entitlement])
+
+        resolved = EntitlementResolver([org]).resolve(org, client)
+
+        assert [(r.entitlement, r.source, r.quantity) for r in resolved] == [
+            (entitlement, "grant", 1)
+        ]
+
+    def test_grant_rules(self):
+        entitlement = EntitlementFactory()
+        verified = OrganizationFactory(verified_journalist=True)
+        unverified = OrganizationFactory(verified_journalist=False)
+        verified_individual = OrganizationFactory(
+            verified_journalist=True, individual=True
+        )
+        EntitlementGrantFactory(
+            entitlements=[entitlement], require_verified=True, for_individuals=False
+        )
+        EntitlementGrantFactory(entitlements=[entitlement], active=False)
+        resolver = EntitlementResolver([verified, unverified, verified_individual])
+
+        assert resolver.resolve(verified)
+        assert not resolver.resolve(unverified)
+        assert not resolver.resolve(verified_individual)
+
+    def test_matches_for_org(self):
+        entitlement = EntitlementFactory()
+        subscribed = SubscriptionFactory().organization
+        unsubscribed = OrganizationFactory()
+        explicit = OrganizationFactory()
+        grant = EntitlementGrantFactory(
+            entitlements=[entitlement], require_active_subscription=True
+        )
+        grant.organizations.set([explicit])
+        EntitlementGrantFactory(entitlements=[entitlement])
+        resolver = EntitlementResolver([subscribed, unsubscribed, explicit])
+
+        for org in (subscribed, unsubscribed, explicit):
+            assert bool(resolver.resolve(org)) == grant.matches(org)
+
+    def test_constant_queries(self, django_assert_num_queries):
+        client = ClientFactory()
+        plan = PlanFactory()
+        EntitlementFactory(client=client).plans.set([plan])
+        orgs = [SubscriptionFactory(plan=plan).organization for _ in range(5)]
+        EntitlementGrantFactory(
+            organizations=orgs[:2], entitlements=[EntitlementFactory(client=client)]
+        )
+        resolver = EntitlementResolver(orgs)
+
+        with django_assert_num_queries(1):
+            for org in orgs:
+                resolver.resolve(org, client)
+        assert [len(resolver.resolve(org, client)) for org in orgs] == [
+            2,
+            2,
+            1,
+            1,
+            1,
+        ]
+
+    def test_resolves_unknown_organization(self):
+        entitlement = EntitlementFactory()
+        org = OrganizationFactory()
+        EntitlementGrantFactory(organizations=[org], entitlements=[entitlement])
+        resolver = EntitlementResolver()
+
+        assert org not in resolver
+        assert resolver.resolve(org)[0].entitlement == entitlement
+        assert org in resolver
+
+
+def _rows(org):
+    return sorted(
+        org.resolved_entitlements.values_list("entitlement_id", "source", "quantity")
+    )
+
+
+def _computed(org):
+    return sorted(
+        (r.entitlement.pk, r.source, r.quantity)
+        for r in compute_entitlements([org])[org.pk]
+    )
+
+
+@pytest.mark.django_db()
+class TestMaterializedEntitlements:
+    """Test keeping the materialized entitlements up to date"""
+
+    def test_compute_constant_queries(self, django_assert_num_queries):
+        plan = PlanFactory()
+        EntitlementFactory().plans.set([plan])
+        orgs = [SubscriptionFactory(plan=plan).organization for _ in range(5)]
+        EntitlementGrantFactory(
+            organizations=orgs[:2], entitlements=[EntitlementFactory()]
+        )
+
+        # subscriptions, plan entitlements, grants, grant entitlements and
+        # explicitly granted organizations
+        with django_assert_num_queries(5):
+            computed = compute_entitlements(orgs)
+        assert [len(computed[org.pk]) for org in orgs] == [2, 2, 1, 1, 1]
+
+    def test_subscription_changes(self):
+        plan = PlanFactory()
+        entitlement = EntitlementFactory()
+        entitlement.plans.set([plan])
+        subscription = SubscriptionFactory(plan=plan, quantity=2)
+        org = subscription.organization
+        assert _rows(org) == [(entitlement.pk, "plan", 2)]
+
+        subscription.quantity = 3
+        subscription.save()
+        assert _rows(org) == [(entitlement.pk, "plan", 3)]
+
+        subscription.delete()
+        assert not _rows(org)
+
+    def test_plan_entitlement_changes(self):
+        plan = PlanFactory()
+        entitlement = EntitlementFactory()
+        org = SubscriptionFactory(plan=plan).organization
+
+        plan.entitlements.add(entitlement)
+        assert _rows(org) == [(entitlement.pk, "plan", 1)]
+
+        entitlement.plans.clear()
+        assert not _rows(org)
+
+    def test_verification_changes(self):
+        entitlement = EntitlementFactory()
+        EntitlementGrantFactory(entitlements=[entitlement], require_verified=True)
+        org = OrganizationFactory(verified_journalist=False)
+        assert not _rows(org)
+
+        org.verified_journalist = True
+        org.save()
+        assert _rows(org) == [(entitlement.pk, "grant", 1)]
+
+        org.verified_journalist = False
+        org.save()
+        assert not _rows(org)
+
+    def test_grant_changes(self):
+        entitlement = EntitlementFactory()
+        org = OrganizationFactory()
+        grant = EntitlementGrantFactory(entitlements=[entitlement])
+
+        grant.organizations.add(org)
+        assert _rows(org) == [(entitlement.pk, "grant", 1)]
+
+        grant.active = False
+        grant.save()
+        assert not _rows(org)
+
+        grant.active = True
+        grant.save()
+        grant.organizations.clear()
+        assert not _rows(org)
+
+        grant.organizations.add(org)
+        grant.entitlements.clear()
+        assert not _rows(org)
+
+        entitlement.grants.add(grant)
+        assert _rows(org) == [(entitlement.pk, "grant", 1)]
+
+        grant.delete()
+        assert not _rows(org)
+
+    def test_matches_computed(self):
+        plan = PlanFactory()
+        EntitlementFactory().plans.set([plan])
+        entitlement = EntitlementFactory()
+        org = SubscriptionFactory(plan=plan, organization__verified_journalist=True)
+        org = org.organization
+        EntitlementGrantFactory(
+            entitlements=[entitlement], require_active_subscription=True
+        )
+        EntitlementGrantFactory(
+            organizations=[org], entitlements=[entitlement], require_verified=True
+        )
+
+        assert _rows(org) == _computed(org)
+        assert len(_rows(org)) == 2
+
+    def test_refresh(self):
+        entitlement = EntitlementFactory()
+        org = OrganizationFactory()
+        EntitlementGrantFactory(organizations=[org], entitlements=[entitlement])
+        orgs = Organization.objects.filter(pk=org.pk)
+        OrganizationEntitlement.objects.all().delete()
+
+        assert refresh_entitlements(orgs, dry_run=True) == [org.pk]
+        assert not _rows(org)
+        assert refresh_entitlements(orgs) == [org.pk]
+        assert _rows(org) == [(entitlement.pk, "grant", 1)]
+        assert not refresh_entitlements(orgs)
+
+    def test_refresh_locks_organizations(self):
+        org = OrganizationFactory()
+        EntitlementGrantFactory(
+            organizations=[org], entitlements=[EntitlementFactory()]
+        )
+        orgs = Organization.objects.filter(pk=org.pk)
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_entitlements(orgs, dry_run=True)
+        assert not any("FOR UPDATE" in q["sql"] for q in queries)
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_entitlements(orgs)
+        sql = [q["sql"] for q in queries]
+        locks = [i for i, q in enumerate(sql) if "FOR UPDATE" in q]
+        reads = [i for i, q in enumerate(sql) if "organizationentitlement" in q]
+        assert locks
+        assert 'organizations_organization"' in sql[locks[0]]
+        # the rows are only read once the organizations are locked
+        assert locks[0] < reads[0]
+
+    def test_refreshing_once(self, mocker):
+        first, second = OrganizationFactory.create_batch(2)
+        mock_refresh = mocker.patch(
+            "squarelet.organizations.entitlements.refresh_entitlements"
+        )
+
+        with refreshing_once():
+            refresh_organizations([first.pk])
+            with refreshing_once():
+                refresh_organizations([first.pk, second.pk])
+            mock_refresh.assert_not_called()
+
+        mock_refresh.assert_called_once()
+        assert set(mock_refresh.call_args.args[0]) == {first, second}
+
+    def test_rebuild_command(self):
+        entitlement = EntitlementFactory()
+        org = OrganizationFactory()
+        EntitlementGrantFactory(organizations=[org], entitlements=[entitlement])
+        OrganizationEntitlement.objects.update(quantity=5)
+
+        with pytest.raises(CommandError):
+            call_command("rebuild_entitlements", "--verify", stdout=StringIO())
+        out = StringIO()
+        call_command("rebuild_entitlements", stdout=out)
+        assert "1 organizations" in out.getvalue()
+        call_command("rebuild_entitlements", "--verify", stdout=StringIO())
+        assert _rows(org) == [(entitlement.pk, "grant", 1)]
+
+
+@pytest.mark.django_db()
+def test_organizations_to_resolve(django_assert_num_queries):
+    parent = OrganizationFactory()
+    group = OrganizationFactory()
+    child = OrganizationFactory(parent=parent)
+    group.members.add(child)
+    org = Organization.objects.prefetch_api(depth=1).get(pk=child.pk)
+    unloaded = OrganizationFactory(parent=parent)
+
+    with django_assert_num_queries(0):
+        assert {o.pk for o in organizations_to_resolve([org, unloaded])} == {
+            child.pk,
+            parent.pk,
+            group.pk,
+            unloaded.pk,
+        }
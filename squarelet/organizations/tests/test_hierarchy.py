@@ -0,0 +1,183 @@
+# Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# Third Party
+import pytest
+
+# Squarelet
+from squarelet.organizations.hierarchy import (
+    get_ancestors,
+    get_effective_verifications,
+    get_hub_eligibilities,
+    get_inherited_plans,
+    get_wix_plans,
+)
+from squarelet.organizations.models import OrganizationAncestor
+from squarelet.organizations.tests.factories import (
+    OrganizationFactory,
+    PlanFactory,
+    SubscriptionFactory,
+)
+
+
+def rows(organization):
+    return set(
+        OrganizationAncestor.objects.filter(descendant=organization).values_list(
+            "ancestor__name", "depth", "via_group", "shared"
+        )
+    )
+
+
+@pytest.mark.django_db()
+class TestRefreshHierarchy:
+    """Test the signals keeping the closure table up to date"""
+
+    def test_parent_chain(self):
+        grandparent = OrganizationFactory(name="grandparent")
+        parent = OrganizationFactory(
+            name="parent", parent=grandparent, share_resources=False
+        )
+        child = OrganizationFactory(name="child", parent=parent)
+
+        assert rows(child) == {
+            ("parent", 1, False, False),
+            ("grandparent", 2, False, False),
+        }
+        assert rows(parent) == {("grandparent", 1, False, True)}
+        assert rows(grandparent) == set()
+
+    def test_reparent_moves_descendants(self):
+        old = OrganizationFactory(name="old")
+        new = OrganizationFactory(name="new")
+        parent = OrganizationFactory(name="parent", parent=old, share_resources=False)
+        child = OrganizationFactory(name="child", parent=parent)
+
+        parent.parent = new
+        parent.save()
+
+        assert rows(child) == {("parent", 1, False, False), ("new", 2, False, False)}
+        assert rows(parent) == {("new", 1, False, True)}
+
+    def test_share_resources_toggle(self):
+        grandparent = OrganizationFactory(name="grandparent")
+        parent = OrganizationFactory(
+            name="parent", parent=grandparent, share_resources=False
+        )
+        child = OrganizationFactory(name="child", parent=parent)
+
+        parent.share_resources = True
+        parent.save()
+
+        assert rows(child) == {
+            ("parent", 1, False, True),
+            ("grandparent", 2, False, True),
+        }
+
+    def test_groups(self):
+        group = OrganizationFactory(name="group")
+        other = OrganizationFactory(name="other")
+        parent = OrganizationFactory(name="parent", share_resources=False)
+        child = OrganizationFactory(name="child", parent=parent)
+
+        group.members.add(parent)
+        other.members.add(parent)
+        assert rows(child) == {
+            ("parent", 1, False, False),
+            ("group", 1, True, False),
+            ("other", 1, True, False),
+        }
+
+        group.members.remove(parent)
+        assert rows(parent) == {("other", 0, True, True)}
+
+        other.members.clear()
+        assert rows(parent) == set()
+        assert rows(child) == {("parent", 1, False, False)}
+
+    def test_groups_reverse(self):
+        group = OrganizationFactory(name="group")
+        member = OrganizationFactory(name="member")
+
+        member.groups.add(group)
+        assert rows(member) == {("group", 0, True, True)}
+
+        member.groups.clear()
+        assert rows(member) == set()
+
+    def test_merge_moves_children(self, user_factory):
+        org = OrganizationFactory(name="org", share_resources=False)
+        other = OrganizationFactory(name="other")
+        child = OrganizationFactory(name="child", parent=other)
+
+        org.merge(other, user_factory())
+
+        assert rows(child) == {("org", 1, False, False)}
+
+
+@pytest.mark.django_db()
+class TestHierarchyLookups:
+    """Test answering hierarchy questions for many organizations at once"""
+
+    def test_get_ancestors(self):
+        parent = OrganizationFactory()
+        group = OrganizationFactory()
+        child = OrganizationFactory(parent=parent)
+        group.members.add(child)
+        orphan = OrganizationFactory()
+
+        assert get_ancestors([child, orphan]) == {
+            child.pk: [group, parent],
+            orphan.pk: [],
+        }
+
+    def test_inheritance(self):
+        parent = OrganizationFactory()
+        group = OrganizationFactory(verified_journalist=False, hub_eligible=True)
+        parent_group = OrganizationFactory(hub_eligible=True)
+        parent_group.members.add(parent)
+        child = OrganizationFactory(parent=parent, verified_journalist=False)
+        member = OrganizationFactory(verified_journalist=False)
+        group.members.add(member)
+        orgs = [child, member, group]
+
+        with CaptureQueriesContext(connection) as queries:
+            verifications = get_effective_verifications(orgs)
+            eligibilities = get_hub_eligibilities(orgs)
+
+        assert len(queries) == 2
+        assert verifications == {child.pk: True, member.pk: False, group.pk: False}
+        assert eligibilities == {child.pk: True, member.pk: True, group.pk: True}
+
+    def test_group_parent_not_inherited(self):
+        grandparent = OrganizationFactory()
+        group = OrganizationFactory(parent=grandparent, verified_journalist=False)
+        member = OrganizationFactory(verified_journalist=False)
+        group.members.add(member)
+
+        assert get_effective_verifications([member]) == {member.pk: False}
+
+    def test_plans(self):
+        paid = PlanFactory(name="paid", base_price=100)
+        wix = PlanFactory(name="wix", base_price=100, wix=True)
+        free = PlanFactory(name="free", base_price=0, price_per_user=0)
+        grandparent = OrganizationFactory()
+        SubscriptionFactory(organization=grandparent, plan=paid)
+        parent = OrganizationFactory(parent=grandparent)
+        SubscriptionFactory(organization=parent, plan=wix)
+        SubscriptionFactory(organization=parent, plan=free)
+        child = OrganizationFactory(parent=parent)
+        unshared = OrganizationFactory(
+            parent=OrganizationFactory(parent=grandparent, share_resources=False)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            inherited = get_inherited_plans([child, unshared])
+            wix_plans = get_wix_plans([child, unshared])
+
+        assert len(queries) == 2
+        assert inherited == {
+            child.pk: [(parent, wix), (grandparent, paid)],
+            unshared.pk: [],
+        }
+        assert wix_plans == {child.pk: [(parent, wix)], unshared.pk: []}
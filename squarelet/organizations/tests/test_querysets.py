@@ -1,5 +1,6 @@
 # Django
 from django.contrib.auth.models import AnonymousUser
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
 
@@ -12,6 +13,7 @@ import pytest
 from oidc_provider.models import Client
 
 # Squarelet
+from squarelet.organizations import search
 from squarelet.organizations.choices import ChangeLogReason
 from squarelet.organizations.models import (
     Entitlement,
@@ -23,6 +25,7 @@ from squarelet.organizations.models import (
 )
 from squarelet.organizations.tests.factories import (
     ChargeFactory,
+    EmailDomainFactory,
     InvoiceFactory,
     MembershipFactory,
     OrganizationFactory,
@@ -182,6 +185,55 @@ class TestOrganizationQuerySet(TestCase):
         # Should only appear once despite meeting multiple criteria
         assert viewable.filter(id=org.id).count() == 1
 
+    @pytest.mark.django_db
+    def test_get_viewable_auto_join(self):
+        """Authenticated users can view private orgs they may auto join"""
+        user = UserFactory(email="user@Example.com", email_verified=True)
+        auto_join_org = OrganizationFactory(
+            private=True, verified_journalist=False, allow_auto_join=True
+        )
+        EmailDomainFactory(organization=auto_join_org, domain="example.com")
+        closed_org = OrganizationFactory(
+            private=True, verified_journalist=False, allow_auto_join=False
+        )
+        EmailDomainFactory(organization=closed_org, domain="example.com")
+        other_domain_org = OrganizationFactory(
+            private=True, verified_journalist=False, allow_auto_join=True
+        )
+        EmailDomainFactory(organization=other_domain_org, domain="example.org")
+
+        viewable = Organization.objects.get_viewable(user)
+        assert auto_join_org in viewable
+        assert closed_org not in viewable
+        assert other_domain_org not in viewable
+
+    @pytest.mark.django_db
+    def test_get_viewable_auto_join_unverified_email(self):
+        """Unverified emails do not make orgs viewable through auto join"""
+        user = UserFactory(email="user@example.com", email_verified=False)
+        org = OrganizationFactory(
+            private=True, verified_journalist=False, allow_auto_join=True
+        )
+        EmailDomainFactory(organization=org, domain="example.com")
+
+        assert org not in Organization.objects.get_viewable(user)
+
+    @pytest.mark.django_db
+    def test_get_viewable_single_query(self):
+        """Filtering by visibility is one query however many orgs there are"""
+        user = UserFactory()
+        for _ in range(5):
+            domain = EmailDomainFactory(
+                organization__private=True, organization__allow_auto_join=True
+            )
+            user.emailaddress_set.create(
+                email=f"{user.username}@{domain.domain}", verified=True
+            )
+
+        with self.assertNumQueries(1):
+            # the user's individual organization, and each auto join org
+            assert len(Organization.objects.get_viewable(user)) == 6
+
     @pytest.mark.django_db
     def test_create_individual_basic(self):
         """Test creating an individual organization for a user"""
@@ -261,6 +313,107 @@ class TestFuzzySearch(TestCase):
         assert results.count() == 1
         assert results.first().name == "MuckRock Foundation"
 
+    @pytest.mark.django_db
+    def test_fuzzy_search_misspelling(self):
+        """fuzzy_search finds names close to, but not containing, the query"""
+        OrganizationFactory(name="MuckRock Foundation", individual=False)
+        results = Organization.objects.fuzzy_search("Mukrock")
+        assert [org.name for org in results] == ["MuckRock Foundation"]
+
+    @pytest.mark.django_db
+    def test_fuzzy_search_name_within_query(self):
+        """fuzzy_search finds short names inside a longer query"""
+        OrganizationFactory(name="ACLU", individual=False)
+        results = Organization.objects.fuzzy_search("ACLU of Northern California")
+        assert [org.name for org in results] == ["ACLU"]
+
+    @pytest.mark.django_db
+    def test_fuzzy_search_order(self):
+        """fuzzy_search returns the best matches first"""
+        OrganizationFactory(name="The Daily Tribunal", individual=False)
+        OrganizationFactory(name="The Daily Tribune", individual=False)
+        OrganizationFactory(name="Daily Planet", individual=False)
+        results = Organization.objects.fuzzy_search("Tribune", score_cutoff=80)
+        assert [org.name for org in results] == [
+            "The Daily Tribune",
+            "The Daily Tribunal",
+        ]
+
+    @pytest.mark.django_db
+    def test_get_candidates_limit(self):
+        """Only the most similar names are scored"""
+        for name in ["Tribune", "Tribunes", "Tribune Weekly", "Daily Planet"]:
+            OrganizationFactory(name=name, individual=False)
+        candidates = search.get_candidates(
+            Organization.objects.filter(individual=False), "Tribune", limit=2
+        )
+        assert [name for _, name in candidates] == ["Tribune", "Tribune Weekly"]
+
+    @pytest.mark.django_db
+    def test_get_candidates_short_query(self):
+        """A short query matching more names than the limit keeps the names
+        containing it as a whole word first, then the closest, by pk"""
+        for name in [
+            "Tribune",
+            "Tri-County News",
+            "Atrium Media",
+            "Daily Tribune",
+            "Tri Valley Times",
+        ]:
+            OrganizationFactory(name=name, individual=False)
+        candidates = search.get_candidates(
+            Organization.objects.filter(individual=False), "Tri", limit=3
+        )
+        assert [name for _, name in candidates] == [
+            "Tri-County News",
+            "Tri Valley Times",
+            "Tribune",
+        ]
+
+    @pytest.mark.django_db
+    def test_get_candidates_threshold_does_not_leak(self):
+        """The candidate threshold is not left set for the rest of the
+        transaction"""
+        search.get_candidates(Organization.objects.all(), "Tribune")
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW pg_trgm.word_similarity_threshold")
+            # pg_trgm's default
+            assert cursor.fetchone() == ("0.6",)
+
+
+class TestPrefetchAdmins(TestCase):
+    """Unit tests for Organization.objects.prefetch_admins()"""
+
+    @pytest.mark.django_db
+    def test_prefetch_admins(self):
+        """Only admins are prefetched, in username order"""
+        admins = [UserFactory(username="b_admin"), UserFactory(username="a_admin")]
+        member = UserFactory()
+        org = OrganizationFactory(admins=admins, users=[member])
+        # a membership elsewhere is not loaded
+        OrganizationFactory(admins=[member])
+
+        org = Organization.objects.prefetch_admins().get(pk=org.pk)
+
+        with self.assertNumQueries(0):
+            assert org.get_admin_users() == [admins[1], admins[0]]
+        assert list(org.get_admin_users()) == list(
+            Organization.objects.get(pk=org.pk).get_admin_users()
+        )
+
+    @pytest.mark.django_db
+    def test_prefetch_admins_query_count(self):
+        """Admin lists for many organizations cost one query"""
+        for _ in range(3):
+            OrganizationFactory(
+                admins=[UserFactory()], users=UserFactory.create_batch(2)
+            )
+
+        with self.assertNumQueries(2):
+            orgs = list(Organization.objects.prefetch_admins())
+            for org in orgs:
+                assert len(org.get_admin_users()) == 1
+
 
 class TestMembershipQuerySet(TestCase):
     """Unit tests for Membership queryset"""
@@ -1,3 +1,7 @@
+# Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 # Standard Library
 from datetime import date, timedelta
 
@@ -7,6 +11,7 @@ from freezegun import freeze_time
 
 # Squarelet
 from squarelet.oidc.tests.factories import ClientFactory
+from squarelet.organizations.models import Organization
 from squarelet.organizations.serializers import (
     OrganizationDetailSerializer,
     _default_update_on,
@@ -100,6 +105,41 @@ class TestSerializerEntitlements:
         serializer = OrganizationDetailSerializer(org, context={})
         assert not serializer.get_entitlements(org)
 
+    @pytest.mark.django_db()
+    def test_serializer_many_query_count_is_constant(self, django_assert_num_queries):
+        client = ClientFactory()
+        plan = PlanFactory()
+        EntitlementFactory(client=client).plans.set([plan])
+        grant = EntitlementGrantFactory(
+            entitlements=[EntitlementFactory(client=client)]
+        )
+        parent = OrganizationFactory()
+
+        def create_orgs(count):
+            orgs = [
+                SubscriptionFactory(
+                    plan=plan, organization=OrganizationFactory(parent=parent)
+                ).organization
+                for _ in range(count)
+            ]
+            grant.organizations.add(*orgs)
+            return [org.pk for org in orgs]
+
+        def serialize(pks):
+            return OrganizationDetailSerializer(
+                Organization.objects.prefetch_api().filter(pk__in=pks),
+                many=True,
+                context={"client": client},
+            ).data
+
+        few, many = create_orgs(2), create_orgs(6)
+        with CaptureQueriesContext(connection) as context:
+            serialize(few)
+
+        with django_assert_num_queries(len(context)):
+            data = serialize(many)
+        assert all(len(org["entitlements"]) == 2 for org in data)
+
 
 class TestSerializerProfile:
     """Tests for url and location fields on OrganizationDetailSerializer"""
@@ -5,8 +5,10 @@ import pytest
 from squarelet.organizations import signals
 from squarelet.organizations.models.payment import Charge, EntitlementGrant
 from squarelet.organizations.tests.factories import (
+    ChargeFactory,
     EntitlementFactory,
     EntitlementGrantFactory,
+    InvoiceFactory,
     OrganizationFactory,
 )
 
@@ -40,7 +42,7 @@ def test_charge_unhides_group_org():
 
 
 def _broadcast_uuids(mock_send):
-    """Collect all UUIDs broadcast across all calls to send_cache_invalidations."""
+    """Collect all UUIDs broadcast across all calls to queue_cache_invalidations."""
     uuids = set()
     for call in mock_send.call_args_list:
         assert call.args[0] == "organization"
@@ -56,7 +58,7 @@ class TestEntitlementGrantSignals:
         self, mocker, django_capture_on_commit_callbacks
     ):
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         org = OrganizationFactory()
         with django_capture_on_commit_callbacks(execute=True):
@@ -71,7 +73,7 @@ class TestEntitlementGrantSignals:
         with django_capture_on_commit_callbacks(execute=True):
             grant = EntitlementGrantFactory(organizations=[org])
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         with django_capture_on_commit_callbacks(execute=True):
             grant.active = False
@@ -87,7 +89,7 @@ class TestEntitlementGrantSignals:
         with django_capture_on_commit_callbacks(execute=True):
             grant = EntitlementGrantFactory(organizations=[org], active=False)
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         with django_capture_on_commit_callbacks(execute=True):
             grant.active = True
@@ -102,7 +104,7 @@ class TestEntitlementGrantSignals:
             grant = EntitlementGrantFactory()
         org = OrganizationFactory()
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         with django_capture_on_commit_callbacks(execute=True):
             grant.organizations.add(org)
@@ -116,7 +118,7 @@ class TestEntitlementGrantSignals:
         with django_capture_on_commit_callbacks(execute=True):
             grant = EntitlementGrantFactory(organizations=[org])
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         with django_capture_on_commit_callbacks(execute=True):
             grant.organizations.remove(org)
@@ -131,7 +133,7 @@ class TestEntitlementGrantSignals:
         with django_capture_on_commit_callbacks(execute=True):
             grant = EntitlementGrantFactory(organizations=[org])
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         with django_capture_on_commit_callbacks(execute=True):
             grant.entitlements.add(entitlement)
@@ -143,9 +145,101 @@ class TestEntitlementGrantSignals:
         with django_capture_on_commit_callbacks(execute=True):
             grant = EntitlementGrantFactory(organizations=[org])
         mock_send = mocker.patch(
-            "squarelet.organizations.signals.send_cache_invalidations"
+            "squarelet.organizations.signals.queue_cache_invalidations"
         )
         with django_capture_on_commit_callbacks(execute=True):
             grant.delete()
         assert str(org.uuid) in _broadcast_uuids(mock_send)
         assert not EntitlementGrant.objects.filter(pk=grant.pk).exists()
+
+    @pytest.mark.django_db(transaction=True)
+    def test_large_change_refreshed_in_task(
+        self, mocker, django_capture_on_commit_callbacks
+    ):
+        mocker.patch("squarelet.organizations.signals.REFRESH_BATCH_SIZE", 1)
+        mock_send = mocker.patch(
+            "squarelet.organizations.signals.queue_cache_invalidations"
+        )
+        mock_refresh = mocker.patch(
+            "squarelet.organizations.signals.refresh_entitlements"
+        )
+        mock_delay = mocker.patch(
+            "squarelet.organizations.signals.refresh_grant_organizations.delay"
+        )
+        orgs = OrganizationFactory.create_batch(2)
+        with django_capture_on_commit_callbacks(execute=True):
+            EntitlementGrantFactory(organizations=orgs)
+        mock_refresh.assert_not_called()
+        mock_send.assert_not_called()
+        assert {str(org.uuid) for org in orgs} == set(mock_delay.call_args.args[0])
+
+
+@pytest.mark.django_db
+class TestPubliclyViewableSignals:
+    """The publicly viewable flag follows privacy, verification and payments"""
+
+    def test_verification(self):
+        org = OrganizationFactory(verified_journalist=True)
+        assert org.publicly_viewable
+
+        org.verified_journalist = False
+        org.save()
+        assert not org.publicly_viewable
+
+        org.verified_journalist = True
+        org.private = True
+        org.save()
+        org.refresh_from_db()
+        assert not org.publicly_viewable
+
+    def test_charge(self):
+        org = OrganizationFactory(verified_journalist=False)
+        assert not org.publicly_viewable
+
+        charge = ChargeFactory(organization=org)
+        org.refresh_from_db()
+        assert org.publicly_viewable
+
+        charge.delete()
+        org.refresh_from_db()
+        assert not org.publicly_viewable
+
+    def test_invoice(self):
+        org = OrganizationFactory(verified_journalist=False)
+        invoice = InvoiceFactory(organization=org, status="open")
+        org.refresh_from_db()
+        assert not org.publicly_viewable
+
+        invoice.status = "paid"
+        invoice.save()
+        org.refresh_from_db()
+        assert org.publicly_viewable
+
+    def test_invoice_moved(self):
+        """Moving a paid invoice refreshes the organization it left as well as
+        the one it joined"""
+        org = OrganizationFactory(verified_journalist=False)
+        other = OrganizationFactory(verified_journalist=False)
+        invoice = InvoiceFactory(organization=org, status="paid")
+        org.refresh_from_db()
+        assert org.publicly_viewable
+
+        invoice.organization = other
+        invoice.save(update_fields=["organization"])
+
+        org.refresh_from_db()
+        other.refresh_from_db()
+        assert not org.publicly_viewable
+        assert other.publicly_viewable
+
+    def test_merge_moves_charges(self, user_factory):
+        org = OrganizationFactory(verified_journalist=False)
+        other = OrganizationFactory(verified_journalist=False)
+        ChargeFactory(organization=other)
+
+        org.merge(other, user_factory())
+
+        org.refresh_from_db()
+        other.refresh_from_db()
+        assert org.publicly_viewable
+        assert not other.publicly_viewable
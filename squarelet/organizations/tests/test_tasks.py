@@ -14,8 +14,14 @@ from freezegun import freeze_time
 
 # Squarelet
 from squarelet.organizations import tasks
-from squarelet.organizations.models import Charge, Invoice, Subscription
+from squarelet.organizations.models import (
+    Charge,
+    Invoice,
+    OrganizationEntitlement,
+    Subscription,
+)
 from squarelet.organizations.tests.factories import (
+    EntitlementFactory,
     EntitlementGrantFactory,
     InvoiceFactory,
     OrganizationFactory,
@@ -150,7 +156,9 @@ class TestRestoreOrganizationGrants:
             "squarelet.organizations.tasks.send_cache_invalidations"
         )
         org = OrganizationFactory(verified_journalist=True)
-        EntitlementGrantFactory(require_verified=True)
+        EntitlementGrantFactory(
+            entitlements=[EntitlementFactory()], require_verified=True
+        )
 
         tasks.restore_organization()
 
@@ -165,7 +173,9 @@ class TestRestoreOrganizationGrants:
             "squarelet.organizations.tasks.send_cache_invalidations"
         )
         org = OrganizationFactory(verified_journalist=True)
-        EntitlementGrantFactory(require_verified=True)
+        EntitlementGrantFactory(
+            entitlements=[EntitlementFactory()], require_verified=True
+        )
 
         tasks.restore_organization()
 
@@ -180,7 +190,9 @@ class TestRestoreOrganizationGrants:
             "squarelet.organizations.tasks.send_cache_invalidations"
         )
         org = OrganizationFactory(verified_journalist=True)
-        EntitlementGrantFactory(require_verified=True, active=False)
+        EntitlementGrantFactory(
+            entitlements=[EntitlementFactory()], require_verified=True, active=False
+        )
 
         tasks.restore_organization()
 
@@ -201,7 +213,9 @@ class TestRestoreOrganizationGrants:
             update_on=date(2026, 7, 1),
         )
         SubscriptionFactory(organization=org)
-        EntitlementGrantFactory(require_verified=True)
+        EntitlementGrantFactory(
+            entitlements=[EntitlementFactory()], require_verified=True
+        )
 
         tasks.restore_organization()
 
@@ -210,6 +224,45 @@ class TestRestoreOrganizationGrants:
         assert str(org.uuid) in all_uuids
 
 
+@pytest.mark.django_db()
+@freeze_time("2026-07-15")
+def test_restore_organization_refreshes_each_org_once(mocker):
+    """Deleting an org's cancelled subscriptions refreshes it once, after"""
+    mocker.patch("squarelet.organizations.tasks.send_cache_invalidations")
+    mocker.patch("stripe.Plan.create")
+    org = OrganizationFactory(update_on=date(2026, 7, 1))
+    for _ in range(2):
+        SubscriptionFactory(
+            organization=org, cancelled=True, cancel_at=date(2026, 7, 1)
+        )
+    mock_refresh = mocker.patch(
+        "squarelet.organizations.entitlements.refresh_entitlements"
+    )
+
+    tasks.restore_organization()
+
+    mock_refresh.assert_called_once()
+    assert list(mock_refresh.call_args.args[0]) == [org]
+    assert not Subscription.objects.filter(organization=org).exists()
+
+
+@pytest.mark.django_db()
+def test_refresh_grant_organizations(mocker):
+    """The orgs are refreshed before they are invalidated"""
+    mock_queue = mocker.patch("squarelet.organizations.tasks.queue_cache_invalidations")
+    entitlement = EntitlementFactory()
+    org = OrganizationFactory()
+    EntitlementGrantFactory(organizations=[org], entitlements=[entitlement])
+    OrganizationEntitlement.objects.all().delete()
+
+    tasks.refresh_grant_organizations([str(org.uuid)])
+
+    assert OrganizationEntitlement.objects.filter(
+        organization=org, entitlement=entitlement
+    ).exists()
+    mock_queue.assert_called_once_with("organization", [str(org.uuid)])
+
+
 class TestHandleChargeSucceeded:
     """Unit tests for the handle_charge_succeeded task"""
 
@@ -13,6 +13,7 @@ import json
 from unittest.mock import MagicMock, call
 
 # Third Party
+import factory
 import pytest
 import stripe
 from actstream.models import Action
@@ -1123,12 +1124,41 @@ class TestAutocomplete:
             {"name": org.name, "slug": org.slug, "avatar": org.avatar_url}
         ]
 
+    def test_prefix_first(self, rf, organization_factory):
+        contains = organization_factory.create(name="The Example", slug="a")
+        prefix = organization_factory.create(name="Example", slug="b")
+        response = self.call_view(rf, {"q": "EXAM"})
+        content = json.loads(response.content)
+        assert [o["slug"] for o in content["data"]] == [prefix.slug, contains.slug]
+
     def test_page(self, rf, organization_factory):
         organization_factory.create_batch(101)
-        response = self.call_view(rf, {"page": "2"})
+        response = self.call_view(rf, {})
+        assert response.status_code == 200
+        content = json.loads(response.content)
+        assert len(content["data"]) == 100
+        response = self.call_view(rf, {"cursor": content["next"]})
         assert response.status_code == 200
         content = json.loads(response.content)
         assert len(content["data"]) == 1
+        assert content["next"] is None
+
+    def test_page_query(self, rf, organization_factory):
+        orgs = organization_factory.create_batch(
+            101, name=factory.Sequence(lambda n: f"Example {n}")
+        )
+        response = self.call_view(rf, {"q": "exam"})
+        content = json.loads(response.content)
+        response = self.call_view(rf, {"q": "exam", "cursor": content["next"]})
+        content = json.loads(response.content)
+        assert content["data"][0]["slug"] == max(o.slug for o in orgs)
+
+    def test_invalid_cursor(self, rf, organization_factory):
+        organization_factory.create_batch(2)
+        response = self.call_view(rf, {"cursor": "invalid"})
+        assert response.status_code == 200
+        content = json.loads(response.content)
+        assert len(content["data"]) == 2
 
 
 @pytest.mark.django_db()
@@ -3,8 +3,8 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.db import transaction
-from django.db.models import Value as V
-from django.db.models.functions import Lower, StrIndex
+from django.db.models import Case, Q, Value as V, When
+from django.db.models.functions import Lower
 from django.http import JsonResponse
 from django.shortcuts import redirect
 from django.utils import timezone
@@ -13,6 +13,9 @@ from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView, ListView
 
 # Standard Library
+import base64
+import binascii
+import json
 import logging
 from datetime import datetime
 
@@ -578,28 +581,66 @@ class List(ListView):
         return context
 
 
-def autocomplete(request):
-    # This should be replaced by a real API
-    query = request.GET.get("q")
-    page = request.GET.get("page")
+def encode_autocomplete_cursor(rank, slug):
+    data = json.dumps([rank, slug])
+    return base64.urlsafe_b64encode(data.encode("utf8")).decode("ascii")
+
+
+def decode_autocomplete_cursor(cursor):
+    """Return the (rank, slug) position a cursor points at, or None if the
+    cursor is invalid"""
     try:
-        page = int(page)
-    except (ValueError, TypeError):
-        page = 1
+        rank, slug = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, TypeError, ValueError):
+        return None
+    if not isinstance(rank, int) or not isinstance(slug, str):
+        return None
+    return rank, slug
+
+
+def autocomplete(request):
+    """Organizations whose names contain the query, those starting with it
+    first, a page at a time
+
+    The lowercased name is matched against the query using the trigram index
+    on it (see Organization.Meta.indexes).  Each page includes the cursor to
+    fetch the next page with, or null if this is the last page.
+    """
+    query = request.GET.get("q", "").lower()
+    cursor = decode_autocomplete_cursor(request.GET.get("cursor", ""))
 
     orgs = Organization.objects.filter(individual=False).get_viewable(request.user)
     if query:
         # Prioritize showing things that start with query
         orgs = (
-            orgs.filter(name__icontains=query)
-            .annotate(pos=StrIndex(Lower("name"), Lower(V(query))))
-            .order_by("pos", "slug")
+            orgs.annotate(lower_name=Lower("name"))
+            .filter(lower_name__contains=query)
+            .annotate(
+                rank=Case(
+                    When(lower_name__startswith=query, then=V(0)),
+                    default=V(1),
+                )
+            )
         )
+    else:
+        orgs = orgs.annotate(rank=V(0))
+    if cursor:
+        rank, slug = cursor
+        orgs = orgs.filter(Q(rank__gt=rank) | Q(rank=rank, slug__gt=slug))
+    orgs = list(
+        orgs.only("name", "slug", "avatar").order_by("rank", "slug")[
+            : ORG_PAGINATION + 1
+        ]
+    )
 
+    next_cursor = None
+    if len(orgs) > ORG_PAGINATION:
+        orgs = orgs[:ORG_PAGINATION]
+        next_cursor = encode_autocomplete_cursor(orgs[-1].rank, orgs[-1].slug)
     data = {
         "data": [
-            {"name": o.name, "slug": o.slug, "avatar": o.avatar_url}
-            for o in orgs[((page - 1) * ORG_PAGINATION) : (page * ORG_PAGINATION)]
-        ]
+            {"name": o.name, "slug": o.slug, "avatar": o.avatar_url} for o in orgs
+        ],
+        "next": next_cursor,
     }
     return JsonResponse(data)
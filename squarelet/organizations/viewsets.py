@@ -6,6 +6,8 @@ from rest_framework import viewsets
 from rest_framework.permissions import IsAdminUser
 
 # Squarelet
+from squarelet.core.mixins import BulkRetrieveMixin, ConditionalRetrieveMixin
+from squarelet.core.pagination import KeysetPagination
 from squarelet.oidc.permissions import ScopePermission
 from squarelet.organizations.filters import OrganizationFilter
 from squarelet.organizations.models import Charge, Organization
@@ -16,19 +18,22 @@ from squarelet.organizations.serializers import (
 )
 
 
-class OrganizationViewSet(viewsets.ModelViewSet):
-    queryset = Organization.objects.prefetch_related(
-        "subtypes__type", "users__memberships", "groups"
-    )
+class OrganizationViewSet(
+    BulkRetrieveMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet
+):
+    queryset = Organization.objects.prefetch_api()
     permission_classes = (ScopePermission | IsAdminUser,)
+    pagination_class = KeysetPagination
+    keyset_ordering = ("updated_at", "pk")
     read_scopes = ("read_organization",)
     write_scopes = ("write_organization",)
     lookup_field = "uuid"
     swagger_schema = None
     filterset_class = OrganizationFilter
+    version_model = "organization"
 
     def get_serializer_class(self):
-        if self.action == "retrieve":
+        if self.action in ("retrieve", "bulk"):
             return OrganizationDetailSerializer
 
         return OrganizationSerializer
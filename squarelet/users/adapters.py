@@ -2,6 +2,7 @@
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
 from django.http.response import HttpResponseRedirect
 from django.template.loader import render_to_string
 from django.urls import reverse
@@ -23,8 +24,48 @@ from squarelet.organizations.models import Invitation
 from squarelet.services.models import Service
 from squarelet.users.onboarding import OnboardingStepRegistry
 
-
 # pylint:disable=too-many-positional-arguments
+
+ALLOWED_HOSTS_KEY = "squarelet:redirect-allowed-hosts"
+# the set is dropped whenever a service or client changes - this only bounds
+# how long a set built from rows changing under it could last
+ALLOWED_HOSTS_TIMEOUT = 60 * 60
+
+
+def get_allowed_hosts():
+    """The hosts it is safe to redirect to, as a frozenset"""
+    hosts = cache.get(ALLOWED_HOSTS_KEY)
+    if hosts is None:
+        hosts = build_allowed_hosts()
+        cache.set(ALLOWED_HOSTS_KEY, hosts, timeout=ALLOWED_HOSTS_TIMEOUT)
+    return hosts
+
+
+def build_allowed_hosts():
+    urls = [
+        settings.SQUARELET_URL,
+        settings.MUCKROCK_URL,
+        settings.FOIAMACHINE_URL,
+        settings.DOCCLOUD_URL,
+        settings.PRESSPASS_URL,
+        settings.BIGLOCALNEWS_URL,
+        settings.BIGLOCALNEWS_API_URL,
+        settings.AGENDAWATCH_URL,
+    ]
+    # Include hosts from registered services
+    urls.extend(Service.objects.values_list("base_url", flat=True))
+    # Include hosts from OIDC client redirect URIs
+    for redirect_uris in Client.objects.values_list("_redirect_uris", flat=True):
+        urls.extend(uri.strip() for uri in redirect_uris.strip().splitlines())
+
+    return frozenset(filter(None, (furl(url).host for url in urls if url)))
+
+
+def clear_allowed_hosts():
+    """Rebuild the allowed hosts on their next use"""
+    cache.delete(ALLOWED_HOSTS_KEY)
+
+
 class AccountAdapter(DefaultAccountAdapter):
     """
     Custom account adapter for allauth
@@ -63,34 +104,7 @@ class AccountAdapter(DefaultAccountAdapter):
         )
 
     def is_safe_url(self, url):
-        allowed_hosts = [
-            furl(settings.SQUARELET_URL).host,
-            furl(settings.MUCKROCK_URL).host,
-            furl(settings.FOIAMACHINE_URL).host,
-            furl(settings.DOCCLOUD_URL).host,
-            furl(settings.PRESSPASS_URL).host,
-            furl(settings.BIGLOCALNEWS_URL).host,
-            furl(settings.BIGLOCALNEWS_API_URL).host,
-            furl(settings.AGENDAWATCH_URL).host,
-        ]
-
-        # Helper for extracting host from URL/URI
-        def append_host(uri):
-            host = furl(uri).host if uri else None
-            if host:
-                allowed_hosts.append(host)
-
-        # Include hosts from registered services
-        for base_url in Service.objects.values_list("base_url", flat=True):
-            append_host(base_url)
-
-        # Include hosts from OIDC client redirect URIs
-        for redirect_uris in Client.objects.values_list("_redirect_uris", flat=True):
-            for uri in redirect_uris.strip().splitlines():
-                uri = uri.strip()
-                append_host(uri)
-
-        return url_has_allowed_host_and_scheme(url, allowed_hosts=allowed_hosts)
+        return url_has_allowed_host_and_scheme(url, allowed_hosts=get_allowed_hosts())
 
     def send_confirmation_mail(self, request, emailconfirmation, signup):
         current_site = get_current_site(request)
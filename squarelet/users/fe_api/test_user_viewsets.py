@@ -1,5 +1,11 @@
 # test_viewsets.py
 
+# Django
+from django.core.management import call_command
+
+# Standard Library
+from io import StringIO
+
 # Third Party
 import pytest
 from rest_framework import status
@@ -136,3 +142,41 @@ def test_search_list_fields(client, user_with_org):
     assert "username" in results[0]
     assert "name" in results[0]
     assert "avatar_url" in results[0]
+
+
+@pytest.mark.django_db
+def test_search_users_after_rename(client, user_with_org):
+    """Saving a user's name updates the stored search vector"""
+    user, _ = user_with_org
+    other = User.objects.create_user(
+        username="renamed", email="renamed@example.com", password="password"
+    )
+    other.individual_organization.hidden = False
+    other.individual_organization.save()
+    other.name = "Nellie Bly"
+    other.save(update_fields=["name"])
+
+    client.force_authenticate(user=user)
+    response = client.get("/fe_api/users/?search=nel bl", format="json")
+    results = response.data["results"]
+    assert [r["username"] for r in results] == ["renamed"]
+
+
+@pytest.mark.django_db
+def test_rebuild_user_search(client, user_with_org):
+    """The rebuild command fills in search vectors changed without saving"""
+    user, _ = user_with_org
+    other = User.objects.create_user(
+        username="bypassed", email="bypassed@example.com", password="password"
+    )
+    other.individual_organization.hidden = False
+    other.individual_organization.save()
+    User.objects.filter(pk=other.pk).update(name="Ida Tarbell", search_vector=None)
+
+    client.force_authenticate(user=user)
+    response = client.get("/fe_api/users/?search=tarbell", format="json")
+    assert response.data["results"] == []
+
+    call_command("rebuild_user_search", "--missing", stdout=StringIO())
+    response = client.get("/fe_api/users/?search=tarbell", format="json")
+    assert [r["username"] for r in response.data["results"]] == ["bypassed"]
@@ -1,5 +1,5 @@
 # Django
-from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.contrib.postgres.search import SearchQuery
 
 # Standard Library
 import re
@@ -34,10 +34,10 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
                 # Strip tsquery special characters so raw queries are safe.
                 sanitized = re.sub(r"[&|!<>():*@.\\\"]", " ", search).strip()
                 if sanitized:
-                    vector = SearchVector("username", "name")
                     terms = sanitized.split()
                     tsquery = " & ".join(f"{t}:*" for t in terms)
                     query = SearchQuery(tsquery, search_type="raw")
-                    qs = qs.annotate(search=vector).filter(search=query)
+                    # search_vector is stored and indexed, see User.save
+                    qs = qs.filter(search_vector=query)
             return qs
         return User.objects.prefetch_related("organizations")
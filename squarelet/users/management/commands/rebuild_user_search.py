@@ -0,0 +1,52 @@
+# Django
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand
+
+# Squarelet
+from squarelet.users.models import SEARCH_FIELDS, User
+
+
+class Command(BaseCommand):
+    """Recompute the stored full text search vector of every user
+
+    User.save keeps User.search_vector up to date, but users saved before it
+    existed, and changes which bypass save (queryset updates, raw SQL), are
+    not searchable until their vector is rebuilt.  Users are updated in
+    batches of primary keys, so each update is a short transaction.
+    """
+
+    help = "Rebuild the stored full text search vectors of users"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="How many users to update at a time",
+        )
+        parser.add_argument(
+            "--missing",
+            action="store_true",
+            help="Only rebuild users without a search vector",
+        )
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["missing"]:
+            users = users.filter(search_vector=None)
+
+        total = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                users.filter(pk__gt=last_pk).values_list("pk", flat=True)[
+                    : options["batch_size"]
+                ]
+            )
+            if not pks:
+                break
+            total += User.objects.filter(pk__in=pks).update(
+                search_vector=SearchVector(*SEARCH_FIELDS)
+            )
+            last_pk = pks[-1]
+        self.stdout.write(f"Rebuilt search vectors for {total} users")
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.12 on 2026-10-17 07:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0014_user_last_mfa_prompt"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["updated_at", "individual_organization"],
+                name="users_user_updated_at_idx",
+            ),
+        ),
+    ]
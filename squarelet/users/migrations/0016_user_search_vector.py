@@ -0,0 +1,40 @@
+# Generated by Django 5.2.12 on 2026-10-17 10:05
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def backfill_search_vector(apps, schema_editor):
+    """Index the users which existed before the field was added"""
+    User = apps.get_model("users", "User")
+    User.objects.update(
+        search_vector=django.contrib.postgres.search.SearchVector("username", "name")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0015_user_users_user_updated_at_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False,
+                help_text="The user's username and name for full text search - kept up to date on save, see User.save",
+                null=True,
+                verbose_name="search vector",
+            ),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="user",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="users_user_search_vector_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.12 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0016_user_search_vector"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                fields=["created_at", "id"], name="users_user_created_at_idx"
+            ),
+        ),
+    ]
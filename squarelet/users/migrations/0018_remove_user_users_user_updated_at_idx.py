@@ -0,0 +1,17 @@
+# Generated by Django 5.2.12 on 2026-10-17 14:30
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0017_user_users_user_created_at_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="user",
+            name="users_user_updated_at_idx",
+        ),
+    ]
@@ -1,6 +1,8 @@
 # Django
 from django.contrib.auth.base_user import AbstractBaseUser
 from django.contrib.auth.models import PermissionsMixin
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 from django.db import models, transaction
@@ -22,13 +24,16 @@ from sorl.thumbnail import ImageField
 from squarelet.core.fields import AutoCreatedField, AutoLastModifiedField
 from squarelet.core.mixins import AvatarMixin
 from squarelet.core.utils import file_path
-from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.oidc.utils import queue_cache_invalidations
 from squarelet.organizations.models import Invitation, Organization
 
 # Local
 from .managers import UserManager
 from .validators import UsernameValidator
 
+# the fields full text user search matches against, in search_vector
+SEARCH_FIELDS = ("username", "name")
+
 
 def user_file_path(instance, filename):
     return file_path("avatars", instance, filename)
@@ -111,6 +116,15 @@ class User(AvatarMixin, AbstractBaseUser, PermissionsMixin):
     bio = models.TextField(
         _("bio"), blank=True, help_text=_("Public bio for the user, in Markdown")
     )
+    search_vector = SearchVectorField(
+        _("search vector"),
+        null=True,
+        editable=False,
+        help_text=_(
+            "The user's username and name for full text search - kept up to "
+            "date on save, see User.save"
+        ),
+    )
     can_change_username = models.BooleanField(
         _("can change username"),
         default=True,
@@ -192,6 +206,12 @@ class User(AvatarMixin, AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         ordering = ("username",)
+        indexes = [
+            # the API lists users in (created_at, pk) order
+            models.Index(fields=["created_at", "id"], name="users_user_created_at_idx"),
+            # full text user search, see squarelet.users.fe_api.viewsets
+            GinIndex(fields=["search_vector"], name="users_user_search_vector_idx"),
+        ]
 
     def __str__(self):
         return self.username
@@ -211,9 +231,14 @@ class User(AvatarMixin, AbstractBaseUser, PermissionsMixin):
         return is_mfa_enabled(self)
 
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
         with transaction.atomic():
             super().save(*args, **kwargs)
-            transaction.on_commit(lambda: send_cache_invalidations("user", self.uuid))
+            if update_fields is None or set(SEARCH_FIELDS) & set(update_fields):
+                User.objects.filter(pk=self.pk).update(
+                    search_vector=SearchVector(*SEARCH_FIELDS)
+                )
+            queue_cache_invalidations("user", self.uuid)
 
     def get_absolute_url(self):
         return reverse("users:detail", kwargs={"username": self.username})
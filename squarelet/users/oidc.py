@@ -1,15 +1,45 @@
 # Django
+from django.core.cache import cache
 from django.core.exceptions import MultipleObjectsReturned, ObjectDoesNotExist
+from django.db.models import Prefetch
 from django.utils.translation import gettext_lazy as _
 
 # Third Party
 from oidc_provider.lib.claims import ScopeClaims
 
 # Squarelet
+from squarelet.oidc.versions import get_version
+from squarelet.organizations.models import Organization
 from squarelet.organizations.serializers import MembershipSerializer
 
+# claims documents are keyed by the user's version, which every cache
+# invalidation naming the user or one of their organizations bumps, so a stale
+# document is never read - the timeout only bounds how long it lingers unread
+CLAIMS_TIMEOUT = 60 * 60 * 24
+
+
+def claims_key(user, part, client=None):
+    """The cache key for one part of the user's claims, as seen by `client`"""
+    version = get_version("user", user.uuid)
+    client_pk = client.pk if client is not None else ""
+    return (
+        f"squarelet:claims:{part}:{user.uuid}:{client_pk}:"
+        f"{user.updated_at.timestamp()}:{version}"
+    )
+
 
 def userinfo(claims, user):
+    key = claims_key(user, "userinfo")
+    info = cache.get(key)
+    if info is None:
+        info = build_userinfo(user)
+        cache.set(key, info, timeout=CLAIMS_TIMEOUT)
+    claims.update(info)
+    return claims
+
+
+def build_userinfo(user):
+    claims = {}
     claims["name"] = user.name
     claims["preferred_username"] = user.username
     claims["updated_at"] = user.updated_at
@@ -43,12 +73,17 @@ class CustomScopeClaims(ScopeClaims):
 
     def scope_organizations(self):
         """Populate the scope with the organizations"""
-        return {
-            "organizations": [
-                MembershipSerializer(m, context={"client": self.client}).data
-                for m in self.user.memberships.all()
-            ]
-        }
+        key = claims_key(self.user, "organizations", self.client)
+        organizations = cache.get(key)
+        if organizations is None:
+            memberships = self.user.memberships.prefetch_related(
+                Prefetch("organization", queryset=Organization.objects.prefetch_api())
+            )
+            organizations = MembershipSerializer(
+                memberships, many=True, context={"client": self.client}
+            ).data
+            cache.set(key, organizations, timeout=CLAIMS_TIMEOUT)
+        return {"organizations": organizations}
 
     def scope_preferences(self):
         """Populate the scope with user preferences"""
@@ -1,5 +1,6 @@
 # Django
 from django.db import transaction
+from django.db.models import signals as model_signals
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 
@@ -7,11 +8,14 @@ from django.utils.translation import gettext_lazy as _
 from actstream import registry
 from allauth.account import signals
 from hijack.signals import hijack_ended, hijack_started
+from oidc_provider.models import Client
 
 # Squarelet
 from squarelet.core.mail import send_mail
 from squarelet.core.utils import new_action
 from squarelet.oidc.middleware import send_cache_invalidations
+from squarelet.services.models import Service
+from squarelet.users.adapters import clear_allowed_hosts
 from squarelet.users.models import User
 
 registry.register(User)
@@ -35,6 +39,23 @@ def on_hijack_ended(hijacker, hijacked, request, **kwargs):
     )
 
 
+@receiver(
+    [model_signals.post_save, model_signals.post_delete],
+    sender=Service,
+    dispatch_uid="squarelet.users.signals.service_hosts_changed",
+)
+@receiver(
+    [model_signals.post_save, model_signals.post_delete],
+    sender=Client,
+    dispatch_uid="squarelet.users.signals.client_hosts_changed",
+)
+def allowed_hosts_changed(sender, **kwargs):
+    """A service or client changed, so the redirect hosts may have too"""
+    # pylint: disable=unused-argument
+    clear_allowed_hosts()
+    transaction.on_commit(clear_allowed_hosts)
+
+
 def user_logged_in(request, user, **kwargs):
     """The user has logged in"""
     # perform onboarding checks
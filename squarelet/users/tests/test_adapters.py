@@ -1,4 +1,5 @@
 # Django
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.messages.middleware import MessageMiddleware
 from django.contrib.sessions.middleware import SessionMiddleware
@@ -12,6 +13,8 @@ from datetime import timedelta
 from allauth.account.models import EmailAddress
 
 # Squarelet
+from squarelet.oidc.tests.factories import ClientFactory
+from squarelet.services.models import Service
 from squarelet.users.adapters import AccountAdapter
 
 
@@ -146,3 +149,36 @@ class AdapterRedirectTests(TestCase):
         # Depending on your adapter logic, it might redirect directly or store it
         if "next_url" in request.session:
             self.assertEqual(request.session["next_url"], "/special-page/")
+
+
+class AllowedHostsTests(TestCase):
+    def setUp(self):
+        self.adapter = AccountAdapter()
+
+    def test_settings_hosts_allowed(self):
+        self.assertTrue(self.adapter.is_safe_url(f"{settings.MUCKROCK_URL}/accounts/"))
+        self.assertFalse(self.adapter.is_safe_url("https://evil.example.com/"))
+
+    def test_hosts_cached(self):
+        self.adapter.is_safe_url("https://evil.example.com/")
+        with self.assertNumQueries(0):
+            self.adapter.is_safe_url("https://evil.example.com/")
+
+    def test_service_change_rebuilds(self):
+        self.assertFalse(self.adapter.is_safe_url("https://service.example.com/"))
+
+        # not through ServiceFactory, whose sequence other tests rely on
+        Service.objects.create(
+            slug="service", name="Service", base_url="https://service.example.com"
+        )
+
+        self.assertTrue(self.adapter.is_safe_url("https://service.example.com/"))
+
+    def test_client_change_rebuilds(self):
+        client = ClientFactory()
+        self.assertFalse(self.adapter.is_safe_url("https://client.example.com/a"))
+
+        client.redirect_uris = ["https://client.example.com/callback"]
+        client.save()
+
+        self.assertTrue(self.adapter.is_safe_url("https://client.example.com/a"))
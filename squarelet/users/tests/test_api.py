@@ -1,9 +1,12 @@
 # Standard Library
 # Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 # Standard Library
 import json
+import time
 from datetime import timedelta
 from unittest.mock import Mock
 
@@ -16,7 +19,16 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 # Squarelet
+from squarelet.core.mixins import BULK_RETRIEVE_MAX
+from squarelet.core.pagination import KeysetPagination
+from squarelet.oidc.models import CacheInvalidation
 from squarelet.oidc.tests.factories import ClientFactory
+from squarelet.oidc.utils import (
+    drain_cache_invalidation_outbox,
+    queue_cache_invalidations,
+    send_cache_invalidations,
+)
+from squarelet.oidc.versions import bump_dependent_versions, bump_versions
 
 
 @pytest.mark.django_db()
@@ -237,3 +249,340 @@ class TestOIDCTokenExchangeView:
         )
         assert response.status_code == status.HTTP_403_FORBIDDEN
         assert response.json() == {"error": "first party clients only"}
+
+
+@pytest.mark.django_db()
+class TestChangeAPI:
+    """Test the cursor-based change feed"""
+
+    @pytest.fixture(autouse=True)
+    def no_broadcasts(self, mocker):
+        mocker.patch("squarelet.oidc.utils.dispatch_cache_invalidations")
+        mocker.patch("squarelet.oidc.tasks.drain_cache_invalidation_outbox.apply_async")
+        mocker.patch("squarelet.oidc.tasks.flush_cache_invalidations.apply_async")
+        mocker.patch("squarelet.oidc.tasks.bump_dependent_versions.delay")
+
+    @staticmethod
+    def change(model, *uuids):
+        """Commit an invalidation of these objects and drain it into the feed"""
+        # leave out the invalidations the factories queued
+        CacheInvalidation.objects.filter(sequence=None).delete()
+        queue_cache_invalidations(model, list(uuids))
+        drain_cache_invalidation_outbox()
+
+    def _get(self, token, **params):
+        api_client = APIClient()
+        api_client.force_authenticate(token=token)
+        return api_client.get("/api/changes/", params)
+
+    def test_lists_changes_in_order(self, user_factory, organization_factory):
+        client = ClientFactory(require_consent=False)
+        token = create_token(
+            user=None, client=client, scope=["read_user", "read_organization"]
+        )
+        organization = organization_factory()
+        user = user_factory()
+        self.change("user", user.uuid)
+        self.change("organization", organization.uuid)
+
+        response = self._get(token)
+
+        assert response.status_code == status.HTTP_200_OK
+        results = [(r["model"], r["uuid"]) for r in response.json()["results"]]
+        assert results == [
+            ("user", str(user.uuid)),
+            ("organization", str(organization.uuid)),
+        ]
+
+    def test_pages_by_cursor(self, user_factory):
+        client = ClientFactory(require_consent=False)
+        token = create_token(user=None, client=client, scope=["read_user"])
+        users = user_factory.create_batch(3)
+        self.change("user", *(u.uuid for u in users))
+
+        first = self._get(token, models="user", limit=2).json()
+        second = self._get(token, models="user", limit=2, cursor=first["cursor"])
+
+        assert first["has_more"] is True
+        assert [r["uuid"] for r in first["results"]] == [str(u.uuid) for u in users[:2]]
+        assert second.json()["has_more"] is False
+        assert [r["uuid"] for r in second.json()["results"]] == [str(users[2].uuid)]
+
+    def test_late_commit_is_listed_after_the_cursor(self, user_factory):
+        """A change which commits long after it was made is not skipped"""
+        client = ClientFactory(require_consent=False)
+        token = create_token(user=None, client=client, scope=["read_user"])
+        early, late = user_factory.create_batch(2)
+        self.change("user", early.uuid)
+        cursor = self._get(token, models="user").json()["cursor"]
+
+        # written an hour ago by a transaction which has only now committed
+        CacheInvalidation.objects.create(
+            model="user",
+            uuid=late.uuid,
+            created_at=timezone.now() - timedelta(hours=1),
+        )
+        drain_cache_invalidation_outbox()
+
+        response = self._get(token, models="user", cursor=cursor)
+        assert [r["uuid"] for r in response.json()["results"]] == [str(late.uuid)]
+
+    def test_undrained_changes_wait(self, user_factory):
+        client = ClientFactory(require_consent=False)
+        token = create_token(user=None, client=client, scope=["read_user"])
+        queue_cache_invalidations("user", user_factory().uuid)
+
+        response = self._get(token, models="user")
+
+        assert response.json()["results"] == []
+
+    def test_changes_sent_without_the_outbox(self, organization_factory):
+        """Changes made by queryset updates, such as merges, are listed"""
+        client = ClientFactory(require_consent=False)
+        token = create_token(user=None, client=client, scope=["read_organization"])
+        organization = organization_factory()
+        CacheInvalidation.objects.all().delete()
+
+        send_cache_invalidations("organization", [organization.uuid])
+        drain_cache_invalidation_outbox()
+
+        response = self._get(token, models="organization")
+        assert [r["uuid"] for r in response.json()["results"]] == [
+            str(organization.uuid)
+        ]
+
+    def test_consent_filtered(self, user_factory, client):
+        token = create_token(user=None, client=client, scope=["read_user"])
+        consented, other = user_factory.create_batch(2)
+        UserConsent.objects.create(
+            user=consented,
+            client=client,
+            expires_at=timezone.now() + timedelta(days=1),
+            date_given=timezone.now(),
+        )
+        self.change("user", consented.uuid, other.uuid)
+
+        response = self._get(token, models="user")
+
+        assert [r["uuid"] for r in response.json()["results"]] == [str(consented.uuid)]
+
+    def test_requires_model_scope(self, client):
+        token = create_token(user=None, client=client, scope=["read_user"])
+
+        assert (
+            self._get(token, models="organization").status_code
+            == status.HTTP_403_FORBIDDEN
+        )
+        assert self._get(token).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_expired_cursor(self, user_factory):
+        """A client whose cursor is older than every entry kept must resync"""
+        client = ClientFactory(require_consent=False)
+        token = create_token(user=None, client=client, scope=["read_user"])
+        first, second, third = user_factory.create_batch(3)
+        self.change("user", first.uuid)
+        cursor = self._get(token, models="user").json()["cursor"]
+        self.change("user", second.uuid)
+        self.change("user", third.uuid)
+        assert self._get(token, models="user", cursor=cursor).status_code == (
+            status.HTTP_200_OK
+        )
+
+        # the entries up to the third change are pruned
+        CacheInvalidation.objects.exclude(uuid=third.uuid).delete()
+
+        response = self._get(token, models="user", cursor=cursor)
+        assert response.status_code == status.HTTP_410_GONE
+        assert response.json()["resync_required"] is True
+
+    def test_invalid_cursor(self, client):
+        token = create_token(user=None, client=client, scope=["read_user"])
+
+        response = self._get(token, models="user", cursor="not-a-cursor")
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db()
+class TestConditionalRetrieve:
+    """Test ETag and Last-Modified on the user retrieve"""
+
+    @pytest.fixture(autouse=True)
+    def stripe_customer(self, mocker):
+        mocker.patch(
+            "squarelet.organizations.models.Customer.stripe_customer",
+            default_source=None,
+            invoice_settings=Mock(default_payment_method=None),
+        )
+
+    def _get(self, client, user, **headers):
+        token = create_token(user=None, client=client, scope=["read_user"])
+        api_client = APIClient()
+        api_client.force_authenticate(token=token)
+        return api_client.get(
+            f"/api/users/{user.individual_organization_id}/", headers=headers
+        )
+
+    def test_not_modified(self, user_factory):
+        client = ClientFactory(require_consent=False)
+        user = user_factory()
+
+        response = self._get(client, user)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Last-Modified"]
+
+        response = self._get(client, user, If_None_Match=response["ETag"])
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert not response.content
+
+    def test_modified_by_invalidation(self, user_factory, organization_factory):
+        """Changing an organization the user belongs to changes the user's ETag"""
+        client = ClientFactory(require_consent=False)
+        user = user_factory()
+        organization = organization_factory(users=[user])
+        etag = self._get(client, user)["ETag"]
+
+        bump_dependent_versions("organization", [organization.uuid])
+
+        response = self._get(client, user, If_None_Match=etag)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["ETag"] != etag
+
+    def test_modified_within_the_same_second(self, user_factory):
+        """A change in the same second as the Last-Modified date is not hidden
+        from a client which only sends If-Modified-Since"""
+        client = ClientFactory(require_consent=False)
+        user = user_factory()
+        last_modified = self._get(client, user)["Last-Modified"]
+
+        bump_versions("user", [user.uuid])
+
+        response = self._get(client, user, If_Modified_Since=last_modified)
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_not_modified_since(self, mocker, user_factory):
+        """Once the second of the last change is over, Last-Modified is rounded
+        up and answers If-Modified-Since with a 304"""
+        client = ClientFactory(require_consent=False)
+        user = user_factory()
+        mocker.patch("squarelet.core.mixins.time").time.return_value = time.time() + 2
+        last_modified = self._get(client, user)["Last-Modified"]
+
+        response = self._get(client, user, If_Modified_Since=last_modified)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_etag_per_client(self, user_factory):
+        user = user_factory()
+
+        first = self._get(ClientFactory(require_consent=False), user)
+        second = self._get(ClientFactory(require_consent=False), user)
+
+        assert first["ETag"] != second["ETag"]
+
+    def test_missing(self, client):
+        token = create_token(user=None, client=client, scope=["read_user"])
+        api_client = APIClient()
+        api_client.force_authenticate(token=token)
+
+        response = api_client.get("/api/users/not-a-uuid/")
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db()
+class TestBulkRetrieve:
+    """Test retrieving many users by UUID in one request"""
+
+    def _post(self, data, token=None, user=None):
+        api_client = APIClient()
+        api_client.force_authenticate(token=token, user=user)
+        return api_client.post("/api/users/bulk/", data, format="json")
+
+    def test_consent_filtered(self, user_factory, client):
+        consented, other = user_factory.create_batch(2)
+        UserConsent.objects.create(
+            user=consented,
+            client=client,
+            expires_at=timezone.now() + timedelta(days=1),
+            date_given=timezone.now(),
+        )
+        token = create_token(user=None, client=client, scope=["read_user"])
+
+        response = self._post({"uuids": [str(other.uuid), str(consented.uuid)]}, token)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [r["uuid"] for r in response.json()["results"]] == [str(consented.uuid)]
+        assert response.json()["missing"] == [str(other.uuid)]
+
+    def test_requires_read_scope(self, user_factory, client):
+        token = create_token(user=None, client=client, scope=["write_user"])
+
+        response = self._post({"uuids": [str(user_factory().uuid)]}, token)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_invalid_uuids(self, user_factory, client):
+        token = create_token(user=None, client=client, scope=["read_user"])
+        uuid = str(user_factory().uuid)
+
+        assert self._post({"uuids": ["nope"]}, token).status_code == 400
+        assert self._post({"uuids": []}, token).status_code == 400
+        assert (
+            self._post({"uuids": [uuid] * (BULK_RETRIEVE_MAX + 1)}, token).status_code
+            == 400
+        )
+
+    def test_query_count_is_constant(
+        self, user_factory, organization_factory, django_assert_num_queries
+    ):
+        staff = user_factory(is_staff=True)
+        parent = organization_factory()
+
+        def create_users(count):
+            users = user_factory.create_batch(count)
+            for user in users:
+                organization_factory(admins=[user], parent=parent)
+            return [str(user.uuid) for user in users]
+
+        few, many = create_users(2), create_users(6)
+        with CaptureQueriesContext(connection) as context:
+            self._post({"uuids": few}, user=staff)
+
+        with django_assert_num_queries(len(context)):
+            response = self._post({"uuids": many}, user=staff)
+        assert [r["uuid"] for r in response.json()["results"]] == many
+
+
+@pytest.mark.django_db()
+class TestKeysetPagination:
+    """Test paging through the user list by cursor"""
+
+    def _get(self, user, url="/api/users/", **params):
+        api_client = APIClient()
+        api_client.force_authenticate(user=user)
+        return api_client.get(url, params)
+
+    def test_walks_every_user_in_order(self, user_factory, mocker):
+        mocker.patch.object(KeysetPagination, "page_size", 2)
+        staff = user_factory(is_staff=True)
+        users = [staff] + user_factory.create_batch(4)
+
+        uuids = []
+        response = self._get(staff, cursor="").json()
+        uuids += [r["uuid"] for r in response["results"]]
+        while response["next"]:
+            response = self._get(staff, response["next"]).json()
+            uuids += [r["uuid"] for r in response["results"]]
+
+        assert uuids == [str(user.uuid) for user in users]
+        assert "count" not in response
+
+    def test_page_number_by_default(self, user_factory):
+        staff = user_factory(is_staff=True)
+        user_factory.create_batch(2)
+
+        response = self._get(staff).json()
+
+        assert response["count"] == 3
+        assert len(response["results"]) == 3
+        assert self._get(staff, page=1).json() == response
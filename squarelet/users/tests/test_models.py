@@ -6,6 +6,7 @@ import pytest
 from allauth.mfa.models import Authenticator
 
 # Squarelet
+from squarelet.oidc.models import CacheInvalidation
 from squarelet.organizations.tests.factories import (
     EmailDomainFactory,
     OrganizationFactory,
@@ -19,11 +20,18 @@ def test_str(user_factory):
 
 @pytest.mark.django_db(transaction=True)
 def test_save(user_factory, mocker):
-    mocked = mocker.patch("squarelet.users.models.send_cache_invalidations")
+    mocked = mocker.patch("squarelet.users.models.queue_cache_invalidations")
     user = user_factory()
     mocked.assert_called_with("user", user.uuid)
 
 
+@pytest.mark.django_db()
+def test_save_writes_outbox(user_factory):
+    """The invalidation is recorded inside the save's transaction"""
+    user = user_factory()
+    assert CacheInvalidation.objects.filter(model="user", uuid=user.uuid).exists()
+
+
 def test_get_absolute_url(user_factory):
     user = user_factory.build()
     assert user.get_absolute_url() == f"/users/{user.username}/"
@@ -5,6 +5,7 @@ from unittest.mock import MagicMock, Mock
 import pytest
 
 # Squarelet
+from squarelet.oidc.versions import bump_dependent_versions, bump_versions
 from squarelet.organizations.serializers import MembershipSerializer
 
 # Local
@@ -56,3 +57,48 @@ def test_scope_preferences(user_factory):
     claims = oidc.CustomScopeClaims(token)
     info = claims.scope_preferences()
     assert info["use_autologin"] == user.use_autologin
+
+
+@pytest.mark.django_db()
+def test_userinfo_cached(user_factory, django_assert_num_queries):
+    user = user_factory()
+    oidc.userinfo({}, user)
+
+    with django_assert_num_queries(0):
+        claims = oidc.userinfo({}, user)
+    assert claims["email"] == user.email
+
+
+@pytest.mark.django_db()
+def test_userinfo_rebuilt_on_invalidation(user_factory):
+    user = user_factory(bio="Old")
+    oidc.userinfo({}, user)
+    type(user).objects.filter(pk=user.pk).update(bio="New")
+    user.bio = "New"
+
+    assert oidc.userinfo({}, user)["bio"] == "Old"
+    bump_versions("user", [user.uuid])
+    assert oidc.userinfo({}, user)["bio"] == "New"
+
+
+@pytest.mark.django_db()
+def test_scope_organizations_cached(
+    user_factory, organization_factory, mocker, django_assert_num_queries
+):
+    mocker.patch(
+        "squarelet.organizations.models.Customer.stripe_customer",
+        default_source=None,
+        invoice_settings=Mock(default_payment_method=None),
+    )
+    user = user_factory()
+    organization = organization_factory(users=[user], name="Old")
+    claims = oidc.CustomScopeClaims(MagicMock(user=user, client=None))
+    claims.scope_organizations()
+
+    with django_assert_num_queries(0):
+        claims.scope_organizations()
+
+    type(organization).objects.filter(pk=organization.pk).update(name="New")
+    bump_dependent_versions("organization", [organization.uuid])
+    names = {o["name"] for o in claims.scope_organizations()["organizations"]}
+    assert "New" in names
@@ -1,5 +1,6 @@
 # Django
 from django.core.exceptions import ValidationError
+from django.db.models import Exists, Min, OuterRef, Q
 from django.db.models.query import Prefetch
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404
@@ -7,12 +8,17 @@ from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+# Standard Library
+import base64
+import binascii
+import json
+
 # Third Party
 import sesame.utils
 from allauth.account.models import EmailAddress, EmailConfirmationHMAC
 from allauth.account.utils import setup_user_email
-from oidc_provider.models import Token
-from rest_framework import status, viewsets
+from oidc_provider.models import UserConsent
+from rest_framework import serializers, status, viewsets
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -20,29 +26,40 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 # Squarelet
 from squarelet.core.mail import send_mail
+from squarelet.core.mixins import BulkRetrieveMixin, ConditionalRetrieveMixin
+from squarelet.core.pagination import KeysetPagination
+from squarelet.oidc.models import CacheInvalidation
 from squarelet.oidc.permissions import ScopePermission
-from squarelet.organizations.models import Membership
+from squarelet.oidc.tokens import resolve_access_token
+from squarelet.organizations.models import Membership, Organization
 from squarelet.users.models import User
 from squarelet.users.serializers import UserReadSerializer, UserWriteSerializer
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(BulkRetrieveMixin, ConditionalRetrieveMixin, viewsets.ModelViewSet):
     queryset = User.objects.prefetch_related(
         Prefetch(
-            "memberships", queryset=Membership.objects.select_related("organization")
+            "memberships",
+            queryset=Membership.objects.prefetch_related(
+                Prefetch("organization", queryset=Organization.objects.prefetch_api())
+            ),
         ),
         Prefetch(
             "emailaddress_set",
             queryset=EmailAddress.objects.filter(primary=True),
             to_attr="primary_emails",
         ),
+        "socialaccount_set__socialtoken_set",
     ).order_by("created_at")
     permission_classes = (ScopePermission | IsAdminUser,)
+    pagination_class = KeysetPagination
+    keyset_ordering = ("created_at", "pk")
     read_scopes = ("read_user",)
     write_scopes = ("write_user",)
     lookup_field = "individual_organization_id"
     lookup_url_kwarg = "uuid"
     swagger_schema = None
+    version_model = "user"
 
     def get_serializer_class(self):
         # The only actions expected are create and retrieve
@@ -86,6 +103,156 @@ class UserViewSet(viewsets.ModelViewSet):
         )
 
 
+CHANGE_FEED_PAGE_SIZE = 100
+CHANGE_FEED_MAX_PAGE_SIZE = 1000
+
+
+def encode_change_cursor(sequence):
+    data = json.dumps([sequence])
+    return base64.urlsafe_b64encode(data.encode("utf8")).decode("ascii")
+
+
+def decode_change_cursor(cursor):
+    """Return the change feed position a cursor points at"""
+    try:
+        (sequence,) = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, TypeError, ValueError):
+        sequence = None
+    if not isinstance(sequence, int):
+        raise serializers.ValidationError({"cursor": _("Invalid cursor")})
+    return sequence
+
+
+class ChangeViewSet(viewsets.ViewSet):
+    """Users and organizations in the order their changes committed
+
+    Each page lists (model, uuid, changed_at) for every change after the given
+    cursor, and the cursor to read the next page from. A client which was down
+    can catch up by reading pages until `has_more` is false, rather than
+    refetching every object.
+
+    The feed is the cache invalidation outbox, in the order entries were given
+    their positions, which is their commit order - see assign_feed_sequence.
+    An object is listed once for each invalidation of it. Entries are only kept
+    for CACHE_INVALIDATION_OUTBOX_RETENTION_DAYS, so a client whose cursor is
+    older than every entry kept is answered 410 Gone, and must refetch
+    everything and start over without a cursor.
+    """
+
+    permission_classes = (ScopePermission | IsAdminUser,)
+    swagger_schema = None
+    change_models = ("organization", "user")
+
+    @property
+    def read_scopes(self):
+        """Reading a model's changes requires that model's read scope"""
+        return tuple(f"read_{model}" for model in self.get_change_models())
+
+    def get_change_models(self):
+        models = self.request.query_params.get("models")
+        if not models:
+            return self.change_models
+        models = tuple(sorted(set(models.split(","))))
+        if not set(models) <= set(self.change_models):
+            raise serializers.ValidationError(
+                {"models": _("Must be one or more of: user, organization")}
+            )
+        return models
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.query_params.get("limit", CHANGE_FEED_PAGE_SIZE))
+        except ValueError:
+            limit = CHANGE_FEED_PAGE_SIZE
+        return max(1, min(limit, CHANGE_FEED_MAX_PAGE_SIZE))
+
+    def get_consent_client(self):
+        if self.request.auth:
+            client = self.request.auth.client
+            if client and client.require_consent:
+                return client
+        return None
+
+    def get_changes(self, cursor, limit):
+        """The first `limit` changes after `cursor`, as
+        (sequence, model, uuid, changed_at) tuples in feed order"""
+        entries = CacheInvalidation.objects.filter(
+            sequence__isnull=False, model__in=self.get_change_models()
+        )
+        if cursor is not None:
+            entries = entries.filter(sequence__gt=cursor)
+        client = self.get_consent_client()
+        if client:
+            consents = UserConsent.objects.filter(
+                client=client, expires_at__gt=timezone.now()
+            )
+            entries = entries.filter(
+                (
+                    Q(model="user")
+                    & Exists(
+                        consents.filter(
+                            user__individual_organization_id=OuterRef("uuid")
+                        )
+                    )
+                )
+                | (
+                    Q(model="organization")
+                    & Exists(
+                        consents.filter(user__organizations__uuid=OuterRef("uuid"))
+                    )
+                )
+            )
+        return list(
+            entries.order_by("sequence").values_list(
+                "sequence", "model", "uuid", "created_at"
+            )[:limit]
+        )
+
+    @staticmethod
+    def is_expired(cursor):
+        """Whether changes after `cursor` may have been pruned from the feed
+
+        Positions can skip numbers, so a cursor just before the oldest entry kept
+        may be reported expired when nothing after it was pruned - the client
+        refetches more than it needed to, but never misses a change.
+        """
+        oldest = CacheInvalidation.objects.aggregate(oldest=Min("sequence"))["oldest"]
+        return oldest is None or cursor < oldest - 1
+
+    def list(self, request):
+        cursor_param = request.query_params.get("cursor")
+        cursor = decode_change_cursor(cursor_param) if cursor_param else None
+        if cursor is not None and self.is_expired(cursor):
+            return Response(
+                {
+                    "detail": _(
+                        "Changes after this cursor are no longer kept - refetch "
+                        "everything and read the feed again without a cursor"
+                    ),
+                    "resync_required": True,
+                },
+                status=status.HTTP_410_GONE,
+            )
+        limit = self.get_limit()
+
+        changes = self.get_changes(cursor, limit + 1)
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if changes:
+            cursor_param = encode_change_cursor(changes[-1][0])
+
+        return Response(
+            {
+                "results": [
+                    {"model": model, "uuid": str(uuid), "changed_at": changed_at}
+                    for _sequence, model, uuid, changed_at in changes
+                ],
+                "cursor": cursor_param,
+                "has_more": has_more,
+            }
+        )
+
+
 class UrlAuthTokenViewSet(viewsets.ViewSet):
     permission_classes = (ScopePermission,)
     read_scopes = ("read_auth_token",)
@@ -124,9 +291,8 @@ class OIDCTokenExchangeView(APIView):
         oidc_token = request.data.get("oidc_token")
         # Validate against django-oidc-provider's token model
 
-        try:
-            token = Token.objects.select_related("client").get(access_token=oidc_token)
-        except Token.DoesNotExist:
+        token = resolve_access_token(oidc_token) if oidc_token else None
+        if token is None:
             return Response({"error": "invalid token"}, status=400)
 
         if token.has_expired():